@@ -20,6 +20,55 @@ READ_TIMEOUT = 30
 WRITE_TIMEOUT = 30
 POOL_TIMEOUT = 30
 
+# Сервер webhook на Railway: 'flask' (Flask в потоке + event loop апдейтов)
+# или 'async' (tornado в одном event loop с Application, без потоков)
+WEBHOOK_SERVER = os.getenv('WEBHOOK_SERVER', 'flask')
+
+# Очередь приема апдейтов: не больше UPDATE_QUEUE_SIZE ожидающих (сверх -
+# ответ 503, Telegram повторит позже) и UPDATE_WORKERS обрабатываемых сразу
+UPDATE_QUEUE_SIZE = int(os.getenv('UPDATE_QUEUE_SIZE', '1000'))
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '32'))
+
+# Повторы апдейтов Telegram отбрасываются по последним UPDATE_DEDUP_SIZE update_id;
+# UPDATE_DEDUP_DB_FILE - общий файл SQLite, если воркеров несколько (пусто - только память)
+UPDATE_DEDUP_SIZE = int(os.getenv('UPDATE_DEDUP_SIZE', '10000'))
+UPDATE_DEDUP_DB_FILE = os.getenv('UPDATE_DEDUP_DB_FILE', '')
+
+# Хранилище реакций и статистики: 'json' (файлы), 'sqlite' или 'sharded'
+# (реакции в REACTION_SHARDS файлах SQLite - для нескольких процессов-воркеров)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json')
+SQLITE_DB_FILE = os.getenv('SQLITE_DB_FILE', 'bot_data.sqlite3')
+REACTION_SHARDS = int(os.getenv('REACTION_SHARDS', '8'))
+
+# Групповая запись: сброс на диск не реже чем раз в FLUSH_INTERVAL_MS
+# или каждые FLUSH_MAX_MUTATIONS изменений (0 - писать каждое изменение сразу)
+FLUSH_INTERVAL_MS = int(os.getenv('FLUSH_INTERVAL_MS', '1000'))
+FLUSH_MAX_MUTATIONS = int(os.getenv('FLUSH_MAX_MUTATIONS', '200'))
+
+# Компактное хранение реакций в памяти (колонки array вместо вложенных dict)
+REACTIONS_COMPACT_MEMORY = os.getenv('REACTIONS_COMPACT_MEMORY', 'false').lower() in ('1', 'true', 'yes')
+
+# Формат файла статистики для STORAGE_BACKEND=json: 'json' (bot_stats.json)
+# или 'binary' (bot_stats.bin, ленивая загрузка пользователей)
+STATS_FORMAT = os.getenv('STATS_FORMAT', 'json')
+
+# Несколько процессов бота: у каждого свой STATS_WORKER_ID, статистика пишется
+# в свой файл (bot_stats.worker-<id>.json) и объединяется при чтении в /stats
+STATS_WORKER_ID = os.getenv('STATS_WORKER_ID', '')
+
+# Уникальные пользователи по дням/командам/категориям - скетчи HyperLogLog
+# с 2**HLL_PRECISION регистрами; STATS_EXACT_UNIQUES=true дополнительно
+# хранит точные множества user_id (отладка, память растет с аудиторией)
+HLL_PRECISION = int(os.getenv('HLL_PRECISION', '11'))
+STATS_EXACT_UNIQUES = os.getenv('STATS_EXACT_UNIQUES', 'false').lower() in ('1', 'true', 'yes')
+
+# Хранение дневной статистики: дни старше STATS_RETENTION_DAYS переносятся
+# в сжатые помесячные файлы STATS_ARCHIVE_DIR раз в STATS_ARCHIVE_INTERVAL_HOURS
+# (0 - только вручную через /cleanup)
+STATS_RETENTION_DAYS = int(os.getenv('STATS_RETENTION_DAYS', '90'))
+STATS_ARCHIVE_DIR = os.getenv('STATS_ARCHIVE_DIR', 'stats_archive')
+STATS_ARCHIVE_INTERVAL_HOURS = float(os.getenv('STATS_ARCHIVE_INTERVAL_HOURS', '24'))
+
 # Знаки зодиака с эмодзи
 ZODIAC_SIGNS = [
     ("Овен", "♈"), ("Телец", "♉"), ("Близнецы", "♊"), ("Рак", "♋"),
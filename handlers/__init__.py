@@ -25,6 +25,7 @@ __all__ = [
     # Статистика
     'stats_command',
     'users_command',
+    'retention_command',
     'update_stats',
     
     # Пользовательские команды
@@ -45,4 +46,6 @@ __all__ = [
     'restart_command',
     'broadcast_command',
     'cleanup_command',
+    'top_command',
+    'latency_command',
 ]
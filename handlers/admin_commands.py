@@ -2,13 +2,21 @@
 import logging
 import os
 import subprocess
-from datetime import datetime, timedelta
+from datetime import datetime
 from telegram import Update
 from telegram.ext import ContextTypes
 from config import ADMIN_ID
 
 logger = logging.getLogger(__name__)
 
+def _format_bytes(size):
+    """Размер в байтах для отчета: Б / КБ / МБ"""
+    if size < 1024:
+        return f"{size} Б"
+    if size < 1024 * 1024:
+        return f"{size / 1024:.1f} КБ"
+    return f"{size / 1024 / 1024:.1f} МБ"
+
 async def logs_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Команда /logs - последние логи (только для админа)"""
     try:
@@ -146,8 +154,9 @@ async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         
         # Получаем список пользователей из статистики
         try:
-            from handlers.stats import bot_stats
-            users = list(bot_stats.stats["users"].keys())
+            from handlers.stats import report_stats
+            report = await report_stats()
+            users = list(report.stats["users"].keys())
             total_users = len(users)
         except Exception:
             total_users = 0
@@ -224,32 +233,33 @@ async def cleanup_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         except Exception:
             pass
         
-        # Очистка старой статистики (старше 30 дней)
+        # Перенос старой дневной статистики в помесячный архив
+        archive = None
         try:
             from handlers.stats import bot_stats
-            cutoff_date = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-            
-            old_entries = 0
-            for date in list(bot_stats.stats["daily_stats"].keys()):
-                if date < cutoff_date:
-                    # del bot_stats.stats["daily_stats"][date]  # Закомментировано
-                    old_entries += 1
-            
-            cleanup_stats["old_stats"] = old_entries
-            
-            if old_entries > 0:
-                bot_stats.save_stats()
-                
-        except Exception:
-            pass
+            archive = await bot_stats.writer.run(bot_stats.archive_old_days)
+            cleanup_stats["old_stats"] = archive["days"]
+        except Exception as e:
+            logger.error(f"Ошибка архивации статистики: {e}")
+        
+        if archive is None:
+            archive_text = "• Старая статистика: ❌ Ошибка архивации\n\n"
+        else:
+            months = ", ".join(archive["months"]) or "нет"
+            archive_text = (
+                f"• Старая статистика: {archive['days']} дней в архив (месяцы: {months})\n"
+                f"• Горячая статистика: {_format_bytes(archive['hot_bytes_before'])} → "
+                f"{_format_bytes(archive['hot_bytes_after'])}\n"
+                f"• Архив: {_format_bytes(archive['archive_bytes'])}\n\n"
+                f"**Освобождено места:** {_format_bytes(archive['reclaimed_bytes'])}\n"
+            )
         
         cleanup_text = (
             f"🧹 **Очистка системы завершена**\n\n"
             f"**Результаты:**\n"
             f"• Логи: {'✅ Очищены' if cleanup_stats['logs_cleaned'] else '➖ Не требуется'}\n"
             f"• Кэш: {'✅ Очищен' if cleanup_stats['cache_cleaned'] else '➖ Не требуется'}\n"
-            f"• Старая статистика: {cleanup_stats['old_stats']} записей\n\n"
-            f"**Освобождено места:** ~{sum(cleanup_stats.values())} MB\n"
+            f"{archive_text}"
             f"**Время выполнения:** {datetime.now().strftime('%H:%M:%S')}\n\n"
             f"💡 Рекомендуется запускать очистку раз в неделю"
         )
@@ -263,3 +273,80 @@ async def cleanup_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         logger.error(f"❌ Ошибка команды /cleanup: {e}")
         if update.message:
             await update.message.reply_text("❌ Ошибка при очистке системы")
+
+async def top_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Команда /top [эмодзи] [all|week|day] [N] - топ постов по реакциям (только для админа)"""
+    try:
+        user_id = update.effective_user.id if update.effective_user else 0
+        
+        if user_id != ADMIN_ID:
+            if update.message:
+                await update.message.reply_text("❌ Доступ запрещен")
+            return
+        
+        from utils.database import async_reactions_db
+        from utils.leaderboard import ALL_EMOJIS, WINDOWS
+        
+        # Аргументы в любом порядке: окно, число, остальное - эмодзи
+        emoji, window, limit = ALL_EMOJIS, "week", 10
+        for arg in context.args or []:
+            if arg in WINDOWS:
+                window = arg
+            elif arg.isdigit():
+                limit = max(1, min(int(arg), 50))
+            else:
+                emoji = arg
+        
+        window_names = {"all": "все время", "week": "эта неделя", "day": "сегодня"}
+        top = async_reactions_db.top_posts(emoji, window, limit)
+        
+        title = "все реакции" if emoji == ALL_EMOJIS else emoji
+        top_text = f"🏆 **Топ постов: {title}, {window_names[window]}**\n\n"
+        if top:
+            for i, (post_id, count) in enumerate(top, 1):
+                top_text += f"{i}. Пост `{post_id}` - {count}\n"
+        else:
+            top_text += "Реакций пока нет"
+        
+        if update.message:
+            await update.message.reply_text(top_text, parse_mode='Markdown')
+        
+        logger.info(f"🏆 Топ постов запрошен пользователем {user_id}")
+        
+    except Exception as e:
+        logger.error(f"❌ Ошибка команды /top: {e}")
+        if update.message:
+            await update.message.reply_text("❌ Ошибка при получении топа постов")
+
+async def latency_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Команда /latency - время обработчиков p50/p95/p99 (только для админа)"""
+    try:
+        user_id = update.effective_user.id if update.effective_user else 0
+        
+        if user_id != ADMIN_ID:
+            if update.message:
+                await update.message.reply_text("❌ Доступ запрещен")
+            return
+        
+        from utils.latency import handler_latency
+        
+        summary = handler_latency.summary()
+        latency_text = "⏱ **Время обработчиков** (мс: p50 / p95 / p99 / max)\n\n"
+        if summary:
+            for key, row in list(summary.items())[:20]:
+                latency_text += (
+                    f"`{key}` × {row['count']}: {row['p50_ms']} / {row['p95_ms']} / "
+                    f"{row['p99_ms']} / {row['max_ms']}\n"
+                )
+        else:
+            latency_text += "Замеров пока нет"
+        
+        if update.message:
+            await update.message.reply_text(latency_text, parse_mode='Markdown')
+        
+        logger.info(f"⏱ Время обработчиков запрошено пользователем {user_id}")
+        
+    except Exception as e:
+        logger.error(f"❌ Ошибка команды /latency: {e}")
+        if update.message:
+            await update.message.reply_text("❌ Ошибка при получении времени обработчиков")
@@ -4,6 +4,7 @@ import random
 from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
+from utils.database import async_reactions_db
 
 logger = logging.getLogger(__name__)
 
@@ -116,15 +117,26 @@ async def random_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 async def popular_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Команда /popular - популярные посты"""
     try:
-        # Сортируем посты по просмотрам
-        popular_posts = sorted(SAMPLE_POSTS, key=lambda x: x['views'], reverse=True)[:3]
+        # Сортируем посты по реакциям из топа, при равенстве - по просмотрам
+        top_counts = dict(async_reactions_db.top_posts(n=50))
+        popular_posts = sorted(
+            SAMPLE_POSTS,
+            key=lambda x: (top_counts.get(x['id'], 0), x['views']),
+            reverse=True
+        )[:3]
+        # Показанные посты могут быть вне топа - их реакции считаются точно
+        reaction_counts = {
+            post['id']: sum(async_reactions_db.get_post_reactions(post['id']).values())
+            for post in popular_posts
+        }
         
         popular_text = "🔥 **Популярные посты**\n\n"
         
         for i, post in enumerate(popular_posts, 1):
             popular_text += (
                 f"**{i}. {post['title']}**\n"
-                f"📂 {post['category']} | 👁 {post['views']} просмотров\n"
+                f"📂 {post['category']} | ❤️ {reaction_counts.get(post['id'], 0)} реакций | "
+                f"👁 {post['views']} просмотров\n"
                 f"{post['content'][:100]}{'...' if len(post['content']) > 100 else ''}\n\n"
             )
         
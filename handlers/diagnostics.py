@@ -163,9 +163,37 @@ async def health_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             # Простая проверка
             reactions_db.get_post_reactions("test")
             checks.append("✅ База данных: OK")
+            recovery = getattr(reactions_db.storage, "recovery", None)
+            if recovery:
+                checks.append(
+                    f"{'⚠️' if recovery['corrupted_snapshots'] else '✅'} Восстановление при старте: "
+                    f"{recovery['seconds'] * 1000:.0f}ms, снапшот v{recovery['snapshot_version'] or '-'}"
+                )
         except Exception:
             checks.append("❌ База данных: Ошибка")
-        
+
+        # Проверка очереди фоновой записи
+        try:
+            from utils.writer import storage_writer
+            writer_metrics = storage_writer.get_metrics()
+            checks.append(
+                f"{'✅' if writer_metrics['queue_depth'] < 100 else '⚠️'} Очередь записи: "
+                f"{writer_metrics['queue_depth']}, запись ~{writer_metrics['avg_flush_ms']}ms"
+            )
+        except Exception:
+            checks.append("❌ Очередь записи: Ошибка")
+
+        # Проверка очереди событий статистики
+        try:
+            from handlers.stats import stats_pipeline
+            pipeline_metrics = stats_pipeline.get_metrics()
+            checks.append(
+                f"{'✅' if pipeline_metrics['last_lag_ms'] < 1000 else '⚠️'} Очередь статистики: "
+                f"{pipeline_metrics['queue_depth']}, лаг {pipeline_metrics['last_lag_ms']}ms"
+            )
+        except Exception:
+            checks.append("❌ Очередь статистики: Ошибка")
+
         health_text = (
             f"🏥 **Проверка здоровья системы**\n\n"
             + "\n".join(checks)
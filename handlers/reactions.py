@@ -2,7 +2,7 @@
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes
-from utils.database import reactions_db
+from utils.database import async_reactions_db
 from config import REACTION_EMOJIS
 
 logger = logging.getLogger(__name__)
@@ -33,7 +33,7 @@ async def handle_reaction(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         reaction = REACTION_EMOJIS[reaction_idx]
         
         # Сохраняем реакцию
-        reactions_db.add_reaction(user_id, post_id, reaction)
+        await async_reactions_db.add_reaction(user_id, post_id, reaction)
         
         await query.answer(f"Вы поставили {reaction}")
         logger.info(f"📝 Пользователь {user_id} поставил {reaction} на пост {post_id}")
@@ -56,7 +56,7 @@ async def show_post_reactions(update: Update, context: ContextTypes.DEFAULT_TYPE
             return
         
         post_id = query.data.split("_")[1]
-        reactions = reactions_db.get_post_reactions(post_id)
+        reactions = async_reactions_db.get_post_reactions(post_id)
         
         if not reactions:
             await query.answer("На этот пост пока нет реакций")
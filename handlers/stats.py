@@ -1,112 +1,437 @@
 # handlers/stats.py - Обработчики статистики
+import atexit
+import io
 import logging
-import json
 import os
+import threading
+import time
 from datetime import datetime, timedelta
 from telegram import Update
 from telegram.ext import ContextTypes
 from collections import defaultdict, Counter
-from config import ADMIN_ID
+from config import (
+    ADMIN_ID, FLUSH_INTERVAL_MS, FLUSH_MAX_MUTATIONS, HLL_PRECISION, STATS_EXACT_UNIQUES,
+    STATS_RETENTION_DAYS, STATS_ARCHIVE_DIR, STATS_ARCHIVE_INTERVAL_HOURS, STATS_WORKER_ID
+)
+from utils.hyperloglog import HyperLogLog
+from utils.last_seen import LastSeenIndex
+from utils.stats_archive import StatsArchive, merge_summary, summarize_days
+from utils.storage import create_stats_storage, empty_day, empty_stats, normalize_stats, peak_rss_mb
+from utils.event_queue import EventPipeline
+from utils.worker_stats import MergedStatsStorage, worker_storages
+from utils.writer import GroupCommitter, storage_writer
 
 logger = logging.getLogger(__name__)
 
 # Файл для хранения статистики
 STATS_FILE = "bot_stats.json"
 
+def _when(today=None, moment=None):
+    """Дата и момент события (по умолчанию - сейчас)"""
+    if moment is None:
+        moment = datetime.strptime(today, '%Y-%m-%d') if today else datetime.now()
+    return today or moment.strftime('%Y-%m-%d'), moment
+
 class BotStats:
-    """Класс для работы со статистикой бота"""
+    """Класс для работы со статистикой бота
+    
+    Изменения и подготовка данных к записи идут под блокировкой, а сама
+    запись на диск выполняется в потоке BackgroundWriter (request_save),
+    чтобы обработчики не делали файлового ввода-вывода в event loop.
+    """
     
-    def __init__(self):
+    def __init__(self, storage=None, writer=None, exact_uniques=STATS_EXACT_UNIQUES, archive=None,
+                 worker_id=STATS_WORKER_ID):
+        # Воркер пишет только свой файл; общий отчет - merged_view()
+        self.worker_id = worker_id
+        self.storage = storage or create_stats_storage(STATS_FILE, worker_id=worker_id)
+        self.writer = writer or storage_writer
+        archive_dir = os.path.join(STATS_ARCHIVE_DIR, f"worker-{worker_id}") if worker_id else STATS_ARCHIVE_DIR
+        self.archive = archive or StatsArchive(archive_dir)
+        self._retention_stop = None
+        # Точные множества пользователей по дням - только для отладки HyperLogLog
+        self.exact_uniques = exact_uniques
+        self._lock = threading.RLock()
+        self._save_pending = False
+        self.committer = None
+        # Изменившиеся пользователи, дни и агрегаты - для точечной записи в SQLite;
+        # агрегаты после загрузки пишутся целиком (None) - их могли восстановить
+        self._dirty_users = set()
+        self._dirty_days = set()
+        self._dirty_meta = None
         self.stats = self.load_stats()
+        # Корзины "дата last_seen -> пользователи" для get_active_users
+        self.last_seen_index = LastSeenIndex.from_users(self.stats["users"])
     
     def load_stats(self):
-        """Загрузка статистики из файла"""
+        """Загрузка статистики из хранилища"""
         try:
-            if os.path.exists(STATS_FILE):
-                with open(STATS_FILE, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return {
-                "users": {},
-                "commands": defaultdict(int),
-                "daily_stats": {},
-                "total_messages": 0,
-                "start_date": datetime.now().isoformat()
-            }
+            started = time.perf_counter()
+            stats = self.storage.load()
+            if stats is not None:
+                stats = normalize_stats(stats, self.exact_uniques)
+                logger.info(
+                    f"Статистика загружена за {(time.perf_counter() - started) * 1000:.1f} мс, "
+                    f"пользователей {len(stats['users'])}, пиковый RSS {peak_rss_mb()} МБ"
+                )
+                return stats
+            return empty_stats()
         except Exception as e:
             logger.error(f"Ошибка загрузки статистики: {e}")
-            return {
-                "users": {},
-                "commands": defaultdict(int),
-                "daily_stats": {},
-                "total_messages": 0,
-                "start_date": datetime.now().isoformat()
-            }
+            return empty_stats()
     
     def save_stats(self):
-        """Сохранение статистики в файл"""
+        """Сохранение статистики в хранилище (блокирующее)
+        
+        Если запись не удалась, изменения возвращаются в "грязные" и уйдут
+        следующей записью.
+        """
+        try:
+            with self._lock:
+                dirty = (self._dirty_users, self._dirty_days, self._dirty_meta)
+                payload = self.storage.prepare(self.stats, *dirty)
+                buckets = self.stats["rollups"].take_changes()
+                self._dirty_users = set()
+                self._dirty_days = set()
+                self._dirty_meta = set()
+        except Exception as e:
+            logger.error(f"Ошибка сохранения статистики: {e}")
+            return
         try:
-            with open(STATS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.stats, f, ensure_ascii=False, indent=2)
+            self.storage.write(payload)
         except Exception as e:
+            with self._lock:
+                self._restore_dirty(dirty, buckets)
             logger.error(f"Ошибка сохранения статистики: {e}")
     
-    def add_user(self, user_id, username=None, first_name=None):
-        """Добавление пользователя в статистику"""
-        today = datetime.now().strftime('%Y-%m-%d')
-        
-        if str(user_id) not in self.stats["users"]:
-            self.stats["users"][str(user_id)] = {
-                "username": username,
-                "first_name": first_name,
-                "first_seen": today,
-                "last_seen": today,
-                "message_count": 0,
-                "commands_used": defaultdict(int)
-            }
+    def _restore_dirty(self, dirty, buckets):
+        """Возвращает изменения неудавшейся записи (под блокировкой)"""
+        users, days, meta = dirty
+        self._dirty_users |= users
+        self._dirty_days |= days
+        if meta is None or self._dirty_meta is None:
+            self._dirty_meta = None
         else:
-            self.stats["users"][str(user_id)]["last_seen"] = today
-            if username:
-                self.stats["users"][str(user_id)]["username"] = username
-            if first_name:
-                self.stats["users"][str(user_id)]["first_name"] = first_name
+            self._dirty_meta |= meta
+        self.stats["rollups"].restore_changes(buckets)
     
-    def add_command(self, user_id, command):
+    def _mark_meta(self, key):
+        if self._dirty_meta is not None:
+            self._dirty_meta.add(key)
+    
+    def enable_group_commit(self, interval_ms=FLUSH_INTERVAL_MS, max_mutations=FLUSH_MAX_MUTATIONS):
+        """Включает групповую запись: request_save только помечает изменения"""
+        self.committer = GroupCommitter(
+            self.save_stats, self.writer, interval_ms, max_mutations, name="stats-commit"
+        )
+        atexit.register(self.committer.close)
+        return self.committer
+    
+    def enable_retention(self, interval_hours=STATS_ARCHIVE_INTERVAL_HOURS):
+        """Включает периодический перенос старых дней в архив (в потоке записи)
+        
+        Первый перенос - сразу при запуске: при частых перезапусках
+        интервал иначе может так и не истечь.
+        """
+        stop = threading.Event()
+        
+        def run():
+            while True:
+                self.writer.submit(self.archive_old_days)
+                if stop.wait(interval_hours * 3600):
+                    break
+        
+        threading.Thread(target=run, name="stats-retention", daemon=True).start()
+        self._retention_stop = stop
+        return stop
+    
+    def archive_old_days(self, retention_days=STATS_RETENTION_DAYS, now=None):
+        """Переносит дни старше retention_days в помесячный архив
+        
+        В горячей статистике от перенесенных дней остается агрегат месяца
+        в stats["archived_months"]. Блокирующая операция: выполняется в
+        потоке записи. Возвращает отчет с размерами горячего хранилища до
+        и после переноса.
+        """
+        cutoff = ((now or datetime.now()) - timedelta(days=retention_days)).strftime('%Y-%m-%d')
+        hot_before = self.storage.size()
+        by_month = defaultdict(dict)
+        with self._lock:
+            for date, day in self.stats["daily_stats"].items():
+                if date < cutoff:
+                    by_month[date[:7]][date] = day
+        
+        # Сначала архив: при сбое дни останутся в горячей статистике,
+        # а повторный перенос перезапишет их в файле месяца
+        for month, days in sorted(by_month.items()):
+            self.archive.write_month(month, days)
+        
+        archived = []
+        with self._lock:
+            months = self.stats["archived_months"]
+            for month, days in by_month.items():
+                for date in days:
+                    self.stats["daily_stats"].pop(date, None)
+                    # Грязный день, которого нет в stats, хранилище удалит
+                    # в одной записи с агрегатом месяца
+                    self._dirty_days.add(date)
+                    archived.append(date)
+                self._mark_meta("archived_months")
+                summary = months.get(month)
+                if summary is None:
+                    summary = months[month] = summarize_days({}, HLL_PRECISION)
+                merge_summary(summary, days)
+        if archived:
+            self.save_stats()
+        
+        hot_after = self.storage.size()
+        report = {
+            "days": len(archived),
+            "months": sorted(by_month),
+            "hot_bytes_before": hot_before,
+            "hot_bytes_after": hot_after,
+            "reclaimed_bytes": max(0, hot_before - hot_after),
+            "archive_bytes": self.archive.size(),
+        }
+        if archived:
+            logger.info(
+                f"Архив статистики: перенесено дней {report['days']} ({', '.join(report['months'])}), "
+                f"горячие данные {hot_before} -> {hot_after} байт"
+            )
+        return report
+    
+    def request_save(self):
+        """Ставит сохранение в очередь фоновой записи и сразу возвращается
+        
+        Пока предыдущий запрос не выполнен, новые не добавляются в очередь:
+        одна запись все равно сохранит все накопленные изменения. При
+        групповой записи изменение только помечается, а сброс выполнит
+        GroupCommitter по таймеру или по числу изменений.
+        """
+        if self.committer is not None:
+            self.committer.mark_dirty()
+            return
+        with self._lock:
+            if self._save_pending:
+                return
+            self._save_pending = True
+        self.writer.submit(self._save_from_writer)
+    
+    def _save_from_writer(self):
+        """Выполняется в потоке записи"""
+        with self._lock:
+            self._save_pending = False
+        self.save_stats()
+    
+    def apply_events(self, events):
+        """Применяет пачку событий из stats_pipeline одним захватом блокировки
+
+        Событие: (timestamp, user_id, username, first_name, command, is_message, category).
+        """
+        with self._lock:
+            for timestamp, user_id, username, first_name, command, is_message, category in events:
+                moment = datetime.fromtimestamp(timestamp)
+                today = moment.strftime('%Y-%m-%d')
+                self.add_user(user_id, username, first_name, today, moment)
+                if command:
+                    self.add_command(user_id, command, today, moment)
+                if category:
+                    self.add_category(user_id, category, today)
+                if is_message:
+                    self.add_message(user_id, moment)
+        self.request_save()
+    
+    def add_user(self, user_id, username=None, first_name=None, today=None, moment=None):
+        """Добавление пользователя в статистику"""
+        today, moment = _when(today, moment)
+        
+        with self._lock:
+            self._dirty_users.add(str(user_id))
+            previous = self.stats["users"].get(str(user_id))
+            self.stats["rollups"].record_user(user_id, moment, previous is None)
+            if previous is None:
+                # Гистограмма first_seen в заголовке агрегатов
+                self._mark_meta("rollups")
+            if self.stats["cohorts"].record(
+                previous and previous["first_seen"], previous and previous["last_seen"], today
+            ):
+                self._mark_meta("cohorts")
+            self.last_seen_index.move(user_id, previous and previous["last_seen"], today)
+            if previous is None:
+                self.stats["users"][str(user_id)] = {
+                    "username": username,
+                    "first_name": first_name,
+                    "first_seen": today,
+                    "last_seen": today,
+                    "message_count": 0,
+                    "commands_used": defaultdict(int)
+                }
+            else:
+                self.stats["users"][str(user_id)]["last_seen"] = today
+                if username:
+                    self.stats["users"][str(user_id)]["username"] = username
+                if first_name:
+                    self.stats["users"][str(user_id)]["first_name"] = first_name
+    
+    def add_command(self, user_id, command, today=None, moment=None):
         """Добавление использования команды"""
-        self.stats["commands"][command] += 1
-        if str(user_id) in self.stats["users"]:
-            self.stats["users"][str(user_id)]["commands_used"][command] += 1
+        today, moment = _when(today, moment)
+        
+        with self._lock:
+            self.stats["commands"][command] += 1
+            self.stats["rollups"].record_command(moment)
+            if str(user_id) in self.stats["users"]:
+                self.stats["users"][str(user_id)]["commands_used"][command] += 1
+                self._dirty_users.add(str(user_id))
+            
+            # Дневная статистика
+            day = self._day(today)
+            day["commands"][command] += 1
+            self._add_unique(day, "command_users", command, user_id)
+    
+    def add_category(self, user_id, category, today=None):
+        """Добавление просмотра категории контента"""
+        today = today or datetime.now().strftime('%Y-%m-%d')
         
-        # Дневная статистика
-        today = datetime.now().strftime('%Y-%m-%d')
-        if today not in self.stats["daily_stats"]:
-            self.stats["daily_stats"][today] = {"commands": defaultdict(int), "users": set()}
+        with self._lock:
+            day = self._day(today)
+            day["categories"][category] += 1
+            self._add_unique(day, "category_users", category, user_id)
+    
+    def _day(self, today):
+        """Дневная статистика (создается при первом событии дня)"""
+        self._dirty_days.add(today)
+        day = self.stats["daily_stats"].get(today)
+        if day is None:
+            day = self.stats["daily_stats"][today] = empty_day(self.exact_uniques)
+        return day
+    
+    def _add_unique(self, day, kind, key, user_id):
+        """Учитывает пользователя в скетчах дня: общем и по команде/категории
         
-        self.stats["daily_stats"][today]["commands"][command] += 1
-        self.stats["daily_stats"][today]["users"] = list(set(self.stats["daily_stats"][today].get("users", [])) | {user_id})
+        Хеш считается один раз на оба скетча.
+        """
+        hashed = HyperLogLog.hash(user_id)
+        day["unique_users"].add_hash(hashed)
+        sketches = day[kind]
+        sketch = sketches.get(key)
+        if sketch is None:
+            sketch = sketches[key] = HyperLogLog(HLL_PRECISION)
+        sketch.add_hash(hashed)
+        if self.exact_uniques:
+            day["users"].add(user_id)
     
-    def add_message(self, user_id):
+    def add_message(self, user_id, moment=None):
         """Добавление сообщения"""
-        self.stats["total_messages"] += 1
-        if str(user_id) in self.stats["users"]:
-            self.stats["users"][str(user_id)]["message_count"] += 1
+        with self._lock:
+            self.stats["total_messages"] += 1
+            self.stats["rollups"].record_message(moment or datetime.now())
+            if str(user_id) in self.stats["users"]:
+                self.stats["users"][str(user_id)]["message_count"] += 1
+                self._dirty_users.add(str(user_id))
+    
+    def _union(self, dates, kind=None, key=None):
+        """Объединение дневных скетчей за даты"""
+        sketches = []
+        with self._lock:
+            for date in dates:
+                day = self.stats["daily_stats"].get(date)
+                if day is None:
+                    continue
+                sketch = day["unique_users"] if kind is None else day[kind].get(key)
+                if sketch is not None:
+                    sketches.append(sketch)
+            return HyperLogLog.union(sketches, HLL_PRECISION)
+    
+    def unique_users(self, dates, exact=False):
+        """Оценка числа уникальных пользователей за даты
+        
+        exact=True считает по точным множествам (только при STATS_EXACT_UNIQUES).
+        """
+        if exact:
+            if not self.exact_uniques:
+                raise ValueError("Точные множества пользователей не ведутся (STATS_EXACT_UNIQUES)")
+            with self._lock:
+                users = set()
+                for date in dates:
+                    users |= self.stats["daily_stats"].get(date, {}).get("users", set())
+                return len(users)
+        return self._union(dates).count()
+    
+    def command_uniques(self, command, dates):
+        """Оценка числа уникальных пользователей команды за даты"""
+        return self._union(dates, "command_users", command).count()
+    
+    def category_uniques(self, category, dates):
+        """Оценка числа уникальных пользователей категории за даты"""
+        return self._union(dates, "category_users", category).count()
+    
+    def get_retention(self, cohorts=8, weeks=8):
+        """Таблица удержания недельных когорт (готовая матрица, без обхода пользователей)"""
+        with self._lock:
+            return self.stats["cohorts"].render(cohorts, weeks)
+    
+    def get_retention_csv(self):
+        """Матрица удержания в CSV"""
+        with self._lock:
+            return self.stats["cohorts"].to_csv()
+    
+    def merged_view(self):
+        """Статистика всех воркеров для отчетов (read-only BotStats)
+        
+        Без STATS_WORKER_ID возвращает сам объект. Иначе собирает новый
+        BotStats из общего файла, файлов других воркеров и текущих данных
+        этого процесса из памяти.
+        """
+        if not self.worker_id:
+            return self
+        storages = worker_storages(STATS_FILE, exclude=self.worker_id)
+        merged = MergedStatsStorage(storages, local=self, exact_uniques=self.exact_uniques)
+        try:
+            return BotStats(
+                storage=merged, writer=self.writer, exact_uniques=self.exact_uniques,
+                archive=self.archive, worker_id=None
+            )
+        finally:
+            merged.close()
     
     def get_user_count(self):
         """Получение количества пользователей"""
         return len(self.stats["users"])
     
     def get_active_users(self, days=7):
-        """Получение активных пользователей за период"""
-        cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
-        active_users = 0
-        
-        for user_data in self.stats["users"].values():
-            if user_data["last_seen"] >= cutoff_date:
-                active_users += 1
+        """Получение активных пользователей за период
         
-        return active_users
+        Сумма размеров корзин LastSeenIndex за days дней - без обхода пользователей.
+        """
+        with self._lock:
+            return self.last_seen_index.count_since(days)
+    
+    def get_new_users(self, days=7):
+        """Пользователи, впервые пришедшие за период"""
+        with self._lock:
+            return self.stats["rollups"].new_users(days)
+    
+    def get_recent_activity(self, granularity="hour", count=24):
+        """Сводка по последним корзинам агрегатов (hour/day/week)"""
+        with self._lock:
+            return self.stats["rollups"].recent(granularity, count)
 
 # Глобальный объект статистики
 bot_stats = BotStats()
+if FLUSH_INTERVAL_MS > 0:
+    bot_stats.enable_group_commit()
+if STATS_ARCHIVE_INTERVAL_HOURS > 0:
+    bot_stats.enable_retention()
+
+# Очередь событий статистики: обработчики только публикуют, агрегатор применяет пачками
+stats_pipeline = EventPipeline(bot_stats.apply_events, name="stats-pipeline")
+
+async def report_stats():
+    """BotStats для отчетов: при нескольких воркерах файлы читаются в потоке записи"""
+    if not bot_stats.worker_id:
+        return bot_stats
+    return await bot_stats.writer.run(bot_stats.merged_view)
 
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Команда /stats - статистика использования бота"""
@@ -118,35 +443,42 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             return
         
         # Обновляем статистику
-        bot_stats.add_user(
+        update_stats(
             user_id,
             update.effective_user.username,
-            update.effective_user.first_name
+            update.effective_user.first_name,
+            "stats"
         )
-        bot_stats.add_command(user_id, "stats")
-        bot_stats.save_stats()
         
-        # Формируем отчет
-        total_users = bot_stats.get_user_count()
-        active_users_7d = bot_stats.get_active_users(7)
-        active_users_30d = bot_stats.get_active_users(30)
+        # Формируем отчет (при нескольких воркерах - по данным всех процессов)
+        report = await report_stats()
+        total_users = report.get_user_count()
+        active_users_7d = report.get_active_users(7)
+        active_users_30d = report.get_active_users(30)
         
         # Топ команд
-        top_commands = Counter(bot_stats.stats["commands"]).most_common(5)
+        top_commands = Counter(report.stats["commands"]).most_common(5)
         
-        # Статистика за сегодня
-        today = datetime.now().strftime('%Y-%m-%d')
-        today_stats = bot_stats.stats["daily_stats"].get(today, {})
+        # Уникальные пользователи: сегодня, за неделю и месяц - слияние дневных скетчей
+        now = datetime.now()
+        last_days = [(now - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(30)]
+        unique_today = report.unique_users(last_days[:1])
+        unique_week = report.unique_users(last_days[:7])
+        unique_month = report.unique_users(last_days)
+        last_day = report.get_recent_activity("hour", 24)
         
         stats_text = (
             f"📊 **Статистика бота**\n\n"
             f"👥 **Пользователи**\n"
             f"• Всего: {total_users}\n"
             f"• Активные (7 дней): {active_users_7d}\n"
-            f"• Активные (30 дней): {active_users_30d}\n\n"
+            f"• Активные (30 дней): {active_users_30d}\n"
+            f"• Уникальные сегодня/неделя/месяц: ~{unique_today}/~{unique_week}/~{unique_month}\n"
+            f"• За 24 часа: ~{last_day['active']} активных, {last_day['new']} новых, "
+            f"{last_day['commands']} команд\n\n"
             f"📱 **Сообщения**\n"
-            f"• Всего: {bot_stats.stats['total_messages']}\n"
-            f"• Сегодня: {len(today_stats.get('users', []))}\n\n"
+            f"• Всего: {report.stats['total_messages']}\n"
+            f"• Сегодня: {unique_today}\n\n"
             f"⚡ **Популярные команды**\n"
         )
         
@@ -156,10 +488,8 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         # Статистика за последние 7 дней
         stats_text += f"\n📅 **За последние 7 дней**\n"
         recent_days = []
-        for i in range(7):
-            date = (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d')
-            day_stats = bot_stats.stats["daily_stats"].get(date, {})
-            users_count = len(day_stats.get("users", []))
+        for date in last_days[:7]:
+            users_count = report.unique_users([date])
             if users_count > 0:
                 recent_days.append(f"• {date}: {users_count} польз.")
         
@@ -184,23 +514,14 @@ async def users_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
             await update.message.reply_text("❌ Доступ запрещен")
             return
         
-        total_users = bot_stats.get_user_count()
-        active_7d = bot_stats.get_active_users(7)
-        active_30d = bot_stats.get_active_users(30)
+        report = await report_stats()
+        total_users = report.get_user_count()
+        active_7d = report.get_active_users(7)
+        active_30d = report.get_active_users(30)
         
         # Новые пользователи за последние дни
-        today = datetime.now()
-        new_users_7d = 0
-        new_users_30d = 0
-        
-        for user_data in bot_stats.stats["users"].values():
-            first_seen = datetime.fromisoformat(user_data["first_seen"])
-            days_ago = (today - first_seen).days
-            
-            if days_ago <= 7:
-                new_users_7d += 1
-            if days_ago <= 30:
-                new_users_30d += 1
+        new_users_7d = report.get_new_users(7)
+        new_users_30d = report.get_new_users(30)
         
         users_text = (
             f"👥 **Пользователи бота**\n\n"
@@ -224,19 +545,37 @@ async def users_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         logger.error(f"❌ Ошибка команды /users: {e}")
         await update.message.reply_text("❌ Ошибка при получении информации о пользователях")
 
-# Функция для обновления статистики (вызывается из основного бота)
-def update_stats(user_id, username=None, first_name=None, command=None, is_message=False):
-    """Обновление статистики"""
+async def retention_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Команда /retention - удержание по недельным когортам; /retention csv - файл CSV"""
     try:
-        bot_stats.add_user(user_id, username, first_name)
-        
-        if command:
-            bot_stats.add_command(user_id, command)
+        user_id = update.effective_user.id
         
-        if is_message:
-            bot_stats.add_message(user_id)
+        if user_id != ADMIN_ID:
+            await update.message.reply_text("❌ Доступ запрещен")
+            return
         
-        bot_stats.save_stats()
+        report = await report_stats()
+        if context.args and context.args[0].lower() == "csv":
+            data = report.get_retention_csv().encode('utf-8')
+            filename = f"retention_{datetime.now().strftime('%Y-%m-%d')}.csv"
+            await update.message.reply_document(document=io.BytesIO(data), filename=filename)
+        else:
+            retention_text = (
+                "📈 **Удержание по неделям первого визита**\n"
+                "(доля когорты, активная через N недель)\n\n"
+                f"```\n{report.get_retention()}\n```"
+            )
+            await update.message.reply_text(retention_text, parse_mode='Markdown')
+        logger.info(f"📈 Удержание запрошено пользователем {user_id}")
         
+    except Exception as e:
+        logger.error(f"❌ Ошибка команды /retention: {e}")
+        await update.message.reply_text("❌ Ошибка при получении удержания")
+
+# Функция для обновления статистики (вызывается из основного бота)
+def update_stats(user_id, username=None, first_name=None, command=None, is_message=False, category=None):
+    """Обновление статистики: событие уходит в stats_pipeline, без блокировок и записи"""
+    try:
+        stats_pipeline.publish(time.time(), user_id, username, first_name, command, is_message, category)
     except Exception as e:
         logger.error(f"Ошибка обновления статистики: {e}")
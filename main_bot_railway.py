@@ -1,6 +1,8 @@
 # main_bot_railway.py - Минимальная версия с базовым меню
+import asyncio
 import logging
 import os
+import signal
 import threading
 import time
 from typing import Optional
@@ -9,11 +11,12 @@ from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler, 
     MessageHandler, filters, ContextTypes
 )
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify
 
 # Импорты из наших модулей
 from config import (
-    BOT_TOKEN, validate_config,
+    BOT_TOKEN, validate_config, WEBHOOK_SERVER, UPDATE_QUEUE_SIZE, UPDATE_WORKERS,
+    UPDATE_DEDUP_SIZE, UPDATE_DEDUP_DB_FILE,
     CONNECT_TIMEOUT, READ_TIMEOUT, WRITE_TIMEOUT, POOL_TIMEOUT
 )
 from utils.keyboards import (
@@ -25,6 +28,17 @@ from utils.keyboards import (
     create_relationships_submenu,
     create_zodiac_keyboard
 )
+from utils.writer import storage_writer
+from utils.database import reactions_db
+from utils.update_dedup import create_update_dedup
+from utils.update_loop import UpdateLoop
+from utils.update_queue import UpdateQueueFull
+from utils.webhook_server import WebhookServer, serve_webhook
+from utils.latency import handler_latency, instrument_handlers
+from utils.metrics import (
+    bot_metrics, register_process_metrics, register_runtime_metrics, register_update_queue_metrics,
+    update_type, updates_duplicate, updates_processed, updates_received
+)
 
 # Импорты новых обработчиков команд
 from handlers.diagnostics import (
@@ -32,7 +46,7 @@ from handlers.diagnostics import (
     version_command, health_command
 )
 from handlers.stats import (
-    stats_command, users_command, update_stats
+    stats_command, users_command, retention_command, update_stats, stats_pipeline, bot_stats
 )
 from handlers.user_commands import (
     about_command, profile_command, feedback_command, settings_command
@@ -42,7 +56,8 @@ from handlers.content_commands import (
     categories_command, search_command
 )
 from handlers.admin_commands import (
-    logs_command, restart_command, broadcast_command, cleanup_command
+    logs_command, restart_command, broadcast_command, cleanup_command, top_command,
+    latency_command
 )
 from handlers.chatgpt_commands import (
     handle_chatgpt_callback, chatgpt_command, process_gpt_message
@@ -51,6 +66,13 @@ from handlers.chatgpt_commands import (
 # Flask app для health endpoint
 app = Flask(__name__)
 
+# Метрики для /metrics: очереди, запись, обработчики и процесс
+register_runtime_metrics(
+    bot_metrics, storage_writer, stats_pipeline, handler_latency,
+    {"stats": bot_stats.committer, "reactions": reactions_db.committer},
+)
+register_process_metrics(bot_metrics)
+
 # Настройка логирования
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -66,19 +88,34 @@ logger = logging.getLogger(__name__)
 # Глобальные переменные
 application: Optional[Application] = None
 start_time: Optional[float] = None
+# Event loop, в котором webhook обрабатывает апдейты (создается в main)
+update_loop: Optional[UpdateLoop] = None
+# Асинхронный webhook-сервер (WEBHOOK_SERVER=async)
+webhook_server: Optional[WebhookServer] = None
+# Недавние update_id: повторы Telegram не обрабатываются дважды
+update_dedup = create_update_dedup(UPDATE_DEDUP_SIZE, UPDATE_DEDUP_DB_FILE)
 
 # ================== FLASK ENDPOINTS ==================
 
-@app.route('/health')
-def health_check():
-    """Health check endpoint для Railway"""
+def health_payload():
+    """Данные health check (общие для Flask и асинхронного сервера)"""
     uptime = time.time() - start_time if start_time else 0
-    return jsonify({
+    return {
         'status': 'healthy',
         'uptime_seconds': round(uptime, 2),
         'service': 'telegram-bot',
-        'version': '1.0.0'
-    })
+        'version': '1.0.0',
+        'storage_writer': storage_writer.get_metrics(),
+        'stats_pipeline': stats_pipeline.get_metrics(),
+        'update_loop': update_loop.get_metrics() if update_loop else None,
+        'webhook_server': webhook_server.get_metrics() if webhook_server else None,
+        'update_dedup': update_dedup.get_metrics()
+    }
+
+@app.route('/health')
+def health_check():
+    """Health check endpoint для Railway"""
+    return jsonify(health_payload())
 
 @app.route('/')
 def root():
@@ -86,15 +123,18 @@ def root():
     return jsonify({
         'message': 'Telegram Bot is running',
         'status': 'online',
-        'endpoints': ['/health', '/webhook']
+        'endpoints': ['/health', '/metrics', '/webhook']
     })
 
+@app.route('/metrics')
+def metrics():
+    """Метрики в формате Prometheus"""
+    return Response(bot_metrics.render(), content_type=bot_metrics.CONTENT_TYPE)
+
 @app.route('/webhook/<token>', methods=['POST'])
 def webhook(token):
     """Webhook endpoint для Telegram"""
     from flask import request
-    import asyncio
-    import threading
     
     logger.info(f"🎯 Webhook вызван с токеном: {token[:10]}...")
     
@@ -106,7 +146,7 @@ def webhook(token):
         
         logger.info(f"✅ Токен проверен успешно")
         
-        if not application:
+        if not application or update_loop is None:
             logger.error("❌ Application не инициализирован!")
             return '', 500
         
@@ -115,6 +155,7 @@ def webhook(token):
         logger.error(f"❌ Ошибка в инициализации webhook: {init_error}")
         return '', 500
     
+    update_data = None
     try:
         update_data = request.get_json()
         if not update_data:
@@ -122,6 +163,14 @@ def webhook(token):
             return '', 400
             
         logger.info(f"📨 Получен webhook update: {update_data.get('update_id', 'unknown')}")
+        kind = update_type(update_data)
+        updates_received.inc(kind)
+        
+        # Повтор уже принятого апдейта (Telegram не дождался ответа) - 200 без обработки
+        if update_dedup.is_duplicate(update_data.get('update_id')):
+            updates_duplicate.inc(kind)
+            logger.info(f"♻️ Повтор update {update_data.get('update_id')} - пропускаем")
+            return '', 200
         
         # Логируем детали сообщения если есть
         if 'message' in update_data:
@@ -134,32 +183,25 @@ def webhook(token):
         update = Update.de_json(update_data, application.bot)
         logger.info(f"✅ Update создан: {update.update_id}")
         
-        # Обрабатываем update в отдельном потоке с новым event loop
-        def process_update():
-            try:
-                logger.info("🔄 Начинаем обработку update...")
-                if application:  # Дополнительная проверка
-                    result = asyncio.run(application.process_update(update))
-                    logger.info(f"✅ Update обработан успешно: {result}")
-                else:
-                    logger.error("❌ Application недоступен при обработке")
-            except Exception as e:
-                logger.error(f"❌ Ошибка обработки update: {e}")
-                import traceback
-                logger.error(f"📋 Traceback: {traceback.format_exc()}")
+        # Обработка в постоянном event loop апдейтов: без потока и loop на апдейт
+        def on_processed(error):
+            updates_processed.inc(kind, "error" if error else "ok")
         
-        # Запускаем в отдельном потоке
-        logger.info("🚀 Запускаем обработку в отдельном потоке...")
-        thread = threading.Thread(target=process_update)
-        thread.daemon = True
-        thread.start()
+        update_loop.submit(update, on_done=on_processed)
         
         logger.info("✅ Webhook update отправлен на обработку")
         
+    except UpdateQueueFull:
+        # Telegram повторит апдейт позже, когда очередь разгрузится
+        update_dedup.forget(update_data.get('update_id'))
+        logger.warning("⚠️ Очередь апдейтов заполнена, отвечаем 503")
+        return '', 503, {'Retry-After': '1'}
     except Exception as e:
         logger.error(f"❌ Критическая ошибка webhook: {e}")
         import traceback
         logger.error(f"📋 Traceback: {traceback.format_exc()}")
+        if isinstance(update_data, dict):
+            update_dedup.forget(update_data.get('update_id'))
         return '', 500
     
     return '', 200
@@ -371,6 +413,9 @@ async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TY
         # Категории контента
         elif data.startswith("category_"):
             category = data.split("_", 1)[1]
+            user = update.effective_user
+            if user:
+                update_stats(user.id, user.username, user.first_name, category=category)
             
             if category == "motivation":
                 text = """
@@ -844,11 +889,14 @@ async def setup_bot_commands(application: Application) -> None:
             BotCommand("status", "Статус системы"),
             BotCommand("stats", "Статистика"),
             BotCommand("users", "Пользователи"),
+            BotCommand("retention", "Удержание по когортам"),
             BotCommand("logs", "Логи"),
             BotCommand("health", "Проверка системы"),
             BotCommand("restart", "Перезапуск"),
             BotCommand("broadcast", "Рассылка"),
-            BotCommand("cleanup", "Очистка")
+            BotCommand("cleanup", "Очистка"),
+            BotCommand("top", "Топ постов по реакциям"),
+            BotCommand("latency", "Время обработчиков")
         ]
         
         await application.bot.set_my_commands(commands)
@@ -864,9 +912,13 @@ async def setup_bot_commands(application: Application) -> None:
         import traceback
         logger.error(f"📋 Полный traceback: {traceback.format_exc()}")
 
+def handle_sigterm(signum, frame):
+    """Обработчик SIGTERM - останавливаем основной поток как по Ctrl+C"""
+    raise KeyboardInterrupt
+
 def main():
     """Главная функция"""
-    global start_time, application
+    global start_time, application, update_loop, webhook_server
     import time
     
     # Устанавливаем время запуска
@@ -912,6 +964,7 @@ def main():
         # Статистика
         application.add_handler(CommandHandler("stats", stats_command))
         application.add_handler(CommandHandler("users", users_command))
+        application.add_handler(CommandHandler("retention", retention_command))
         
         # Пользовательские команды
         application.add_handler(CommandHandler("about", about_command))
@@ -931,12 +984,17 @@ def main():
         application.add_handler(CommandHandler("restart", restart_command))
         application.add_handler(CommandHandler("broadcast", broadcast_command))
         application.add_handler(CommandHandler("cleanup", cleanup_command))
+        application.add_handler(CommandHandler("top", top_command))
+        application.add_handler(CommandHandler("latency", latency_command))
         
         # Обработчики callback и ошибок
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
         application.add_handler(CallbackQueryHandler(handle_callback_query))
         application.add_error_handler(error_handler)
         
+        # Гистограммы времени для каждого обработчика (команды и префиксы callback)
+        instrument_handlers(application, handler_latency)
+        
         # Проверка Railway окружения
         is_railway = (
             os.environ.get('RAILWAY_PROJECT_ID') is not None or
@@ -972,17 +1030,25 @@ def main():
                 else:
                     logger.error("❌ Application не инициализировано")
             
-            # Запускаем setup в отдельном потоке
-            def run_setup():
-                import asyncio
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                loop.run_until_complete(setup_webhook())
-                loop.close()
+            if WEBHOOK_SERVER == "async":
+                # Один процесс, один loop: HTTP-сервер, Application и обработка
+                # апдейтов в одном event loop, без Flask и потоков
+                webhook_server = WebhookServer(
+                    application, BOT_TOKEN, health_payload, bot_metrics.render, bot_metrics.CONTENT_TYPE,
+                    UPDATE_QUEUE_SIZE, UPDATE_WORKERS, update_dedup,
+                )
+                register_update_queue_metrics(bot_metrics, webhook_server.queue)
+                logger.info(f"⚡ Асинхронный webhook-сервер на порту {port}")
+                asyncio.run(serve_webhook(webhook_server, port, setup_webhook))
+                return
             
-            setup_thread = threading.Thread(target=run_setup)
-            setup_thread.start()
-            setup_thread.join()  # Ждем завершения setup
+            # Один event loop на все время работы: в нем инициализируется
+            # Application, ставится webhook и обрабатываются апдейты
+            update_loop = UpdateLoop(
+                application, queue_size=UPDATE_QUEUE_SIZE, queue_workers=UPDATE_WORKERS
+            ).start()
+            register_update_queue_metrics(bot_metrics, update_loop.queue)
+            update_loop.run(setup_webhook())
             
             # Запускаем Flask server в отдельном потоке
             logger.info(f"🏥 Запуск Flask server на порту {port}")
@@ -992,6 +1058,10 @@ def main():
             flask_thread = threading.Thread(target=run_flask, daemon=True)
             flask_thread.start()
             
+            # SIGTERM от Railway превращаем в штатную остановку, чтобы atexit
+            # выполнил финальный сброс реакций и статистики на диск
+            signal.signal(signal.SIGTERM, handle_sigterm)
+            
             # Поддержание основного потока активным
             logger.info("🔄 Основной поток активен, Flask работает в фоне")
             try:
@@ -1000,6 +1070,7 @@ def main():
                     time.sleep(1)
             except KeyboardInterrupt:
                 logger.info("🛑 Получен сигнал остановки")
+                update_loop.stop()
         else:
             logger.info("🏠 Запуск в локальном режиме")
             run_local_polling()
@@ -1035,6 +1106,7 @@ def run_local_polling():
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
     application.add_handler(CallbackQueryHandler(handle_callback_query))
     application.add_error_handler(error_handler)
+    instrument_handlers(application, handler_latency)
     
     logger.info("🔄 Запуск polling режима...")
     
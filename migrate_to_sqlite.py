@@ -0,0 +1,24 @@
+# migrate_to_sqlite.py - Перенос reactions_data.json и bot_stats.json в SQLite
+import argparse
+
+from config import SQLITE_DB_FILE
+from utils.storage import migrate_json_to_sqlite
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Импорт JSON-данных бота в SQLite")
+    parser.add_argument("--reactions", default="reactions_data.json", help="файл реакций")
+    parser.add_argument("--stats", default="bot_stats.json", help="файл статистики")
+    parser.add_argument("--db", default=SQLITE_DB_FILE, help="файл базы SQLite")
+    args = parser.parse_args()
+
+    result = migrate_json_to_sqlite(args.reactions, args.stats, args.db)
+    print(f"✅ Реакций перенесено: {result['reactions']}")
+    print(f"✅ Пользователей статистики: {result['users']}")
+    if result["skipped"]:
+        print(f"⚠️ Пропущено наследованных записей: {result['skipped']}")
+    print("💡 Установите STORAGE_BACKEND=sqlite, чтобы бот использовал базу")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+# stats_report.py - Офлайн-отчет по архиву дневной статистики
+import argparse
+from collections import Counter
+
+from config import STATS_ARCHIVE_DIR
+from utils.stats_archive import StatsArchive, archive_report
+
+
+def print_summary(title, summary, top):
+    commands = Counter(summary["commands"])
+    print(f"{title}: дней {summary['days']}, команд {sum(commands.values())}, "
+          f"уникальных ~{summary['unique_users'].count()}")
+    for command, count in commands.most_common(top):
+        print(f"    /{command}: {count}")
+    for category, count in Counter(summary["categories"]).most_common(top):
+        print(f"    категория {category}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отчет по архиву дневной статистики бота")
+    parser.add_argument("--archive-dir", default=STATS_ARCHIVE_DIR, help="каталог архива")
+    parser.add_argument("--from", dest="start", help="первая дата (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="end", help="последняя дата (YYYY-MM-DD)")
+    parser.add_argument("--top", type=int, default=5, help="сколько команд и категорий показывать")
+    args = parser.parse_args()
+
+    archive = StatsArchive(args.archive_dir)
+    if not archive.months():
+        print(f"⚠️ Архив {args.archive_dir} пуст")
+        return
+
+    report = archive_report(archive, args.start, args.end)
+    for month, summary in sorted(report["months"].items()):
+        print_summary(f"📅 {month}", summary, args.top)
+    print_summary("📊 Итого", report["total"], args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# tests/utils/test_cohorts.py - Тесты матрицы удержания по когортам
+
+import csv
+import io
+import time
+from unittest.mock import AsyncMock
+
+import pytest
+
+from handlers.stats import BotStats
+from utils.cohorts import CohortRetention, week_start
+from utils.storage import JsonStatsStorage, SqliteStatsStorage
+
+
+def visit(stats, user_id, day):
+    stats.add_user(user_id, None, None, today=day)
+
+
+class TestCohortRetention:
+    """Тесты CohortRetention"""
+
+    def test_week_start(self):
+        assert week_start("2024-01-03") == "2024-01-01"
+        assert week_start("2024-01-07") == "2024-01-01"
+        assert week_start("2024-01-08") == "2024-01-08"
+
+    def test_counts_first_visit_per_week(self, tmp_path):
+        stats = BotStats(storage=JsonStatsStorage(str(tmp_path / "bot_stats.json")), worker_id=None)
+        visit(stats, 1, "2024-01-01")
+        visit(stats, 1, "2024-01-03")   # та же неделя
+        visit(stats, 1, "2024-01-09")   # +1
+        visit(stats, 1, "2024-01-10")
+        visit(stats, 1, "2024-01-29")   # +4, недели 2-3 пропущены
+        visit(stats, 2, "2024-01-05")
+        visit(stats, 2, "2024-01-16")   # +2
+        visit(stats, 3, "2024-01-08")   # новая когорта
+        visit(stats, 2, "2024-01-02")   # событие из прошлого не учитывается
+
+        cells = stats.stats["cohorts"].cells
+        assert cells == {"2024-01-01": [2, 1, 1, 0, 1], "2024-01-08": [1]}
+        cohort, size, shares = stats.stats["cohorts"].matrix()[0]
+        assert (cohort, size, shares[:3]) == ("2024-01-01", 2, [1.0, 0.5, 0.5])
+
+    @pytest.mark.parametrize("backend", ["json", "sqlite"])
+    def test_persisted_not_rebuilt(self, tmp_path, backend):
+        def make_storage():
+            if backend == "json":
+                return JsonStatsStorage(str(tmp_path / "bot_stats.json"))
+            return SqliteStatsStorage(str(tmp_path / "bot_data.sqlite3"))
+
+        stats = BotStats(storage=make_storage(), worker_id=None)
+        for day in ("2024-01-01", "2024-01-09", "2024-01-17"):
+            visit(stats, 1, day)
+        stats.save_stats()
+
+        reloaded = BotStats(storage=make_storage(), worker_id=None)
+        # Пересборка по first_seen/last_seen потеряла бы неделю +1
+        assert reloaded.stats["cohorts"].cells == {"2024-01-01": [1, 1, 1]}
+
+    def test_backfill_from_users(self):
+        users = {
+            "1": {"first_seen": "2024-01-01", "last_seen": "2024-01-20"},
+            "2": {"first_seen": "2024-01-02", "last_seen": "2024-01-02"},
+            "3": {"first_seen": None, "last_seen": None},
+        }
+        assert CohortRetention.backfill(users).cells == {"2024-01-01": [2, 0, 1]}
+
+    def test_render_and_csv(self):
+        cohorts = CohortRetention.from_dict({"cells": {"2024-01-01": [4, 2, 1], "2024-01-08": [10, 5]}})
+        table = cohorts.render(cohorts=8, weeks=4)
+        assert table.splitlines()[1] == "2024-01-01      4  50%  25%"
+        assert table.splitlines()[2] == "2024-01-08     10  50%"
+
+        rows = list(csv.reader(io.StringIO(cohorts.to_csv())))
+        assert rows[0] == ["cohort", "users", "week_0", "week_1", "week_2"]
+        assert rows[2] == ["2024-01-08", "10", "10", "5", "0"]
+
+    def test_report_does_not_scan_users(self, tmp_path):
+        stats = BotStats(storage=JsonStatsStorage(str(tmp_path / "bot_stats.json")), worker_id=None)
+        for user_id in range(50_000):
+            day = f"2024-0{1 + user_id % 6}-{10 + user_id % 15}"
+            visit(stats, user_id, day)
+        started = time.perf_counter()
+        stats.get_retention()
+        assert time.perf_counter() - started < 0.01
+
+
+class TestRetentionCommand:
+    @pytest.mark.asyncio
+    async def test_table_and_csv(self, tmp_path, monkeypatch, mock_update, mock_context):
+        from handlers import stats as stats_module
+
+        stats = BotStats(storage=JsonStatsStorage(str(tmp_path / "bot_stats.json")), worker_id=None)
+        visit(stats, 1, "2024-01-01")
+        visit(stats, 1, "2024-01-08")
+        monkeypatch.setattr(stats_module, "bot_stats", stats)
+        monkeypatch.setattr(stats_module, "ADMIN_ID", mock_update.effective_user.id)
+        mock_update.message.reply_text = AsyncMock()
+        mock_update.message.reply_document = AsyncMock()
+
+        mock_context.args = []
+        await stats_module.retention_command(mock_update, mock_context)
+        assert "2024-01-01      1 100%" in mock_update.message.reply_text.call_args.args[0]
+
+        mock_context.args = ["csv"]
+        await stats_module.retention_command(mock_update, mock_context)
+        document = mock_update.message.reply_document.call_args.kwargs["document"]
+        assert document.getvalue().decode("utf-8").splitlines()[1] == "2024-01-01,1,1,1"
@@ -0,0 +1,188 @@
+# tests/utils/test_compact_reactions.py - Тесты компактного хранилища реакций
+
+import json
+import sys
+import time
+
+import pytest
+
+from utils.compact_reactions import CompactReactionStore
+from utils.database import ReactionsDB
+
+
+class TestCompactReactionStore:
+    """Тесты CompactReactionStore"""
+
+    def test_set_get_and_counts(self):
+        """Смена реакции переносит счетчик и возвращает прежнее значение"""
+        store = CompactReactionStore()
+        assert store.set(1, "post", "❤️") is None
+        assert store.set(2, "post", "❤️") is None
+        assert store.set(1, "post", "👍") == "❤️"
+
+        assert len(store) == 2
+        assert store.get(1, "post") == "👍"
+        assert store.get(3, "post") is None
+        assert store.get(1, "missing") is None
+        assert store.post_reactions("post") == {"❤️": 1, "👍": 1}
+        assert store.post_reactions("missing") == {}
+
+    def test_unknown_emoji_and_foreign_user_keys(self):
+        """Новые эмодзи и нечисловые id пользователей тоже хранятся"""
+        store = CompactReactionStore()
+        store.set(1, "post", "❤️")
+        store.set("test_user", "post", "🔥")
+
+        assert store.get("test_user", "post") == "🔥"
+        assert store.post_reactions("post") == {"❤️": 1, "🔥": 1}
+        assert store.to_dict() == {"1": {"post": "❤️"}, "test_user": {"post": "🔥"}}
+
+    def test_user_keys_round_trip_without_collisions(self):
+        """Отрицательные, с ведущими нулями и вне int64 ключи не сливаются с числовыми"""
+        keys = ["alice", "-1", "1", "007", "7", "0", str(2 ** 63 - 1), str(2 ** 63), "-9" * 30, "١٢", "²"]
+        store = CompactReactionStore()
+        for i, key in enumerate(keys):
+            store.set(key, "p1", store.emojis[i % len(store.emojis)])
+
+        for i, key in enumerate(keys):
+            assert store.get(key, "p1") == store.emojis[i % len(store.emojis)]
+        assert store.to_dict() == {key: {"p1": store.emojis[i % len(store.emojis)]} for i, key in enumerate(keys)}
+        assert sum(store.post_reactions("p1").values()) == len(keys)
+        assert CompactReactionStore.from_dict(store.to_dict()).to_dict() == store.to_dict()
+
+    def test_round_trip_with_legacy_entries(self):
+        """Служебные записи старого формата сохраняются как есть"""
+        data = {
+            "reactions": {"heart": 1},
+            "reaction_users": {"heart": ["1"]},
+            "1": {"a": "❤️", "b": "😂"},
+            "2": {"a": "❤️"},
+        }
+        store = CompactReactionStore.from_dict(data)
+
+        assert store.to_dict() == data
+        assert store.post_reactions("a") == {"❤️": 2}
+        assert store.post_reactions("heart") == {}
+
+    def test_table_grows_past_initial_capacity(self):
+        """Хеш-таблица расширяется, строки остаются доступны"""
+        store = CompactReactionStore()
+        for user in range(5000):
+            store.set(user, f"p{user % 7}", "👍")
+
+        assert len(store) == 5000
+        assert all(store.get(user, f"p{user % 7}") == "👍" for user in range(0, 5000, 97))
+        before = store.post_reactions("p3")
+        store.rebuild_counts()
+        assert store.post_reactions("p3") == before
+
+
+class TestReactionsDBCompactMemory:
+    """ReactionsDB с compact_memory=True"""
+
+    def test_same_behaviour_as_dict_layout(self, tmp_path):
+        """Данные, индекс и журнал работают так же, как с dict"""
+        db_file = str(tmp_path / "reactions_data.json")
+        with open(db_file, "w", encoding="utf-8") as f:
+            json.dump({"reactions": {"heart": 1}, "1": {"old": "😂"}}, f)
+
+        db = ReactionsDB(db_file, compact_memory=True)
+        assert isinstance(db.data, CompactReactionStore)
+        db.add_reaction(1, "post", "❤️")
+        db.add_reaction(2, "post", "❤️")
+        db.add_reaction(2, "post", "👍")
+        assert db.get_reaction(2, "post") == "👍"
+        assert db.get_post_reactions("post") == {"❤️": 1, "👍": 1}
+        db.compact(wait=True)
+        db.close()
+
+        reloaded = ReactionsDB(db_file, compact_memory=False)
+        assert reloaded.data == {
+            "reactions": {"heart": 1},
+            "1": {"old": "😂", "post": "❤️"},
+            "2": {"post": "👍"},
+        }
+        reloaded.close()
+
+    def test_compaction_streams_from_columns(self, tmp_path, monkeypatch):
+        """Компактизация пишет снапшот из копии колонок, не разворачивая to_dict"""
+        db_file = str(tmp_path / "reactions_data.json")
+        db = ReactionsDB(db_file, compact_memory=True, compact_every=50)
+        monkeypatch.setattr(CompactReactionStore, "to_dict", lambda self: pytest.fail("to_dict при компактизации"))
+        for user_id in range(120):
+            db.add_reaction(user_id % 40, f"p{user_id % 7}", "❤️" if user_id % 2 else "👍")
+        db.add_reaction("test_user", "p1", "🔥")
+        db.compact(wait=True)
+        db.close()
+        monkeypatch.undo()
+
+        assert db.storage.snapshot_versions()
+        reloaded = ReactionsDB(db_file, compact_memory=False)
+        assert reloaded.data == db.data.to_dict()
+
+    def test_copy_rows_groups_by_user(self):
+        """Снимок колонок отдает по одной записи на пользователя"""
+        store = CompactReactionStore.from_dict({"2": {"a": "❤️"}, "x": {"a": "🔥"}, "agg": {"n": 1}})
+        store.set(1, "b", "👍")
+        store.set(2, "b", "👍")
+        rows = store.copy_rows()
+        store.set(3, "a", "❤️")  # копия не меняется вместе с хранилищем
+
+        items = list(rows.items())
+        assert len(items) == 4 and len(rows) == 4
+        assert dict(items) == {"1": {"b": "👍"}, "2": {"a": "❤️", "b": "👍"}, "x": {"a": "🔥"}, "agg": {"n": 1}}
+
+    def test_full_rewrite_mode(self, tmp_path):
+        """Без журнала снапшот пишется из компактного хранилища"""
+        db_file = str(tmp_path / "reactions_data.json")
+        db = ReactionsDB(db_file, use_log=False, compact_memory=True)
+        db.add_reaction(1, "post", "❤️")
+        db.close()
+
+        with open(db_file, encoding="utf-8") as f:
+            assert json.load(f) == {"1": {"post": "❤️"}}
+
+
+def _deep_size(data):
+    """Размер вложенного dict вместе с ключами и значениями (без повторов)"""
+    seen = set()
+    total = 0
+    stack = [data]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+    return total
+
+
+@pytest.mark.slow
+class TestCompactMemoryBenchmark:
+    """Бенчмарк памяти: 1M реакций в dict и в CompactReactionStore"""
+
+    def test_one_million_reactions(self):
+        users, posts = 200_000, 500
+        emojis = ["❤️", "👍", "😂", "🙏"]
+        total = 1_000_000
+
+        start = time.perf_counter()
+        data = {}
+        for i in range(total):
+            data.setdefault(str(i % users), {})[f"post_{i * 7 % posts}_{i // users}"] = emojis[i % 4]
+        dict_time = time.perf_counter() - start
+        dict_bytes = _deep_size(data)
+
+        start = time.perf_counter()
+        store = CompactReactionStore.from_dict(data)
+        compact_time = time.perf_counter() - start
+        compact_bytes = store.memory_usage()
+
+        print(f"dict: {dict_bytes / total:.1f} B/реакция ({dict_time:.2f}s), "
+              f"compact: {compact_bytes / total:.1f} B/реакция ({compact_time:.2f}s)")
+
+        assert len(store) == total
+        assert compact_bytes * 3 < dict_bytes
@@ -0,0 +1,254 @@
+# tests/utils/test_database.py - Тесты базы данных реакций
+
+import json
+import os
+import time
+
+import pytest
+
+from utils.database import ReactionsDB
+
+
+@pytest.fixture
+def db_file(tmp_path):
+    """Путь к временному файлу базы реакций"""
+    return str(tmp_path / "reactions_data.json")
+
+
+class TestReactionLog:
+    """Тесты режима журнала добавлений"""
+
+    def test_add_reaction_appends_one_line(self, db_file):
+        """Каждая реакция - одна компактная строка, снапшот не переписывается"""
+        db = ReactionsDB(db_file)
+        db.add_reaction(1, "post", "❤️")
+        db.add_reaction(2, "post", "👍")
+        db.close()
+
+        assert not os.path.exists(db_file)
+        with open(db.storage.log_file, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        assert len(lines) == 2
+        assert json.loads(lines[0]) == {"u": "1", "p": "post", "r": "❤️"}
+
+    def test_state_rebuilt_from_snapshot_and_log(self, db_file):
+        """Состояние восстанавливается из снапшота и хвоста журнала"""
+        with open(db_file, "w", encoding="utf-8") as f:
+            json.dump({"1": {"old": "😂"}}, f)
+
+        db = ReactionsDB(db_file)
+        db.add_reaction(1, "post", "❤️")
+        db.add_reaction(1, "post", "👍")
+        db.close()
+
+        reloaded = ReactionsDB(db_file)
+        assert reloaded.get_reaction(1, "old") == "😂"
+        assert reloaded.get_reaction(1, "post") == "👍"
+
+    def test_truncated_tail_is_skipped(self, db_file):
+        """Оборванная последняя строка журнала не ломает загрузку"""
+        db = ReactionsDB(db_file)
+        db.add_reaction(1, "post", "❤️")
+        db.close()
+        with open(db.storage.log_file, "a", encoding="utf-8") as f:
+            f.write('{"u":"2","p":"po')
+
+        reloaded = ReactionsDB(db_file)
+        assert reloaded.data == {"1": {"post": "❤️"}}
+
+    def test_record_after_truncated_tail_survives_restart(self, db_file):
+        """Запись после оборванной строки не склеивается с ней и переживает перезапуск"""
+        db = ReactionsDB(db_file)
+        db.add_reaction(1, "post", "❤️")
+        db.close()
+        with open(db.storage.log_file, "a", encoding="utf-8") as f:
+            f.write('{"u":"2","p":"po')
+
+        reloaded = ReactionsDB(db_file)
+        reloaded.add_reaction(3, "post", "👍")
+        reloaded.close()
+
+        again = ReactionsDB(db_file)
+        assert again.data == {"1": {"post": "❤️"}, "3": {"post": "👍"}}
+        with open(db.storage.log_file, encoding="utf-8") as f:
+            assert [json.loads(line)["u"] for line in f] == ["1", "3"]
+
+    def test_record_after_unterminated_line_survives_restart(self, db_file):
+        """Целая последняя запись без перевода строки сохраняется"""
+        db = ReactionsDB(db_file)
+        db.close()
+        with open(db.storage.log_file, "w", encoding="utf-8") as f:
+            f.write('{"u":"2","p":"post","r":"😂"}')
+
+        reloaded = ReactionsDB(db_file)
+        reloaded.add_reaction(3, "post", "👍")
+        reloaded.close()
+
+        again = ReactionsDB(db_file)
+        assert again.data == {"2": {"post": "😂"}, "3": {"post": "👍"}}
+
+    def test_compaction_writes_snapshot_and_trims_log(self, db_file):
+        """Компактизация переносит журнал в снапшот"""
+        db = ReactionsDB(db_file, compact_every=3)
+        for user_id in range(5):
+            db.add_reaction(user_id, "post", "❤️")
+        db.close()
+
+        assert db.storage.snapshot_versions() == [1]
+        assert db.storage.segment_versions() == []
+        with open(db.storage.log_file, encoding="utf-8") as f:
+            assert len(f.read().splitlines()) == 2
+
+        reloaded = ReactionsDB(db_file)
+        assert reloaded.data == db.data
+
+    def test_interrupted_compaction_is_replayed(self, db_file):
+        """Журнал прерванной компактизации старого формата применяется при загрузке"""
+        db = ReactionsDB(db_file)
+        db.add_reaction(1, "post", "❤️")
+        db.close()
+        os.replace(db.storage.log_file, db.storage.rotated_log_file)
+
+        reloaded = ReactionsDB(db_file)
+        reloaded.add_reaction(2, "post", "👍")
+        reloaded.compact(wait=True)
+        reloaded.close()
+
+        assert not os.path.exists(reloaded.storage.rotated_log_file)
+        assert ReactionsDB(db_file).data == {"1": {"post": "❤️"}, "2": {"post": "👍"}}
+
+    def test_legacy_mode_rewrites_file(self, db_file):
+        """Без журнала файл переписывается целиком, как раньше"""
+        db = ReactionsDB(db_file, use_log=False)
+        db.add_reaction(1, "post", "❤️")
+
+        assert not os.path.exists(db.storage.log_file)
+        with open(db_file, encoding="utf-8") as f:
+            assert json.load(f) == {"1": {"post": "❤️"}}
+
+
+class TestSnapshotRecovery:
+    """Тесты версионных снапшотов с контрольной суммой"""
+
+    @staticmethod
+    def _fill(db, start, count):
+        for user_id in range(start, start + count):
+            db.add_reaction(user_id, "post", "❤️")
+            db.storage.wait_for_compaction()
+
+    def test_corrupted_snapshot_falls_back_to_previous(self, db_file):
+        """Поврежденный свежий снапшот: откат к предыдущему + сегменты журнала"""
+        db = ReactionsDB(db_file, compact_every=3)
+        self._fill(db, 0, 7)
+        db.close()
+        assert db.storage.snapshot_versions() == [1, 2]
+
+        latest = db.storage.snapshot_file(2)
+        with open(latest, "r+b") as f:
+            f.truncate(os.path.getsize(latest) // 2)
+
+        reloaded = ReactionsDB(db_file)
+        assert reloaded.data == db.data
+        assert reloaded.storage.recovery["snapshot_version"] == 1
+        assert reloaded.storage.recovery["corrupted_snapshots"] == [2]
+        assert reloaded.storage.recovery["seconds"] >= 0
+
+    def test_bit_flip_detected_by_checksum(self, db_file):
+        """Изменение тела снапшота без изменения длины ловится по sha256"""
+        db = ReactionsDB(db_file, compact_every=2)
+        self._fill(db, 0, 4)
+        db.close()
+
+        latest = db.storage.snapshot_file(db.storage.snapshot_versions()[-1])
+        with open(latest, encoding="utf-8") as f:
+            content = f.read()
+        with open(latest, "w", encoding="utf-8") as f:
+            f.write(content.replace('"3"', '"9"'))
+
+        assert ReactionsDB(db_file).data == db.data
+
+    def test_old_snapshots_and_segments_pruned(self, db_file):
+        """Хранятся keep_snapshots снапшотов и сегменты после старейшего"""
+        db = ReactionsDB(db_file, compact_every=2)
+        self._fill(db, 0, 11)
+        db.close()
+
+        assert db.storage.snapshot_versions() == [3, 4, 5]
+        assert db.storage.segment_versions() == [4, 5]
+        assert ReactionsDB(db_file).data == db.data
+
+    def test_partial_base_file_is_kept_aside(self, db_file):
+        """Оборванный файл старого формата не затирается пустыми данными"""
+        with open(db_file, "w", encoding="utf-8") as f:
+            f.write('{"1": {"post": "❤')
+
+        db = ReactionsDB(db_file, use_log=False)
+        db.add_reaction(2, "post", "👍")
+
+        with open(f"{db_file}.corrupt", encoding="utf-8") as f:
+            assert f.read() == '{"1": {"post": "❤'
+
+
+@pytest.mark.slow
+class TestReactionLogBenchmark:
+    """Бенчмарк: стоимость add_reaction не растет вместе с объемом данных"""
+
+    @staticmethod
+    def _measure(db, iterations=500):
+        start = time.perf_counter()
+        for i in range(iterations):
+            db.add_reaction(10**9 + i, "bench", "❤️")
+        return (time.perf_counter() - start) / iterations
+
+    def test_add_reaction_cost_is_flat(self, tmp_path):
+        timings = {}
+        for size in (1_000, 100_000):
+            db = ReactionsDB(str(tmp_path / f"log_{size}.json"), compact_every=0)
+            db.data = {str(u): {"p": "👍"} for u in range(size)}
+            timings[size] = self._measure(db)
+            db.close()
+
+        legacy = ReactionsDB(str(tmp_path / "legacy.json"), use_log=False)
+        legacy.data = {str(u): {"p": "👍"} for u in range(100_000)}
+        legacy_time = self._measure(legacy, iterations=5)
+
+        print(f"log @1k: {timings[1_000] * 1e6:.1f}µs, log @100k: {timings[100_000] * 1e6:.1f}µs, "
+              f"full rewrite @100k: {legacy_time * 1e6:.1f}µs")
+
+        assert timings[100_000] < timings[1_000] * 5
+        assert timings[100_000] < legacy_time
+
+
+class TestPostIndex:
+    """Тесты индекса реакций по постам"""
+
+    def test_counts_follow_reaction_changes(self, db_file):
+        """Смена реакции уменьшает счетчик старого эмодзи"""
+        db = ReactionsDB(db_file)
+        db.add_reaction(1, "post", "❤️")
+        db.add_reaction(2, "post", "❤️")
+        db.add_reaction(1, "post", "👍")
+        db.add_reaction(2, "post", "👍")
+        db.add_reaction(2, "post", "👍")
+
+        assert db.get_post_reactions("post") == {"👍": 2}
+        assert db.get_post_reactions("missing") == {}
+        db.close()
+
+    def test_index_rebuilt_from_primary_data(self, db_file):
+        """Индекс восстанавливается из данных и пропускает служебные ключи"""
+        with open(db_file, "w", encoding="utf-8") as f:
+            json.dump({
+                "reactions": {"heart": 1},
+                "reaction_users": {"heart": ["1"]},
+                "1": {"post": "❤️"},
+                "2": {"post": "❤️", "other": "😂"},
+            }, f)
+
+        db = ReactionsDB(db_file)
+        assert db.get_post_reactions("post") == {"❤️": 2}
+        assert db.get_post_reactions("heart") == {}
+
+        db.data["3"] = {"post": "👍"}
+        db.rebuild_post_index()
+        assert db.get_post_reactions("post") == {"❤️": 2, "👍": 1}
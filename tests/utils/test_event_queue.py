@@ -0,0 +1,135 @@
+# tests/utils/test_event_queue.py - Тесты очереди событий статистики
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from handlers.stats import BotStats
+from utils.event_queue import EventPipeline
+from utils.storage import JsonStatsStorage
+
+
+@pytest.fixture
+def stats(tmp_path):
+    """BotStats во временном файле без фоновой записи"""
+    return BotStats(storage=JsonStatsStorage(str(tmp_path / "bot_stats.json")))
+
+
+class TestEventPipeline:
+    """Тесты EventPipeline"""
+
+    def test_events_applied_in_batches(self):
+        """Накопившиеся события применяются одной пачкой"""
+        batches = []
+        gate = threading.Event()
+
+        def apply_batch(events):
+            gate.wait(5)
+            batches.append(events)
+
+        pipeline = EventPipeline(apply_batch, batch_size=100)
+        pipeline.publish(0)
+        for i in range(1, 50):
+            pipeline.publish(i)
+        assert pipeline.queue_depth == 50
+        gate.set()
+        pipeline.flush(5)
+
+        assert [event for batch in batches for event in batch] == [(i,) for i in range(50)]
+        assert len(batches) <= 3
+        metrics = pipeline.get_metrics()
+        assert metrics["queue_depth"] == 0
+        assert metrics["processed"] == 50
+        assert metrics["max_lag_ms"] > 0
+        pipeline.close()
+
+    def test_publish_from_other_event_loops(self):
+        """publish работает из любого потока и его event loop"""
+        received = []
+        pipeline = EventPipeline(received.extend)
+
+        async def handler(i):
+            pipeline.publish(i)
+
+        threads = [threading.Thread(target=asyncio.run, args=(handler(i),)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        pipeline.flush(5)
+
+        assert sorted(received) == [(i,) for i in range(10)]
+        pipeline.close()
+
+    def test_errors_do_not_stop_aggregator(self):
+        calls = []
+
+        def apply_batch(events):
+            calls.append(events)
+            if len(calls) == 1:
+                raise ValueError("сбой")
+
+        pipeline = EventPipeline(apply_batch)
+        pipeline.publish(1)
+        pipeline.flush(5)
+        pipeline.publish(2)
+        pipeline.flush(5)
+
+        assert pipeline.get_metrics()["errors"] == 1
+        assert calls[-1] == [(2,)]
+        pipeline.close()
+
+    def test_close_drains_queue(self):
+        received = []
+        pipeline = EventPipeline(received.extend)
+        for i in range(100):
+            pipeline.publish(i)
+        pipeline.close()
+
+        assert len(received) == 100
+        pipeline.publish(101)
+        assert len(received) == 100
+
+
+class TestStatsEvents:
+    """BotStats.apply_events"""
+
+    def test_apply_events(self, stats):
+        day = time.mktime((2026, 5, 1, 12, 0, 0, 0, 0, -1))
+        stats.apply_events([
+            (day, 1, "alice", "Alice", "start", False, None),
+            (day, 1, None, None, None, True, "tarot"),
+            (day + 86400, 2, "bob", "Bob", "help", True, None),
+        ])
+
+        assert stats.stats["users"]["1"]["first_seen"] == "2026-05-01"
+        assert stats.stats["users"]["1"]["message_count"] == 1
+        assert stats.stats["users"]["2"]["last_seen"] == "2026-05-02"
+        assert stats.stats["commands"] == {"start": 1, "help": 1}
+        assert stats.unique_users(["2026-05-02"]) == 1
+        assert stats.category_uniques("tarot", ["2026-05-01", "2026-05-02"]) == 1
+        assert stats.stats["total_messages"] == 2
+
+
+@pytest.mark.slow
+class TestPublishCost:
+    """Бенчмарк: публикация события стоит микросекунды"""
+
+    def test_publish_is_cheap(self, stats):
+        pipeline = EventPipeline(stats.apply_events)
+        pipeline.publish(time.time(), 0, None, None, "warmup", False, None)
+        pipeline.flush(5)
+
+        iterations = 20_000
+        start = time.perf_counter()
+        for i in range(iterations):
+            pipeline.publish(time.time(), i % 1000, None, None, "start", True, None)
+        per_event = (time.perf_counter() - start) / iterations
+        pipeline.flush(30)
+
+        print(f"publish: {per_event * 1e6:.1f}µs/событие, {pipeline.get_metrics()}")
+        assert stats.stats["commands"]["start"] == iterations
+        assert per_event < 100e-6
+        pipeline.close()
@@ -0,0 +1,134 @@
+# tests/utils/test_hyperloglog.py - Тесты HyperLogLog и уникальных пользователей статистики
+
+import json
+
+import pytest
+
+from handlers.stats import BotStats
+from utils.hyperloglog import HyperLogLog
+from utils.storage import JsonStatsStorage, SqliteStatsStorage
+
+
+class TestHyperLogLog:
+    """Тесты HyperLogLog"""
+
+    @pytest.mark.parametrize("cardinality", [10_000, 100_000])
+    def test_accuracy(self, cardinality):
+        """Оценка в пределах трех стандартных ошибок (~7% при p=11)"""
+        sketch = HyperLogLog(11)
+        for user_id in range(cardinality):
+            sketch.add(user_id)
+        assert abs(sketch.count() - cardinality) / cardinality < 3 * 1.04 / 2 ** 5.5
+
+    def test_small_sets_are_sparse_and_exact(self):
+        sketch = HyperLogLog(11)
+        for user_id in [1, 2, 3, 2, 1]:
+            sketch.add(user_id)
+        assert isinstance(sketch.registers, dict)
+        assert sketch.count() == 3
+        assert HyperLogLog().count() == 0
+
+    def test_densify(self):
+        sketch = HyperLogLog(8)
+        for user_id in range(1000):
+            sketch.add(user_id)
+        assert isinstance(sketch.registers, bytearray)
+        assert len(sketch.registers) == 256
+
+    def test_merge_is_union(self):
+        """Объединение скетчей == скетч объединения множеств"""
+        monday, tuesday, both = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        for user_id in range(3000):
+            monday.add(user_id)
+            both.add(user_id)
+        for user_id in range(2000, 6000):
+            tuesday.add(user_id)
+            both.add(user_id)
+
+        week = HyperLogLog.union([monday, tuesday])
+        assert week.registers == both.registers
+        assert monday.count() < week.count()
+        with pytest.raises(ValueError):
+            monday.merge(HyperLogLog(10))
+
+    @pytest.mark.parametrize("cardinality", [5, 5000])
+    def test_serialization_roundtrip(self, cardinality):
+        sketch = HyperLogLog()
+        for user_id in range(cardinality):
+            sketch.add(user_id)
+        restored = HyperLogLog.from_json(sketch.to_json())
+        assert restored.count() == sketch.count()
+        assert type(restored.registers) is type(sketch.registers)
+        with pytest.raises(ValueError):
+            HyperLogLog.from_json("[1, 2, 3]")
+
+
+class TestStatsUniques:
+    """Уникальные пользователи в BotStats"""
+
+    def test_weekly_uniques_merge_days(self, tmp_path):
+        stats = BotStats(storage=JsonStatsStorage(str(tmp_path / "bot_stats.json")))
+        days = [f"2026-05-0{i}" for i in range(1, 8)]
+        for index, day in enumerate(days):
+            # Каждый день 100 пользователей, половина - вчерашние
+            for user_id in range(index * 50, index * 50 + 100):
+                stats.add_command(user_id, "start", day)
+            stats.add_category(index, "tarot", day)
+
+        assert abs(stats.unique_users(days[:1]) - 100) <= 5
+        assert abs(stats.unique_users(days) - 400) <= 20
+        assert abs(stats.command_uniques("start", days[:2]) - 150) <= 8
+        assert stats.category_uniques("tarot", days) == 7
+        assert stats.command_uniques("help", days) == 0
+        with pytest.raises(ValueError):
+            stats.unique_users(days, exact=True)
+
+    def test_exact_debug_mode(self, tmp_path):
+        stats = BotStats(storage=JsonStatsStorage(str(tmp_path / "bot_stats.json")), exact_uniques=True)
+        stats.add_command(1, "start", "2026-05-01")
+        stats.add_command(2, "start", "2026-05-02")
+        stats.add_command(1, "help", "2026-05-02")
+        assert stats.unique_users(["2026-05-01", "2026-05-02"], exact=True) == 2
+        stats.save_stats()
+
+        reloaded = BotStats(storage=stats.storage, exact_uniques=True)
+        assert reloaded.stats["daily_stats"]["2026-05-02"]["users"] == {1, 2}
+
+    @pytest.mark.parametrize("backend", ["json", "sqlite"])
+    def test_sketches_survive_reload(self, tmp_path, backend):
+        if backend == "json":
+            make_storage = lambda: JsonStatsStorage(str(tmp_path / "bot_stats.json"))
+        else:
+            make_storage = lambda: SqliteStatsStorage(str(tmp_path / "bot_data.sqlite3"))
+        stats = BotStats(storage=make_storage())
+        for user_id in range(500):
+            stats.add_command(user_id, "start", "2026-05-01")
+        stats.add_category(7, "runes", "2026-05-01")
+        stats.save_stats()
+        expected = stats.unique_users(["2026-05-01"])
+        stats.storage.close()
+
+        reloaded = BotStats(storage=make_storage())
+        assert reloaded.unique_users(["2026-05-01"]) == expected
+        assert reloaded.command_uniques("start", ["2026-05-01"]) == expected
+        assert reloaded.category_uniques("runes", ["2026-05-01"]) == 1
+        assert reloaded.stats["daily_stats"]["2026-05-01"]["categories"]["runes"] == 1
+        assert "users" not in reloaded.stats["daily_stats"]["2026-05-01"]
+        reloaded.storage.close()
+
+    def test_legacy_user_lists_converted(self, tmp_path):
+        """Дни старого формата со списками user_id переводятся в скетчи"""
+        stats_file = tmp_path / "bot_stats.json"
+        stats_file.write_text(json.dumps({
+            "users": {},
+            "commands": {"start": 3},
+            "daily_stats": {"2026-05-01": {"commands": {"start": 3}, "users": [1, 2, 3]}},
+            "total_messages": 0,
+        }), encoding="utf-8")
+
+        stats = BotStats(storage=JsonStatsStorage(str(stats_file)))
+        day = stats.stats["daily_stats"]["2026-05-01"]
+        assert "users" not in day
+        assert stats.unique_users(["2026-05-01"]) == 3
+        stats.add_command(4, "start", "2026-05-01")
+        assert stats.unique_users(["2026-05-01"]) == 4
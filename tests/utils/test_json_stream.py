@@ -0,0 +1,145 @@
+# tests/utils/test_json_stream.py - Тесты потоковой загрузки JSON
+
+import io
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from utils.database import ReactionsDB
+from utils.json_stream import JsonObjectStream
+from utils.storage import JsonStatsStorage
+
+
+LEGACY_DATA = {
+    "reactions": {"heart": 2, "like": 0},
+    "reaction_users": {"heart": ["1", "2"], "like": []},
+    "1": {"post_1": "❤️", "post_2": "😂"},
+    "2": {"post_1": "❤️"},
+}
+
+
+class TestJsonObjectStream:
+    """Тесты JsonObjectStream"""
+
+    @pytest.mark.parametrize("chunk_size", [1, 3, 7, 1 << 16])
+    def test_items_match_json_load(self, chunk_size):
+        """Разбор по порциям любого размера совпадает с json.loads"""
+        data = {
+            "a": 1234567890,
+            "b": [1.5, -2e10, True, None, "строка \\\" с экранированием"],
+            "c": {"nested": {"deep": "😂"}},
+            "": {},
+        }
+        text = json.dumps(data, ensure_ascii=False, indent=2)
+
+        stream = JsonObjectStream(io.StringIO(text), chunk_size=chunk_size)
+        assert dict(stream.iter_items()) == data
+
+    def test_nested_keys_streamed(self):
+        """Вложенный объект можно читать по ключам"""
+        text = '{"users": {"1": {"x": 1}, "2": {"x": 2}}, "total": 3}'
+        stream = JsonObjectStream(io.StringIO(text), chunk_size=4)
+
+        result = {}
+        for key in stream.iter_keys():
+            if key == "users":
+                result[key] = [user for user, _ in stream.iter_items()]
+            else:
+                result[key] = stream.decode_value()
+        assert result == {"users": ["1", "2"], "total": 3}
+
+    def test_empty_and_broken_objects(self):
+        """Пустой объект разбирается, оборванный - дает ValueError"""
+        assert list(JsonObjectStream(io.StringIO(" {} ")).iter_items()) == []
+        with pytest.raises(ValueError):
+            list(JsonObjectStream(io.StringIO('{"1": {"post": "❤'), chunk_size=4).iter_items())
+
+
+class TestStreamingLoad:
+    """Загрузка файлов реакций и статистики потоком"""
+
+    @pytest.mark.parametrize("compact_memory", [False, True])
+    def test_legacy_mixed_layout(self, tmp_path, compact_memory):
+        """Служебные ключи main_bot.py не мешают реакциям пользователей"""
+        db_file = str(tmp_path / "reactions_data.json")
+        with open(db_file, "w", encoding="utf-8") as f:
+            json.dump(LEGACY_DATA, f, ensure_ascii=False, indent=2)
+
+        db = ReactionsDB(db_file, compact_memory=compact_memory)
+        assert db.get_post_reactions("post_1") == {"❤️": 2}
+        assert db.get_reaction(1, "post_2") == "😂"
+        assert dict(db.data.items()) == LEGACY_DATA
+        assert db.storage.recovery["seconds"] >= 0
+        db.close()
+
+    def test_stats_file(self, tmp_path):
+        """Статистика читается так же, как json.load"""
+        stats = {
+            "users": {"1": {"commands_used": {"start": 2}}, "2": {"commands_used": {}}},
+            "commands": {"start": 2},
+            "daily_stats": {"2026-01-01": {"users": ["1"], "commands": {"start": 2}}},
+            "total_messages": 5,
+            "start_date": "2026-01-01T00:00:00",
+        }
+        stats_file = tmp_path / "bot_stats.json"
+        stats_file.write_text(json.dumps(stats, indent=2), encoding="utf-8")
+
+        assert JsonStatsStorage(str(stats_file)).load() == stats
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Загрузка в отдельном процессе: пиковый RSS меряется для каждого способа отдельно
+LOADER = textwrap.dedent("""
+    import json, sys, time
+    from utils.storage import JsonReactionStorage
+    from utils.compact_reactions import CompactReactionStore
+
+    mode, path = sys.argv[1], sys.argv[2]
+    start = time.perf_counter()
+    if mode == "json.load":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    else:
+        factory = CompactReactionStore if mode == "stream+compact" else dict
+        data = JsonReactionStorage(path, use_log=False).load(factory)
+    elapsed = time.perf_counter() - start
+    # VmHWM, а не ru_maxrss: ru_maxrss наследует пик родителя через fork
+    with open("/proc/self/status") as f:
+        peak_kb = next(int(line.split()[1]) for line in f if line.startswith("VmHWM"))
+    print(json.dumps({"seconds": elapsed, "peak_kb": peak_kb}))
+""")
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(sys.platform != "linux", reason="VmHWM есть только в /proc Linux")
+class TestStreamingLoadBenchmark:
+    """Бенчмарк: пиковый RSS и время загрузки 1M реакций"""
+
+    def test_peak_rss_and_load_time(self, tmp_path):
+        db_file = tmp_path / "reactions_data.json"
+        emojis = ["❤️", "👍", "😂", "🙏"]
+        with open(db_file, "w", encoding="utf-8") as f:
+            f.write('{"reactions": {"heart": 1}')
+            for user in range(200_000):
+                posts = {f"post_{(user + i) % 500}": emojis[(user + i) % 4] for i in range(5)}
+                f.write(f',"{user}":' + json.dumps(posts, ensure_ascii=False))
+            f.write("}")
+
+        results = {}
+        for mode in ("json.load", "stream", "stream+compact"):
+            output = subprocess.run(
+                [sys.executable, "-c", LOADER, mode, str(db_file)],
+                capture_output=True, text=True, check=True, cwd=ROOT,
+            ).stdout
+            results[mode] = json.loads(output.splitlines()[-1])
+
+        for mode, result in results.items():
+            print(f"{mode}: {result['seconds']:.2f}s, пиковый RSS {result['peak_kb'] / 1024:.0f} МБ")
+
+        assert results["stream"]["peak_kb"] < results["json.load"]["peak_kb"]
+        assert results["stream+compact"]["peak_kb"] < results["stream"]["peak_kb"]
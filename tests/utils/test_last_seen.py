@@ -0,0 +1,109 @@
+# tests/utils/test_last_seen.py - Тесты roaring bitmap и индекса last_seen
+
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from handlers.stats import BotStats
+from utils.bitmap import ARRAY_LIMIT, RoaringBitmap
+from utils.last_seen import LastSeenIndex
+from utils.storage import JsonStatsStorage
+
+
+class TestRoaringBitmap:
+    """Тесты RoaringBitmap"""
+
+    def test_matches_set(self):
+        """Случайные добавления и удаления ведут себя как set"""
+        rng = random.Random(7)
+        bitmap, expected = RoaringBitmap(), set()
+        for _ in range(20_000):
+            value = rng.choice([rng.randrange(70_000), rng.randrange(10 ** 10)])
+            if rng.random() < 0.7:
+                assert bitmap.add(value) == (value not in expected)
+                expected.add(value)
+            else:
+                assert bitmap.discard(value) == (value in expected)
+                expected.discard(value)
+        assert len(bitmap) == len(expected)
+        assert list(bitmap) == sorted(expected)
+        assert all(value in bitmap for value in list(expected)[:1000])
+
+    def test_dense_container_becomes_bitmap(self):
+        bitmap = RoaringBitmap(range(ARRAY_LIMIT + 1))
+        assert isinstance(bitmap.containers[0], bytearray)
+        assert bitmap.memory_usage() == 8192
+        assert bitmap.discard(5) and 5 not in bitmap
+        assert len(bitmap) == ARRAY_LIMIT
+        assert list(bitmap)[:6] == [0, 1, 2, 3, 4, 6]
+
+    def test_sparse_values_stay_arrays(self):
+        bitmap = RoaringBitmap([1, 3, 1 << 40])
+        assert bitmap.memory_usage() == 6
+        assert bitmap.discard(1 << 40)
+        assert list(bitmap.containers) == [0]
+
+
+class TestLastSeenIndex:
+    """Тесты LastSeenIndex"""
+
+    def test_move_between_days(self):
+        now = datetime(2026, 3, 10)
+        index = LastSeenIndex()
+        index.move(1, None, "2026-03-01")
+        index.move(2, None, "2026-03-09")
+        index.move("unknown", None, "2026-03-10")
+        assert index.count_since(7, now) == 2
+
+        index.move(1, "2026-03-01", "2026-03-10")
+        index.move(1, "2026-03-10", "2026-03-10")
+        assert index.count_since(0, now) == 2
+        assert sorted(index.users_since(7, now), key=str) == [1, 2, "unknown"]
+        assert "2026-03-01" not in index.days
+
+    def test_bot_stats_uses_index(self, tmp_path):
+        stats = BotStats(storage=JsonStatsStorage(str(tmp_path / "bot_stats.json")))
+        now = datetime.now()
+        for user_id in range(100):
+            stats.add_user(user_id, moment=now - timedelta(days=user_id % 20))
+        stats.add_user(15, moment=now)
+        assert stats.get_active_users(7) == 40 + 1
+        stats.save_stats()
+
+        reloaded = BotStats(storage=stats.storage)
+        assert reloaded.get_active_users(7) == 41
+        assert reloaded.get_active_users(30) == 100
+
+
+@pytest.mark.slow
+class TestLastSeenBenchmark:
+    """Бенчмарк get_active_users(7/30) на миллионе пользователей"""
+
+    def test_million_users(self):
+        now = datetime.now()
+        days = [(now - timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(90)]
+        users = {
+            str(1_000_000_000 + i): {"last_seen": days[i % 90]}
+            for i in range(1_000_000)
+        }
+        started = time.perf_counter()
+        index = LastSeenIndex.from_users(users)
+        build = time.perf_counter() - started
+
+        for period in (7, 30):
+            started = time.perf_counter()
+            for _ in range(100):
+                active = index.count_since(period, now)
+            per_call = (time.perf_counter() - started) / 100
+
+            cutoff = (now - timedelta(days=period)).strftime('%Y-%m-%d')
+            started = time.perf_counter()
+            expected = sum(1 for user in users.values() if user["last_seen"] >= cutoff)
+            scan = time.perf_counter() - started
+
+            print(f"get_active_users({period}): индекс {per_call * 1e6:.0f}µs, обход {scan * 1e3:.0f}ms")
+            assert active == expected
+            assert per_call * 100 < scan
+        print(f"построение {build:.1f}s, данные корзин {index.memory_usage() / 1e6:.1f} МБ")
@@ -0,0 +1,108 @@
+# tests/utils/test_latency.py - Тесты гистограмм времени обработчиков
+
+import random
+import tracemalloc
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler
+
+from utils.latency import GROWTH, LatencyHistogram, LatencyRecorder, instrument_handlers
+
+
+class TestLatencyHistogram:
+    """Тесты LatencyHistogram"""
+
+    def test_percentiles_within_bucket_error(self):
+        rng = random.Random(3)
+        samples = [rng.lognormvariate(3, 1) / 1000 for _ in range(20_000)]
+        histogram = LatencyHistogram()
+        for seconds in samples:
+            histogram.record(seconds)
+
+        ordered = sorted(samples)
+        for q in (50, 95, 99):
+            exact = ordered[int(len(ordered) * q / 100)] * 1000
+            assert exact <= histogram.percentile(q) <= exact * GROWTH * 1.01
+        assert histogram.count == len(samples)
+        assert histogram.max == pytest.approx(ordered[-1] * 1000)
+
+    def test_merge_equals_combined(self):
+        first, second, combined = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+        for i in range(1, 500):
+            (first if i % 2 else second).record(i / 1000)
+            combined.record(i / 1000)
+        merged = LatencyHistogram().merge(first).merge(second)
+        assert merged.counts == combined.counts
+        assert merged.summary() == combined.summary()
+
+    def test_extremes(self):
+        histogram = LatencyHistogram()
+        assert histogram.percentile(99) == 0.0
+        histogram.record(0)
+        histogram.record(10_000)
+        assert histogram.percentile(50) == pytest.approx(0.1 * GROWTH)
+        assert histogram.percentile(100) == 10_000_000
+
+    def test_record_does_not_allocate(self):
+        histogram = LatencyHistogram()
+        histogram.record(0.01)
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        for i in range(10_000):
+            histogram.record((i % 300) / 1000)
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        grown = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+        assert grown < 4096
+
+
+class TestInstrumentHandlers:
+    """Обертка обработчиков приложения"""
+
+    @pytest.mark.asyncio
+    async def test_commands_and_callback_prefixes(self):
+        application = Application.builder().token("123:TEST").build()
+        start = AsyncMock()
+        callback = AsyncMock(side_effect=ValueError("сбой"))
+        application.add_handler(CommandHandler(["start", "begin"], start))
+        application.add_handler(CallbackQueryHandler(callback))
+        recorder = LatencyRecorder()
+
+        assert instrument_handlers(application, recorder) == 2
+        assert instrument_handlers(application, recorder) == 0
+
+        command_handler, callback_handler = application.handlers[0]
+        await command_handler.callback(Mock(), Mock())
+        query = Mock()
+        query.callback_query.data = "reaction_5_❤️"
+        with pytest.raises(ValueError):
+            await callback_handler.callback(query, Mock())
+
+        start.assert_awaited_once()
+        assert set(recorder.histograms) == {"/begin", "cb:reaction"}
+        assert recorder.summary()["cb:reaction"]["count"] == 1
+
+    def test_key_limit(self):
+        recorder = LatencyRecorder(max_keys=2)
+        for key in ("a", "b", "c", "d"):
+            recorder.record(key, 0.001)
+        assert set(recorder.histograms) == {"a", "b", "other"}
+        assert recorder.get("other").count == 2
+
+
+class TestLatencyCommand:
+    @pytest.mark.asyncio
+    async def test_latency_command(self, monkeypatch, mock_update, mock_context):
+        from handlers import admin_commands
+        from utils import latency
+
+        recorder = LatencyRecorder()
+        recorder.record("/start", 0.005)
+        monkeypatch.setattr(latency, "handler_latency", recorder)
+        monkeypatch.setattr(admin_commands, "ADMIN_ID", mock_update.effective_user.id)
+        mock_update.message.reply_text = AsyncMock()
+
+        await admin_commands.latency_command(mock_update, mock_context)
+
+        assert "`/start` × 1" in mock_update.message.reply_text.call_args.args[0]
@@ -0,0 +1,186 @@
+# tests/utils/test_leaderboard.py - Тесты топа постов по реакциям
+
+import random
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from utils.database import ReactionsDB
+from utils.leaderboard import ALL_EMOJIS, IndexedMaxHeap, ReactionLeaderboard
+
+
+class TestIndexedMaxHeap:
+    """Тесты IndexedMaxHeap"""
+
+    def test_matches_brute_force(self):
+        """Случайные изменения счетов дают тот же топ, что и полная сортировка"""
+        rng = random.Random(42)
+        heap = IndexedMaxHeap()
+        expected = {}
+        for _ in range(5000):
+            item = f"p{rng.randrange(200)}"
+            delta = rng.choice([1, 1, 1, -1, 3])
+            heap.add(item, delta)
+            score = expected.get(item, 0) + delta
+            if score > 0:
+                expected[item] = score
+            else:
+                expected.pop(item, None)
+
+        assert len(heap) == len(expected)
+        top = heap.top(20)
+        assert [score for _, score in top] == sorted(expected.values(), reverse=True)[:20]
+        assert all(expected[item] == score for item, score in top)
+        assert heap.get("missing") == 0
+
+    def test_top_more_than_size(self):
+        heap = IndexedMaxHeap()
+        heap.add("a", 2)
+        heap.add("b", 5)
+        assert heap.top(10) == [("b", 5), ("a", 2)]
+        assert IndexedMaxHeap().top(3) == []
+
+
+class TestReactionLeaderboard:
+    """Тесты ReactionLeaderboard"""
+
+    def test_change_moves_vote_in_all_window(self):
+        """Смена реакции переносит голос в окне all, но не меняет сумму"""
+        board = ReactionLeaderboard()
+        board.record("1", "post", None, "❤️")
+        board.record("2", "post", None, "❤️")
+        board.record("1", "other", None, "❤️")
+        board.record("1", "post", "❤️", "👍")
+
+        assert sorted(board.top("❤️")) == [("other", 1), ("post", 1)]
+        assert board.top("👍") == [("post", 1)]
+        assert board.top(ALL_EMOJIS, n=1) == [("post", 2)]
+        # В окне недели смена реакции тоже переносит голос
+        assert sorted(board.top("❤️", "week")) == [("other", 1), ("post", 1)]
+        assert board.top("👍", "week") == [("post", 1)]
+
+    def test_toggling_counts_reactor_once_in_window(self):
+        """👍 -> ❤️ -> 👍 одного пользователя - один голос за неделю"""
+        board = ReactionLeaderboard()
+        board.record("1", "post", None, "👍")
+        board.record("1", "post", "👍", "❤️")
+        board.record("1", "post", "❤️", "👍")
+
+        for window in ("all", "week", "day"):
+            assert board.top(ALL_EMOJIS, window) == [("post", 1)]
+            assert board.top("👍", window) == [("post", 1)]
+            assert board.top("❤️", window) == []
+
+    def test_change_of_reaction_set_before_period(self):
+        """Реакция прошлой недели, измененная на этой, - голос этой недели"""
+        now = [datetime(2026, 3, 2, 12, 0)]
+        board = ReactionLeaderboard(clock=lambda: now[0])
+        board.record("1", "post", None, "👍")
+        now[0] += timedelta(days=7)
+        board.record("1", "post", "👍", "❤️")
+
+        assert board.top(ALL_EMOJIS, "week") == [("post", 1)]
+        assert board.top("❤️", "week") == [("post", 1)]
+        assert board.top("👍", "week") == []
+
+    def test_windows_reset_with_new_period(self):
+        """Окна дня и недели начинаются заново в новом периоде"""
+        now = [datetime(2026, 3, 2, 12, 0)]  # понедельник
+        board = ReactionLeaderboard(clock=lambda: now[0])
+        board.record("1", "post", None, "❤️")
+
+        now[0] += timedelta(days=1)
+        assert board.top("❤️", "day") == []
+        assert board.top("❤️", "week") == [("post", 1)]
+
+        now[0] += timedelta(days=7)
+        assert board.top("❤️", "week") == []
+        assert board.top("❤️", "all") == [("post", 1)]
+
+    def test_unknown_window(self):
+        with pytest.raises(ValueError):
+            ReactionLeaderboard().top(window="month")
+
+
+class TestReactionsDBLeaderboard:
+    """Топ в ReactionsDB"""
+
+    @pytest.mark.parametrize("compact_memory", [False, True])
+    def test_rebuilt_on_load(self, tmp_path, compact_memory):
+        """После перезапуска окно all восстанавливается из данных"""
+        db_file = str(tmp_path / "reactions_data.json")
+        db = ReactionsDB(db_file, compact_memory=compact_memory)
+        for user_id in range(3):
+            db.add_reaction(user_id, "a", "❤️")
+        db.add_reaction(5, "b", "❤️")
+        db.add_reaction(6, "b", "😂")
+        db.close()
+
+        reloaded = ReactionsDB(db_file, compact_memory=compact_memory)
+        assert reloaded.top_posts("❤️") == [("a", 3), ("b", 1)]
+        assert reloaded.top_posts(n=1) == [("a", 3)]
+        assert reloaded.top_posts("❤️", "week") == []
+        reloaded.close()
+
+
+def test_shared_storage_ranks_all_workers(tmp_path):
+    """В общем хранилище окно all видит реакции других воркеров"""
+    from utils.storage import ShardedSqliteReactionStorage
+
+    db_file = str(tmp_path / "bot_data.sqlite3")
+    first = ReactionsDB(storage=ShardedSqliteReactionStorage(db_file, shards=3))
+    second = ReactionsDB(storage=ShardedSqliteReactionStorage(db_file, shards=3))
+    for user_id in range(3):
+        first.add_reaction(user_id, "a", "❤️")
+    for user_id in range(5):
+        second.add_reaction(user_id, "b", "👍")
+    second.add_reaction(9, "c", "❤️")
+
+    for db in (first, second):
+        assert db.top_posts() == [("b", 5), ("a", 3), ("c", 1)]
+        assert db.top_posts("❤️", n=1) == [("a", 3)]
+    assert first.top_posts("👍", "week") == []
+    first.close()
+    second.close()
+
+
+class TestLeaderboardCommands:
+    """Команды /top и /popular"""
+
+    @pytest.mark.asyncio
+    async def test_popular_uses_reactions(self, monkeypatch, mock_update, mock_context):
+        from handlers import content_commands
+
+        reactions = {"4": {"❤️": 5, "🔥": 2}, "1": {"❤️": 1}}
+        monkeypatch.setattr(
+            content_commands.async_reactions_db, "top_posts", lambda *args, **kwargs: [("4", 7)]
+        )
+        monkeypatch.setattr(
+            content_commands.async_reactions_db, "get_post_reactions", lambda post_id: reactions.get(post_id, {})
+        )
+        mock_update.message.reply_text = AsyncMock()
+
+        await content_commands.popular_command(mock_update, mock_context)
+
+        text = mock_update.message.reply_text.call_args.args[0]
+        assert text.index("Фазы Луны") < text.index("Нумерологический")
+        assert "❤️ 7 реакций" in text
+        # Пост вне топа показывает свои реакции, а не 0
+        assert "❤️ 1 реакций" in text
+
+    @pytest.mark.asyncio
+    async def test_top_command(self, monkeypatch, mock_update, mock_context):
+        from handlers import admin_commands
+        from utils.database import async_reactions_db
+
+        top_posts = Mock(return_value=[("42", 3)])
+        monkeypatch.setattr(admin_commands, "ADMIN_ID", mock_update.effective_user.id)
+        monkeypatch.setattr(async_reactions_db, "top_posts", top_posts)
+        mock_update.message.reply_text = AsyncMock()
+        mock_context.args = ["❤️", "day", "5"]
+
+        await admin_commands.top_command(mock_update, mock_context)
+
+        top_posts.assert_called_once_with("❤️", "day", 5)
+        assert "Пост `42` - 3" in mock_update.message.reply_text.call_args.args[0]
@@ -0,0 +1,133 @@
+# tests/utils/test_metrics.py - Тесты метрик Prometheus
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from utils.latency import BUCKETS, LatencyRecorder
+from utils.metrics import (
+    Counter, LatencyHistograms, MetricsRegistry, OpenAICall,
+    openai_requests, openai_tokens, update_type
+)
+
+
+class TestCounter:
+    """Счетчик с ячейками по потокам"""
+
+    def test_threads_add_up_exactly(self):
+        counter = Counter("test_total", "Тест", ("type",))
+
+        def work():
+            for i in range(10_000):
+                counter.inc("message" if i % 2 else "callback_query")
+
+        # Потоки завершаются до чтения - их ячейки сворачиваются в итог
+        for _ in range(3):
+            threads = [threading.Thread(target=work) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        counter.inc("message", amount=5)
+
+        assert counter.values() == {("message",): 60_005, ("callback_query",): 60_000}
+        assert len(counter._threads) == 1
+
+    def test_render_escapes_labels(self):
+        counter = Counter("test_total", "Тест", ("key",))
+        counter.inc('a"b\\c\nd')
+        assert counter.render()[-1] == 'test_total{key="a\\"b\\\\c\\nd"} 1'
+
+
+class TestRegistry:
+    def test_render_text_format(self):
+        registry = MetricsRegistry()
+        registry.counter("bot_updates_total", "Апдейты", ("type",)).inc("message")
+        registry.gauge("bot_queue_depth", "Очередь", lambda: 3)
+        registry.gauge("bot_by_stage", "Этапы", lambda: {("a",): 1, ("b",): 2}, ("stage",))
+        registry.gauge("bot_disabled", "Нет данных", lambda: None)
+
+        text = registry.render()
+        assert text.endswith("\n")
+        assert "# TYPE bot_updates_total counter\nbot_updates_total{type=\"message\"} 1" in text
+        assert "bot_queue_depth 3" in text
+        assert 'bot_by_stage{stage="a"} 1\nbot_by_stage{stage="b"} 2' in text
+        assert "bot_disabled" not in text
+
+    def test_latency_histogram_is_cumulative(self):
+        recorder = LatencyRecorder()
+        for seconds in (0.001, 0.002, 0.5, 1000):
+            recorder.record("/start", seconds)
+        lines = LatencyHistograms("h_seconds", "Тест", recorder).render()
+
+        buckets = [line for line in lines if line.startswith("h_seconds_bucket")]
+        counts = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+        assert len(buckets) == BUCKETS
+        assert counts == sorted(counts) and counts[-1] == 4
+        assert buckets[-1] == 'h_seconds_bucket{key="/start",le="+Inf"} 4'
+        assert 'h_seconds_count{key="/start"} 4' in lines
+        assert any(line.startswith('h_seconds_sum{key="/start"} 1000.5') for line in lines)
+
+
+def test_group_commit_metrics_by_store():
+    from utils.metrics import register_runtime_metrics
+    from utils.writer import GroupCommitter
+
+    class Writer:
+        queue_depth = total_flush_latency = max_flush_latency = jobs_done = errors = 0
+
+        def submit(self, func):
+            func()
+
+        def flush(self, timeout=None):
+            pass
+
+    writer = Writer()
+    pipeline = SimpleNamespace(queue_depth=0, published=0, processed=0, last_lag=0)
+    reactions = GroupCommitter(lambda: None, writer, max_mutations=1000)
+    reactions.mark_dirty(3)
+    reactions.flush()
+    reactions.mark_dirty(2)
+    registry = MetricsRegistry()
+    register_runtime_metrics(registry, writer, pipeline, LatencyRecorder(), {"stats": None, "reactions": reactions})
+
+    text = registry.render()
+    assert 'bot_storage_pending_mutations{store="reactions"} 2' in text
+    assert 'bot_storage_group_flushes_total{store="reactions"} 1' in text
+    assert 'bot_storage_group_flush_seconds_total{store="reactions"}' in text
+    assert 'store="stats"' not in text
+    reactions.close()
+
+
+class TestOpenAICall:
+    def test_records_tokens_and_errors(self):
+        before_ok = openai_requests.value("test-model", "ok")
+        before_error = openai_requests.value("test-model", "error")
+        before_prompt = openai_tokens.value("test-model", "prompt")
+
+        with OpenAICall("test-model") as call:
+            call.record_usage(SimpleNamespace(prompt_tokens=12, completion_tokens=30, total_tokens=42))
+        with pytest.raises(RuntimeError):
+            with OpenAICall("test-model"):
+                raise RuntimeError("таймаут")
+
+        assert openai_requests.value("test-model", "ok") == before_ok + 1
+        assert openai_requests.value("test-model", "error") == before_error + 1
+        assert openai_tokens.value("test-model", "prompt") == before_prompt + 12
+
+
+def test_update_type():
+    assert update_type({"update_id": 1, "callback_query": {}}) == "callback_query"
+    assert update_type({"update_id": 1}) == "unknown"
+
+
+def test_metrics_endpoint():
+    from main_bot_railway import app
+
+    response = app.test_client().get("/metrics")
+    text = response.get_data(as_text=True)
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == MetricsRegistry.CONTENT_TYPE
+    for name in ("bot_storage_queue_depth", "bot_stats_queue_depth", "bot_storage_flush_seconds_count"):
+        assert f"\n{name} " in text
@@ -0,0 +1,146 @@
+# tests/utils/test_rollups.py - Тесты агрегатов статистики по часам, дням и неделям
+
+import json
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from handlers.stats import BotStats
+from utils.rollups import StatsRollups
+from utils.storage import JsonStatsStorage, SqliteStatsStorage
+
+
+def brute_force(stats, days, field):
+    """Исходный алгоритм: обход всех пользователей"""
+    cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+    return sum(1 for user in stats.stats["users"].values() if user[field] >= cutoff)
+
+
+def fill(stats, users=300, seed=1):
+    """Случайные события за последние 40 дней в хронологическом порядке"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    events = sorted(
+        (now - timedelta(minutes=rng.randrange(40 * 24 * 60)), rng.randrange(users))
+        for _ in range(users * 5)
+    )
+    for moment, user_id in events:
+        stats.add_user(user_id, moment=moment)
+        stats.add_command(user_id, "start", moment=moment)
+    return events
+
+
+@pytest.fixture
+def stats(tmp_path):
+    return BotStats(storage=JsonStatsStorage(str(tmp_path / "bot_stats.json")))
+
+
+class TestStatsRollups:
+    """Тесты StatsRollups"""
+
+    def test_counts_match_full_scan(self, stats):
+        """Активные и новые из гистограмм совпадают с обходом пользователей"""
+        fill(stats)
+        for days in (0, 1, 7, 30):
+            assert stats.get_active_users(days) == brute_force(stats, days, "last_seen")
+            assert stats.get_new_users(days) == brute_force(stats, days, "first_seen")
+
+    def test_buckets(self):
+        rollups = StatsRollups()
+        moment = datetime(2026, 3, 2, 10, 30)
+        rollups.record_user(1, moment, True)
+        rollups.record_user(2, moment, True)
+        rollups.record_user(1, moment + timedelta(hours=1), False)
+        rollups.record_command(moment)
+        rollups.record_message(moment + timedelta(hours=1))
+
+        hour = rollups.bucket("hour", moment)
+        assert (hour["active"].count(), hour["new"], hour["commands"]) == (2, 2, 1)
+        day = rollups.recent("day", 1, now=moment)
+        assert day == {"active": 2, "new": 2, "commands": 1, "messages": 1}
+        assert rollups.recent("hour", 1, now=moment + timedelta(hours=1))["active"] == 1
+        assert rollups.bucket("week", moment) is rollups.buckets["week"]["2026-W10"]
+        assert rollups.first_seen_days == {"2026-03-02": 2}
+
+    def test_old_hour_buckets_pruned(self):
+        rollups = StatsRollups()
+        start = datetime(2026, 3, 1)
+        for hour in range(100):
+            rollups.record_command(start + timedelta(hours=hour))
+        assert len(rollups.buckets["hour"]) == 49
+        assert len(rollups.buckets["day"]) == 5
+
+    def test_serialization_roundtrip(self, stats):
+        fill(stats, users=50)
+        restored = StatsRollups.from_dict(json.loads(json.dumps(stats.stats["rollups"].to_dict())))
+        assert restored.to_dict() == stats.stats["rollups"].to_dict()
+
+
+class TestRollupsPersistence:
+    """Агрегаты переживают перезапуск и строятся для старой статистики"""
+
+    @pytest.mark.parametrize("backend", ["json", "sqlite"])
+    def test_reload(self, tmp_path, backend):
+        if backend == "json":
+            make_storage = lambda: JsonStatsStorage(str(tmp_path / "bot_stats.json"))
+        else:
+            make_storage = lambda: SqliteStatsStorage(str(tmp_path / "bot_data.sqlite3"))
+        stats = BotStats(storage=make_storage())
+        fill(stats, users=100)
+        stats.add_message(1)
+        stats.save_stats()
+        expected = stats.stats["rollups"].to_dict()
+        stats.storage.close()
+
+        reloaded = BotStats(storage=make_storage())
+        assert reloaded.stats["rollups"].to_dict() == expected
+        assert reloaded.get_recent_activity("hour", 1)["messages"] == 1
+        reloaded.storage.close()
+
+    def test_backfill_from_legacy_file(self, tmp_path, stats):
+        """bot_stats.json без агрегатов: гистограммы и дневные корзины строятся при загрузке"""
+        events = fill(stats)
+        stats.save_stats()
+        stats_file = tmp_path / "bot_stats.json"
+        legacy = json.loads(stats_file.read_text(encoding="utf-8"))
+        legacy.pop("rollups")
+        stats_file.write_text(json.dumps(legacy), encoding="utf-8")
+
+        reloaded = BotStats(storage=JsonStatsStorage(str(stats_file)))
+        rollups, incremental = reloaded.stats["rollups"], stats.stats["rollups"]
+        assert rollups.first_seen_days == incremental.first_seen_days
+        for days in (7, 30):
+            assert reloaded.get_active_users(days) == stats.get_active_users(days)
+            assert reloaded.get_new_users(days) == stats.get_new_users(days)
+
+        today = datetime.now().strftime('%Y-%m-%d')
+        expected_commands = sum(1 for moment, _ in events if moment.strftime('%Y-%m-%d') == today)
+        assert rollups.buckets["day"][today]["commands"] == expected_commands
+        assert rollups.buckets["day"][today]["new"] == incremental.buckets["day"][today]["new"]
+        # Часовых данных в старой статистике нет
+        assert rollups.buckets["hour"] == {}
+
+
+@pytest.mark.slow
+class TestRollupsBenchmark:
+    """Бенчмарк: /stats и /users не зависят от числа пользователей"""
+
+    def test_active_users_constant_time(self, stats):
+        now = datetime.now()
+        for user_id in range(100_000):
+            stats.add_user(user_id, moment=now - timedelta(days=user_id % 60))
+
+        start = time.perf_counter()
+        for _ in range(100):
+            active = stats.get_active_users(30)
+            stats.get_new_users(7)
+        per_call = (time.perf_counter() - start) / 100
+        scan_start = time.perf_counter()
+        expected = brute_force(stats, 30, "last_seen")
+        scan = time.perf_counter() - scan_start
+
+        print(f"100k пользователей: агрегаты {per_call * 1e6:.0f}µs, обход {scan * 1e3:.1f}ms")
+        assert active == expected
+        assert per_call < scan
@@ -0,0 +1,108 @@
+# tests/utils/test_sharding.py - Тесты шардированного хранилища реакций
+
+import multiprocessing
+
+import pytest
+
+from utils.database import ReactionsDB
+from utils.storage import ShardedSqliteReactionStorage, create_reaction_storage, shard_for
+
+
+@pytest.fixture
+def sqlite_file(tmp_path):
+    """Базовый путь для файлов шардов"""
+    return str(tmp_path / "bot_data.sqlite3")
+
+
+class TestShardedStorage:
+    """Тесты ShardedSqliteReactionStorage"""
+
+    def test_post_lives_in_one_shard(self, sqlite_file):
+        """Все реакции поста попадают в один файл шарда"""
+        storage = ShardedSqliteReactionStorage(sqlite_file, shards=4)
+        storage.record_many([(str(user), f"p{user % 10}", "❤️") for user in range(100)])
+
+        for post in range(10):
+            post_key = f"p{post}"
+            owner = shard_for(post_key, 4)
+            for index, shard in enumerate(storage.shards):
+                expected = {"❤️": 10} if index == owner else {}
+                assert shard.post_counts(post_key) == expected
+            assert storage.post_counts(post_key) == {"❤️": 10}
+        storage.close()
+
+    def test_shard_for_is_stable(self):
+        """Номер шарда не зависит от PYTHONHASHSEED процесса"""
+        assert shard_for("post_1", 8) == shard_for("post_1", 8) == 1
+
+    def test_reads_see_other_writers(self, sqlite_file):
+        """Два ReactionsDB над одними шардами видят записи друг друга"""
+        first = ReactionsDB(storage=ShardedSqliteReactionStorage(sqlite_file, shards=3))
+        second = ReactionsDB(storage=ShardedSqliteReactionStorage(sqlite_file, shards=3))
+        first.add_reaction(1, "post", "❤️")
+        second.add_reaction(2, "post", "👍")
+
+        assert first.get_post_reactions("post") == {"❤️": 1, "👍": 1}
+        assert first.get_reaction(2, "post") == "👍"
+        first.close()
+        second.close()
+
+        reloaded = ReactionsDB(storage=ShardedSqliteReactionStorage(sqlite_file, shards=3))
+        assert reloaded.data == {"1": {"post": "❤️"}, "2": {"post": "👍"}}
+        reloaded.close()
+
+    def test_backend_switch(self, sqlite_file, monkeypatch):
+        monkeypatch.setattr("utils.storage.SQLITE_DB_FILE", sqlite_file)
+        monkeypatch.setattr("utils.storage.REACTION_SHARDS", 2)
+        storage = create_reaction_storage(backend="sharded")
+        assert isinstance(storage, ShardedSqliteReactionStorage)
+        assert len(storage.shards) == 2
+        storage.close()
+
+
+WORKERS = 4
+REACTIONS_PER_WORKER = 400
+POSTS = 25
+SHARDS = 4
+
+
+def _worker(sqlite_file, worker, start):
+    """Процесс-воркер: пишет свои реакции в общие шарды"""
+    db = ReactionsDB(storage=ShardedSqliteReactionStorage(sqlite_file, shards=SHARDS))
+    start.wait()
+    for i in range(REACTIONS_PER_WORKER):
+        user_id = worker * 100_000 + i + 1
+        db.add_reaction(user_id, f"post_{i % POSTS}", "❤️" if i % 3 else "👍")
+        # Общий для всех воркеров ключ: последняя запись побеждает, но не теряется
+        db.add_reaction(0, f"post_{i % POSTS}", "😂")
+    db.close()
+
+
+@pytest.mark.slow
+class TestShardedStress:
+    """Несколько процессов пишут одновременно - ни одна реакция не теряется"""
+
+    def test_no_reaction_lost(self, sqlite_file):
+        context = multiprocessing.get_context("spawn")
+        start = context.Event()
+        workers = [
+            context.Process(target=_worker, args=(sqlite_file, worker, start))
+            for worker in range(WORKERS)
+        ]
+        for process in workers:
+            process.start()
+        start.set()
+        for process in workers:
+            process.join(120)
+            assert process.exitcode == 0
+
+        storage = ShardedSqliteReactionStorage(sqlite_file, shards=SHARDS)
+        data = storage.load()
+        total = sum(len(posts) for posts in data.values())
+        assert total == WORKERS * REACTIONS_PER_WORKER + POSTS
+
+        for post in range(POSTS):
+            counts = storage.post_counts(f"post_{post}")
+            assert sum(counts.values()) == WORKERS * REACTIONS_PER_WORKER // POSTS + 1
+            assert counts["😂"] == 1
+        storage.close()
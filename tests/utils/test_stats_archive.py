@@ -0,0 +1,197 @@
+# tests/utils/test_stats_archive.py - Тесты архивации дневной статистики
+
+import sqlite3
+import subprocess
+import sys
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest.mock import AsyncMock
+
+import pytest
+
+from handlers.stats import BotStats
+from utils.stats_archive import StatsArchive, archive_report
+from utils.storage import JsonStatsStorage, SqliteStatsStorage
+
+NOW = datetime(2026, 6, 15, 12, 0)
+
+
+def make_stats(tmp_path, backend="json"):
+    if backend == "json":
+        storage = JsonStatsStorage(str(tmp_path / "bot_stats.json"))
+    else:
+        storage = SqliteStatsStorage(str(tmp_path / "bot_data.sqlite3"))
+    return BotStats(storage=storage, archive=StatsArchive(str(tmp_path / "archive")))
+
+
+def fill(stats, days=120):
+    """По 20 пользователей и 3 команды в день за days дней до NOW"""
+    for offset in range(days):
+        moment = NOW - timedelta(days=offset)
+        date = moment.strftime('%Y-%m-%d')
+        for user_id in range(offset, offset + 20):
+            stats.add_command(user_id, "start", date, moment)
+        stats.add_command(offset, "help", date, moment)
+        stats.add_category(offset, "tarot", date)
+    stats.save_stats()
+
+
+class TestArchiveOldDays:
+    """BotStats.archive_old_days"""
+
+    @pytest.mark.parametrize("backend", ["json", "sqlite"])
+    def test_moves_old_days_to_monthly_files(self, tmp_path, backend):
+        stats = make_stats(tmp_path, backend)
+        fill(stats)
+        cutoff = (NOW - timedelta(days=30)).strftime('%Y-%m-%d')
+
+        report = stats.archive_old_days(retention_days=30, now=NOW)
+
+        assert report["days"] == 89
+        assert report["months"] == ["2026-02", "2026-03", "2026-04", "2026-05"]
+        assert report["hot_bytes_after"] < report["hot_bytes_before"]
+        assert report["reclaimed_bytes"] == report["hot_bytes_before"] - report["hot_bytes_after"]
+        assert min(stats.stats["daily_stats"]) >= cutoff
+        assert stats.archive.months() == report["months"]
+
+        # В горячей статистике остался агрегат месяца
+        april = stats.stats["archived_months"]["2026-04"]
+        assert april["days"] == 30
+        assert april["commands"] == {"start": 600, "help": 30}
+        assert april["categories"] == {"tarot": 30}
+        assert abs(april["unique_users"].count() - 49) <= 3
+
+        # После перезапуска архивные дни не возвращаются
+        stats.storage.close()
+        reloaded = make_stats(tmp_path, backend)
+        assert min(reloaded.stats["daily_stats"]) >= cutoff
+        assert reloaded.stats["archived_months"]["2026-04"]["commands"]["start"] == 600
+        reloaded.storage.close()
+
+    def test_crash_during_archive_keeps_counts(self, tmp_path):
+        """Сбой между удалением дней и записью агрегата месяца ничего не теряет"""
+        stats = make_stats(tmp_path, "sqlite")
+        fill(stats, days=60)
+        conn = stats.storage.conn
+
+        class FailingConnection:
+            """Падает на последнем удалении дней - после удаления из остальных таблиц"""
+
+            def __enter__(self):
+                return conn.__enter__()
+
+            def __exit__(self, *exc):
+                return conn.__exit__(*exc)
+
+            def executemany(self, sql, rows):
+                if sql.startswith("DELETE FROM stats_daily_users"):
+                    raise sqlite3.OperationalError("disk I/O error")
+                return conn.executemany(sql, rows)
+
+            def execute(self, *args):
+                return conn.execute(*args)
+
+        def total_starts(bot_stats):
+            hot = sum(day["commands"].get("start", 0) for day in bot_stats.stats["daily_stats"].values())
+            archived = sum(m["commands"].get("start", 0) for m in bot_stats.stats["archived_months"].values())
+            return hot + archived
+
+        stats.storage.conn = FailingConnection()
+        stats.archive_old_days(retention_days=30, now=NOW)
+        stats.storage.conn = conn
+
+        # Процесс "упал": в базе ни удаленных дней, ни агрегата - все откатилось вместе
+        crashed = make_stats(tmp_path, "sqlite")
+        assert total_starts(crashed) == 60 * 20
+        assert not crashed.stats["archived_months"]
+        crashed.storage.close()
+
+        # Следующая запись доводит перенос до конца
+        stats.save_stats()
+        stats.storage.close()
+        reloaded = make_stats(tmp_path, "sqlite")
+        assert total_starts(reloaded) == 60 * 20
+        assert min(reloaded.stats["daily_stats"]) >= (NOW - timedelta(days=30)).strftime('%Y-%m-%d')
+        reloaded.storage.close()
+
+    def test_repeated_run_is_noop(self, tmp_path):
+        stats = make_stats(tmp_path)
+        fill(stats, days=40)
+        stats.archive_old_days(retention_days=30, now=NOW)
+        archived = stats.archive.load_month("2026-05")
+
+        report = stats.archive_old_days(retention_days=30, now=NOW)
+        assert report["days"] == 0
+        assert stats.archive.load_month("2026-05").keys() == archived.keys()
+        assert stats.stats["archived_months"]["2026-05"]["days"] == len(archived)
+
+    def test_archive_report(self, tmp_path):
+        stats = make_stats(tmp_path)
+        fill(stats)
+        stats.archive_old_days(retention_days=30, now=NOW)
+
+        report = archive_report(stats.archive, "2026-04-01", "2026-04-10")
+        assert list(report["months"]) == ["2026-04"]
+        assert report["total"]["days"] == 10
+        assert report["total"]["commands"]["help"] == 10
+        assert abs(report["total"]["unique_users"].count() - 29) <= 2
+
+
+class TestOfflineReport:
+    """Скрипт stats_report.py читает архив без запуска бота"""
+
+    def test_script(self, tmp_path):
+        stats = make_stats(tmp_path)
+        fill(stats, days=60)
+        stats.archive_old_days(retention_days=30, now=NOW)
+
+        root = Path(__file__).resolve().parents[2]
+        result = subprocess.run(
+            [sys.executable, str(root / "stats_report.py"), "--archive-dir", str(tmp_path / "archive"),
+             "--from", "2026-05-01"],
+            capture_output=True, text=True, cwd=root, timeout=60,
+        )
+        assert result.returncode == 0, result.stderr
+        assert "2026-05" in result.stdout
+        assert "2026-04" not in result.stdout
+        assert "/start: 300" in result.stdout
+
+
+def test_retention_archives_at_startup(tmp_path):
+    """Первый перенос не ждет целого интервала"""
+    submitted = threading.Event()
+
+    class Writer:
+        def submit(self, fn):
+            submitted.set()
+
+    stats = BotStats(storage=JsonStatsStorage(str(tmp_path / "bot_stats.json")), writer=Writer(),
+                     archive=StatsArchive(str(tmp_path / "archive")))
+    stop = stats.enable_retention(interval_hours=24)
+    try:
+        assert submitted.wait(5)
+    finally:
+        stop.set()
+
+
+class TestCleanupCommand:
+    """Команда /cleanup выполняет архивацию и показывает освобожденное место"""
+
+    @pytest.mark.asyncio
+    async def test_reports_reclaimed_bytes(self, tmp_path, monkeypatch, mock_update, mock_context):
+        from handlers import admin_commands
+        import handlers.stats
+
+        stats = make_stats(tmp_path)
+        fill(stats)
+        monkeypatch.setattr(handlers.stats, "bot_stats", stats)
+        monkeypatch.setattr(admin_commands, "ADMIN_ID", mock_update.effective_user.id)
+        mock_update.message.reply_text = AsyncMock()
+
+        await admin_commands.cleanup_command(mock_update, mock_context)
+
+        text = mock_update.message.reply_text.call_args.args[0]
+        assert "дней в архив" in text
+        assert "Освобождено места" in text
+        assert stats.archive.months()
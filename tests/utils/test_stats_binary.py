@@ -0,0 +1,176 @@
+# tests/utils/test_stats_binary.py - Тесты бинарного снапшота статистики
+
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from handlers.stats import BotStats
+from utils.stats_binary import BinaryFormatError, LazyUsers, StatsSnapshot
+from utils.storage import (
+    BinaryStatsStorage, JsonStatsStorage, create_stats_storage, empty_stats, normalize_stats
+)
+
+
+@pytest.fixture
+def bin_file(tmp_path):
+    return str(tmp_path / "bot_stats.bin")
+
+
+def make_users(stats, count):
+    today = datetime.now()
+    for user_id in range(count):
+        moment = today - timedelta(days=user_id % 40)
+        stats.add_user(user_id, f"user{user_id}", f"Имя {user_id % 100}", moment=moment)
+        stats.add_command(user_id, ("start", "help", "tarot")[user_id % 3], moment=moment)
+        if user_id % 2:
+            stats.add_message(user_id, moment)
+
+
+class TestBinaryStatsStorage:
+    """Тесты BinaryStatsStorage"""
+
+    def test_roundtrip_is_lazy(self, bin_file):
+        stats = BotStats(storage=BinaryStatsStorage(bin_file))
+        make_users(stats, 300)
+        stats.add_user("unknown", None, None)
+        stats.save_stats()
+        expected_active = stats.get_active_users(7)
+
+        reloaded = BotStats(storage=BinaryStatsStorage(bin_file))
+        users = reloaded.stats["users"]
+        assert isinstance(users, LazyUsers)
+        assert len(users) == 301
+        # Индексы построены по колонкам - записи не декодированы
+        assert reloaded.get_active_users(7) == expected_active
+        assert list(users.loaded) == ["unknown"]
+
+        user = users["7"]
+        assert user == {
+            "username": "user7", "first_name": "Имя 7",
+            "first_seen": stats.stats["users"]["7"]["first_seen"],
+            "last_seen": stats.stats["users"]["7"]["last_seen"],
+            "message_count": 1, "commands_used": {"help": 1},
+        }
+        assert "7" in users.loaded and len(users.loaded) == 2
+        assert reloaded.stats["commands"] == stats.stats["commands"]
+        assert reloaded.stats["total_messages"] == stats.stats["total_messages"]
+        assert sorted(users, key=str) == sorted(stats.stats["users"], key=str)
+
+    def test_incremental_save_copies_untouched_users(self, bin_file):
+        stats = BotStats(storage=BinaryStatsStorage(bin_file))
+        make_users(stats, 100)
+        stats.save_stats()
+
+        reloaded = BotStats(storage=BinaryStatsStorage(bin_file))
+        reloaded.add_command(5, "runes")
+        reloaded.add_user(1000, "new", "Новый")
+        reloaded.save_stats()
+        assert len(reloaded.stats["users"].loaded) == 2
+        assert reloaded.storage._pending == {}
+
+        reloaded.add_message(5)
+        reloaded.save_stats()
+
+        final = BotStats(storage=BinaryStatsStorage(bin_file))
+        users = final.stats["users"]
+        assert len(users) == 101
+        assert users["5"]["commands_used"] == {"tarot": 1, "runes": 1}
+        assert users["5"]["message_count"] == 2
+        assert users["1000"]["username"] == "new"
+        assert users["6"] == stats.stats["users"]["6"]
+
+    def test_mapping_semantics(self, bin_file):
+        stats = BotStats(storage=BinaryStatsStorage(bin_file))
+        make_users(stats, 10)
+        stats.save_stats()
+        users = BinaryStatsStorage(bin_file).load()["users"]
+
+        assert "3" in users and "42" not in users and 3 not in users
+        del users["3"]
+        assert "3" not in users and len(users) == 9
+        users["3"] = {"username": "again"}
+        assert users["3"]["username"] == "again" and len(users) == 10
+        with pytest.raises(KeyError):
+            users["42"]
+        assert users.get("42") is None
+
+    def test_migrates_from_json(self, tmp_path, bin_file):
+        json_file = str(tmp_path / "bot_stats.json")
+        legacy = BotStats(storage=JsonStatsStorage(json_file))
+        make_users(legacy, 20)
+        legacy.save_stats()
+
+        stats = BotStats(storage=BinaryStatsStorage(bin_file, json_file=json_file))
+        assert not os.path.exists(bin_file)
+        assert stats.get_user_count() == 20
+        stats.save_stats()
+
+        reloaded = BotStats(storage=BinaryStatsStorage(bin_file, json_file=json_file))
+        assert isinstance(reloaded.stats["users"], LazyUsers)
+        assert reloaded.stats["users"]["19"] == legacy.stats["users"]["19"]
+
+    def test_corruption_detected(self, bin_file):
+        stats = BotStats(storage=BinaryStatsStorage(bin_file))
+        make_users(stats, 10)
+        stats.save_stats()
+        with open(bin_file, "r+b") as f:
+            f.seek(-3, os.SEEK_END)
+            f.write(b"\xff")
+        with pytest.raises(BinaryFormatError):
+            StatsSnapshot.read(bin_file)
+
+    def test_factory(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("utils.storage.STATS_FORMAT", "binary")
+        storage = create_stats_storage(str(tmp_path / "bot_stats.json"), backend="json")
+        assert isinstance(storage, BinaryStatsStorage)
+        assert storage.stats_file.endswith("bot_stats.bin")
+        assert storage.json_file.endswith("bot_stats.json")
+
+
+@pytest.mark.slow
+class TestBinaryBenchmark:
+    """Бенчмарк: загрузка и размер файла при 100k пользователей, JSON против бинарного"""
+
+    def test_100k_users(self, tmp_path):
+        stats = empty_stats()
+        today = datetime.now()
+        for user_id in range(100_000):
+            day = (today - timedelta(days=user_id % 90)).strftime('%Y-%m-%d')
+            stats["users"][str(5_000_000_000 + user_id * 37)] = {
+                "username": f"user_{user_id}", "first_name": f"Имя {user_id % 500}",
+                "first_seen": day, "last_seen": day, "message_count": user_id % 50,
+                "commands_used": {"start": 3, "help": 1, "tarot": user_id % 7},
+            }
+        json_storage = JsonStatsStorage(str(tmp_path / "bot_stats.json"))
+        bin_storage = BinaryStatsStorage(str(tmp_path / "bot_stats.bin"))
+        json_storage.save(stats)
+        bin_storage.save(stats)
+
+        results = {}
+        for name, storage in (("json", json_storage), ("binary", bin_storage)):
+            started = time.perf_counter()
+            loaded = normalize_stats(storage.load())
+            results[name] = (time.perf_counter() - started, storage.size())
+        json_time, json_size = results["json"]
+        bin_time, bin_size = results["binary"]
+
+        # Точечное сохранение после изменения одного пользователя
+        user = loaded["users"]["5000000037"]
+        user["message_count"] += 1
+        started = time.perf_counter()
+        bin_storage.save(loaded, dirty_users={"5000000037"})
+        bin_save = time.perf_counter() - started
+        started = time.perf_counter()
+        json_storage.save(stats)
+        json_save = time.perf_counter() - started
+
+        print(
+            f"\n100k пользователей: JSON {json_size / 1e6:.1f} МБ, загрузка {json_time * 1000:.0f} мс, "
+            f"запись {json_save * 1000:.0f} мс; бинарный {bin_size / 1e6:.1f} МБ, "
+            f"загрузка {bin_time * 1000:.0f} мс, запись {bin_save * 1000:.0f} мс"
+        )
+        assert bin_size < json_size / 2
+        assert bin_time < json_time / 5
+        assert BinaryStatsStorage(bin_storage.stats_file).load()["users"]["5000000037"]["message_count"] == 2
@@ -0,0 +1,174 @@
+# tests/utils/test_storage.py - Тесты хранилищ JSON / SQLite
+
+import json
+
+import pytest
+
+from utils.database import ReactionsDB
+from utils.storage import (
+    JsonStatsStorage,
+    SqliteReactionStorage,
+    SqliteStatsStorage,
+    create_reaction_storage,
+    migrate_json_to_sqlite,
+)
+from handlers.stats import BotStats
+
+
+@pytest.fixture
+def sqlite_file(tmp_path):
+    """Путь к временной базе SQLite"""
+    return str(tmp_path / "bot_data.sqlite3")
+
+
+class TestSqliteReactionStorage:
+    """Тесты SQLite-хранилища реакций"""
+
+    def test_wal_mode_and_indexes(self, sqlite_file):
+        storage = SqliteReactionStorage(sqlite_file)
+        mode = storage.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        indexes = {row[1] for row in storage.conn.execute("PRAGMA index_list(reactions)")}
+        storage.close()
+
+        assert mode == "wal"
+        assert {"idx_reactions_post", "idx_reactions_user"} <= indexes
+
+    def test_reactions_db_roundtrip(self, sqlite_file):
+        """ReactionsDB работает поверх SQLite так же, как поверх JSON"""
+        db = ReactionsDB(storage=SqliteReactionStorage(sqlite_file))
+        db.add_reaction(1, "post", "❤️")
+        db.add_reaction(2, "post", "❤️")
+        db.add_reaction(2, "post", "👍")
+        db.close()
+
+        storage = SqliteReactionStorage(sqlite_file)
+        reloaded = ReactionsDB(storage=storage)
+        assert reloaded.data == {"1": {"post": "❤️"}, "2": {"post": "👍"}}
+        assert reloaded.get_post_reactions("post") == storage.post_counts("post") == {"❤️": 1, "👍": 1}
+        storage.close()
+
+    def test_backend_switch(self, sqlite_file, monkeypatch):
+        monkeypatch.setattr("utils.storage.SQLITE_DB_FILE", sqlite_file)
+        storage = create_reaction_storage(backend="sqlite")
+        assert isinstance(storage, SqliteReactionStorage)
+        storage.close()
+
+        with pytest.raises(ValueError):
+            create_reaction_storage(backend="redis")
+
+
+class TestSqliteStatsStorage:
+    """Тесты SQLite-хранилища статистики"""
+
+    def test_bot_stats_roundtrip(self, sqlite_file):
+        stats = BotStats(storage=SqliteStatsStorage(sqlite_file))
+        stats.add_user(1, "alice", "Alice")
+        stats.add_command(1, "start")
+        stats.add_message(1)
+        stats.save_stats()
+        stats.storage.close()
+
+        reloaded = BotStats(storage=SqliteStatsStorage(sqlite_file))
+        user = reloaded.stats["users"]["1"]
+        assert user["username"] == "alice"
+        assert user["message_count"] == 1
+        assert user["commands_used"]["start"] == 1
+        assert reloaded.stats["commands"]["start"] == 1
+        assert reloaded.stats["total_messages"] == 1
+        assert reloaded.unique_users(list(reloaded.stats["daily_stats"])) == 1
+        assert reloaded.command_uniques("start", list(reloaded.stats["daily_stats"])) == 1
+
+        # Новая команда после загрузки не падает с KeyError
+        reloaded.add_command(1, "help")
+        assert reloaded.stats["commands"]["help"] == 1
+        reloaded.storage.close()
+
+    def test_only_dirty_users_are_written(self, sqlite_file):
+        stats = BotStats(storage=SqliteStatsStorage(sqlite_file))
+        stats.add_user(1)
+        stats.add_user(2)
+        stats.save_stats()
+
+        stats.stats["users"]["1"]["username"] = "changed without tracking"
+        stats.add_user(2, "bob")
+        stats.save_stats()
+        stats.storage.close()
+
+        reloaded = SqliteStatsStorage(sqlite_file).load()
+        assert reloaded["users"]["1"]["username"] is None
+        assert reloaded["users"]["2"]["username"] == "bob"
+
+    def test_failed_write_keeps_changes(self, sqlite_file, monkeypatch):
+        stats = BotStats(storage=SqliteStatsStorage(sqlite_file))
+        stats.add_user(1, "alice")
+        stats.add_command(1, "start")
+        write = stats.storage.write
+
+        def fail(payload):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(stats.storage, "write", fail)
+        stats.save_stats()
+        monkeypatch.setattr(stats.storage, "write", write)
+        stats.add_user(2, "bob")
+        stats.save_stats()
+        stats.storage.close()
+
+        reloaded = BotStats(storage=SqliteStatsStorage(sqlite_file))
+        assert set(reloaded.stats["users"]) == {"1", "2"}
+        assert reloaded.stats["users"]["1"]["commands_used"]["start"] == 1
+        assert reloaded.stats["daily_stats"]
+        assert reloaded.stats["rollups"].recent("day", 1)["commands"] == 1
+        reloaded.storage.close()
+
+    def test_unchanged_meta_is_not_rewritten(self, sqlite_file, monkeypatch):
+        stats = BotStats(storage=SqliteStatsStorage(sqlite_file))
+        stats.add_user(1)
+        stats.save_stats()
+        payloads = []
+        write = stats.storage.write
+        monkeypatch.setattr(stats.storage, "write", lambda payload: (payloads.append(payload), write(payload)))
+
+        # Повторный визит в тот же день: когорты и гистограмма first_seen не меняются
+        stats.add_user(1, "alice")
+        stats.add_message(1)
+        stats.save_stats()
+        stats.storage.close()
+
+        payload = payloads[0]
+        assert [key for key, _ in payload["meta"]] == ["total_messages", "start_date"]
+        # Только корзины события (час, день, неделя), а не все агрегаты
+        assert sorted(granularity for granularity, _, _ in payload["rollup_buckets"]) == ["day", "hour", "week"]
+        assert not payload["reset_rollups"]
+
+        reloaded = BotStats(storage=SqliteStatsStorage(sqlite_file))
+        assert reloaded.stats["rollups"].recent("day", 1)["messages"] == 1
+        assert reloaded.stats["rollups"].new_users(0) == 1
+        assert reloaded.stats["users"]["1"]["username"] == "alice"
+        reloaded.storage.close()
+
+
+def test_migrate_json_to_sqlite(tmp_path, sqlite_file):
+    """Миграция переносит реакции и статистику, пропуская наследованные агрегаты"""
+    reactions_file = tmp_path / "reactions_data.json"
+    stats_file = tmp_path / "bot_stats.json"
+    reactions_file.write_text(json.dumps({
+        "reactions": {"heart": 1},
+        "1": {"post": "❤️"},
+    }), encoding="utf-8")
+
+    legacy_stats = BotStats(storage=JsonStatsStorage(str(stats_file)))
+    legacy_stats.add_user(1, "alice")
+    legacy_stats.add_command(1, "start")
+    legacy_stats.save_stats()
+
+    result = migrate_json_to_sqlite(str(reactions_file), str(stats_file), sqlite_file)
+    assert result == {"reactions": 1, "skipped": 1, "users": 1}
+
+    reaction_storage = SqliteReactionStorage(sqlite_file)
+    assert reaction_storage.load() == {"1": {"post": "❤️"}}
+    reaction_storage.close()
+
+    stats_storage = SqliteStatsStorage(sqlite_file)
+    assert stats_storage.load()["users"]["1"]["username"] == "alice"
+    stats_storage.close()
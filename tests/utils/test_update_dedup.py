@@ -0,0 +1,163 @@
+# tests/utils/test_update_dedup.py - Тесты отбрасывания повторных апдейтов по update_id
+
+import threading
+import time
+
+import pytest
+
+from utils.update_dedup import SqliteUpdateIds, UpdateDeduplicator, create_update_dedup
+from utils.update_loop import UpdateLoop
+
+
+def message(update_id):
+    return {
+        "update_id": update_id,
+        "message": {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "hi"},
+    }
+
+
+class TestUpdateDeduplicator:
+    """Тесты UpdateDeduplicator"""
+
+    def test_lru_window(self):
+        dedup = UpdateDeduplicator(max_size=3)
+        assert [dedup.is_duplicate(update_id) for update_id in (1, 2, 1, 3, 4)] == [False, False, True, False, False]
+        # 1 недавно повторялся и остался в окне, вытеснен 2
+        assert dedup.is_duplicate(1) and not dedup.is_duplicate(2)
+        assert not dedup.is_duplicate(None) and not dedup.is_duplicate(None)
+        dedup.forget(2)
+        assert not dedup.is_duplicate(2)
+        assert dedup.get_metrics() == {"tracked": 3, "max_size": 3, "duplicates": 2, "shared": None}
+
+    def test_shared_between_workers(self, tmp_path):
+        db_file = str(tmp_path / "update_ids.sqlite3")
+        first = create_update_dedup(100, db_file)
+        second = create_update_dedup(100, db_file)
+
+        assert not first.is_duplicate(10)
+        # Повтор пришел в другой процесс
+        assert second.is_duplicate(10)
+        assert not second.is_duplicate(11) and first.is_duplicate(11)
+        second.forget(11)
+        assert not first.is_duplicate(11)
+        assert (first.duplicates, second.duplicates) == (1, 1)
+
+    def test_shared_prunes_old_ids(self, tmp_path):
+        shared = SqliteUpdateIds(str(tmp_path / "update_ids.sqlite3"), max_size=100, prune_every=50)
+        for update_id in range(1000):
+            assert shared.add(update_id)
+        count = shared.conn.execute("SELECT COUNT(*) FROM update_ids").fetchone()[0]
+        assert count <= 150
+        assert not shared.add(999)
+
+    def test_concurrent_duplicates_accepted_once(self):
+        dedup = UpdateDeduplicator(max_size=10_000)
+        accepted = []
+
+        def post():
+            accepted.extend(update_id for update_id in range(1000) if not dedup.is_duplicate(update_id))
+
+        threads = [threading.Thread(target=post) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(accepted) == list(range(1000))
+        assert dedup.duplicates == 3000
+
+
+class Recorder:
+    def __init__(self):
+        self.updates = []
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def process_update(self, update):
+        self.updates.append(update.update_id)
+
+
+def test_flask_webhook_skips_retries(monkeypatch):
+    from telegram.ext import Application
+
+    import main_bot_railway
+    from utils.metrics import updates_duplicate
+
+    recorder = Recorder()
+    update_loop = UpdateLoop(recorder).start()
+    monkeypatch.setattr(main_bot_railway, "application", Application.builder().token("123:TEST").build())
+    monkeypatch.setattr(main_bot_railway, "update_loop", update_loop)
+    monkeypatch.setattr(main_bot_railway, "update_dedup", UpdateDeduplicator())
+    monkeypatch.setattr(main_bot_railway, "BOT_TOKEN", "123:TEST")
+    client = main_bot_railway.app.test_client()
+    before = updates_duplicate.value("message")
+
+    codes = [client.post("/webhook/123:TEST", json=message(update_id)).status_code for update_id in (5, 5, 6, 5)]
+    update_loop.stop()
+
+    assert codes == [200, 200, 200, 200]
+    assert recorder.updates == [5, 6]
+    assert updates_duplicate.value("message") == before + 2
+
+
+@pytest.mark.asyncio
+async def test_rejected_update_is_not_marked_seen():
+    pytest.importorskip("tornado")
+    from telegram.ext import Application
+
+    from utils.update_queue import UpdateQueue, UpdateQueueFull
+    from utils.webhook_server import WebhookServer
+
+    class FakeApplication:
+        bot = Application.builder().token("123:TEST").build().bot
+
+    server = WebhookServer(FakeApplication(), "123:TEST", dict, str, dedup=UpdateDeduplicator())
+    # Очередь без мест - как при переполнении
+    server.queue = UpdateQueue(server._process, maxsize=0, workers=1).start()
+    with pytest.raises(UpdateQueueFull):
+        server.submit(message(8))
+    assert not server.dedup.is_duplicate(8)
+    assert server.dedup.is_duplicate(8)
+    await server.queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_submit_is_not_marked_seen():
+    pytest.importorskip("tornado")
+    from telegram.ext import Application
+
+    from utils.update_queue import UpdateQueue
+    from utils.webhook_server import WebhookServer
+
+    class FakeApplication:
+        bot = Application.builder().token("123:TEST").build().bot
+
+    server = WebhookServer(FakeApplication(), "123:TEST", dict, str, dedup=UpdateDeduplicator())
+    # Очередь остановлена - put поднимает RuntimeError, webhook отвечает 500
+    server.queue = UpdateQueue(server._process, maxsize=10, workers=1).start()
+    await server.queue.stop()
+    with pytest.raises(RuntimeError):
+        server.submit(message(9))
+    assert not server.dedup.is_duplicate(9)
+
+
+@pytest.mark.slow
+def test_benchmark_dedup_check(tmp_path):
+    """Бенчмарк: цена проверки update_id на горячем пути"""
+    count = 50_000
+    memory = UpdateDeduplicator()
+    started = time.perf_counter()
+    for update_id in range(count):
+        memory.is_duplicate(update_id)
+    memory_us = (time.perf_counter() - started) / count * 1e6
+
+    shared = create_update_dedup(10_000, str(tmp_path / "update_ids.sqlite3"))
+    started = time.perf_counter()
+    for update_id in range(count // 10):
+        shared.is_duplicate(update_id)
+    shared_us = (time.perf_counter() - started) / (count // 10) * 1e6
+    print(f"\nпамять: {memory_us:.2f} мкс на апдейт; память + SQLite: {shared_us:.1f} мкс на апдейт")
+    assert memory_us < 50
@@ -0,0 +1,175 @@
+# tests/utils/test_update_loop.py - Тесты постоянного event loop апдейтов
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.update_loop import UpdateLoop
+
+
+class FakeApplication:
+    """Application с process_update без сети: запоминает loop каждого вызова"""
+
+    def __init__(self, work=None):
+        self.loops = set()
+        self.updates = []
+        self.initialized_in = None
+        self.shutdown_in = None
+        self.work = work
+
+    async def initialize(self):
+        self.initialized_in = asyncio.get_running_loop()
+
+    async def shutdown(self):
+        self.shutdown_in = asyncio.get_running_loop()
+
+    async def process_update(self, update):
+        self.loops.add(asyncio.get_running_loop())
+        if update == "fail":
+            raise ValueError("сбой")
+        if self.work is not None:
+            await self.work(update)
+        self.updates.append(update)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert condition()
+
+
+class TestUpdateLoop:
+    """Тесты UpdateLoop"""
+
+    def test_single_loop_for_all_updates(self):
+        application = FakeApplication()
+        update_loop = UpdateLoop(application).start()
+        results = []
+
+        def post(start):
+            for i in range(start, start + 50):
+                update_loop.submit(i, on_done=results.append)
+
+        threads = [threading.Thread(target=post, args=(n * 50,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        update_loop.submit("fail", on_done=results.append)
+        wait_for(lambda: update_loop.processed == 201)
+
+        assert application.loops == {application.initialized_in}
+        assert sorted(application.updates) == list(range(200))
+        assert results.count(None) == 200 and isinstance(results[-1], ValueError)
+        metrics = update_loop.get_metrics()
+        assert (metrics["depth"], metrics["accepted"], metrics["processed"], metrics["errors"]) == (0, 201, 201, 1)
+
+        update_loop.stop()
+        assert application.shutdown_in is application.initialized_in
+        with pytest.raises(RuntimeError):
+            update_loop.submit(1)
+
+    def test_stop_waits_for_in_flight(self):
+        release = threading.Event()
+
+        async def slow(update):
+            while not release.is_set():
+                await asyncio.sleep(0.005)
+
+        application = FakeApplication(work=slow)
+        update_loop = UpdateLoop(application).start()
+        update_loop.submit(1)
+        threading.Timer(0.05, release.set).start()
+        update_loop.stop()
+        assert application.updates == [1]
+
+
+def test_webhook_route_submits_to_loop(monkeypatch):
+    from telegram.ext import Application
+
+    import main_bot_railway
+    from utils.metrics import updates_processed
+
+    fake = FakeApplication()
+    update_loop = UpdateLoop(fake).start()
+    monkeypatch.setattr(main_bot_railway, "application", Application.builder().token("123:TEST").build())
+    monkeypatch.setattr(main_bot_railway, "update_loop", update_loop)
+    monkeypatch.setattr(main_bot_railway, "BOT_TOKEN", "123:TEST")
+    before = updates_processed.value("message", "ok")
+
+    response = main_bot_railway.app.test_client().post("/webhook/123:TEST", json={
+        "update_id": 7,
+        "message": {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "hi"},
+    })
+
+    assert response.status_code == 200
+    wait_for(lambda: update_loop.processed == 1)
+    assert fake.updates[0].update_id == 7
+    wait_for(lambda: updates_processed.value("message", "ok") == before + 1)
+    update_loop.stop()
+
+
+@pytest.mark.slow
+def test_benchmark_thread_per_update_vs_persistent_loop():
+    """Бенчмарк: поток + asyncio.run на апдейт против одного постоянного loop
+
+    Пропускная способность - пачкой без пауз; задержка (p99 от приема до
+    конца обработки) - при равномерном потоке 500 апдейтов в секунду.
+    """
+    async def handler(update):
+        await asyncio.sleep(0)
+
+    def pace(index, started, interval):
+        if interval:
+            delay = started + index * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def run_old(count, interval=0):
+        application = FakeApplication(work=handler)
+        latencies = []
+
+        def process(submitted):
+            asyncio.run(application.process_update(submitted))
+            latencies.append(time.perf_counter() - submitted)
+
+        started = time.perf_counter()
+        threads = []
+        for index in range(count):
+            pace(index, started, interval)
+            thread = threading.Thread(target=process, args=(time.perf_counter(),), daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started, latencies
+
+    def run_new(count, interval=0):
+        update_loop = UpdateLoop(FakeApplication(work=handler), queue_size=count).start()
+        latencies = []
+        started = time.perf_counter()
+        for index in range(count):
+            pace(index, started, interval)
+            submitted = time.perf_counter()
+            update_loop.submit(submitted, on_done=lambda error, s=submitted: latencies.append(time.perf_counter() - s))
+        wait_for(lambda: update_loop.processed == count, timeout=30)
+        elapsed = time.perf_counter() - started
+        update_loop.stop()
+        return elapsed, latencies
+
+    def p99(latencies):
+        return sorted(latencies)[int(len(latencies) * 0.99)] * 1000
+
+    count = 2000
+    old_time, _ = run_old(count)
+    new_time, _ = run_new(count)
+    _, old_latencies = run_old(1000, interval=0.002)
+    _, new_latencies = run_new(1000, interval=0.002)
+    print(
+        f"\nпоток+asyncio.run: {count / old_time:.0f} апд/с, p99 {p99(old_latencies):.3f} мс; "
+        f"постоянный loop: {count / new_time:.0f} апд/с, p99 {p99(new_latencies):.3f} мс"
+    )
+    assert count / new_time > 2 * count / old_time
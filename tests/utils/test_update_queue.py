@@ -0,0 +1,275 @@
+# tests/utils/test_update_queue.py - Тесты ограниченной очереди приема апдейтов
+
+import asyncio
+import random
+import threading
+import time
+
+import pytest
+
+from utils.metrics import MetricsRegistry, register_update_queue_metrics
+from utils.update_loop import UpdateLoop
+from utils.update_queue import UpdateQueue, UpdateQueueFull, chat_key
+
+
+class Gate:
+    """Обработчик, который держит апдейты до release и считает одновременные"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.done = []
+        self.running = 0
+        self.peak = 0
+
+    async def __call__(self, update):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await self.release.wait()
+        self.running -= 1
+        self.done.append(update)
+
+
+class TestUpdateQueue:
+    """Тесты UpdateQueue"""
+
+    @pytest.mark.asyncio
+    async def test_rejects_when_full_and_bounds_workers(self):
+        gate = Gate()
+        queue = UpdateQueue(gate, maxsize=5, workers=2).start()
+        for update in range(5):
+            queue.put(update)
+        with pytest.raises(UpdateQueueFull):
+            queue.put(5)
+        await asyncio.sleep(0.01)
+        queue.put(5)
+        queue.put(6)
+        # 2 в обработке, 5 в очереди - восьмой не помещается
+        assert (queue.active, queue.depth) == (2, 5)
+        with pytest.raises(UpdateQueueFull):
+            queue.put(7)
+        await asyncio.sleep(0.01)
+        assert (queue.active, queue.depth) == (2, 5)
+
+        gate.release.set()
+        await queue.stop()
+        assert gate.peak == 2
+        assert sorted(gate.done) == list(range(7))
+        metrics = queue.get_metrics()
+        assert (metrics["accepted"], metrics["rejected"], metrics["processed"]) == (7, 2, 7)
+        assert queue.wait_latency.get("updates").count == 7
+        with pytest.raises(RuntimeError):
+            queue.put(8)
+
+    @pytest.mark.asyncio
+    async def test_put_from_other_threads(self):
+        done = []
+
+        async def process(update):
+            done.append((update, threading.get_ident()))
+
+        queue = UpdateQueue(process, maxsize=1000, workers=4).start()
+        errors = []
+
+        def on_done(error):
+            errors.append(error)
+
+        threads = [
+            threading.Thread(target=lambda n=n: [queue.put(n * 100 + i, on_done) for i in range(100)])
+            for n in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        await queue.stop()
+
+        assert sorted(update for update, _ in done) == list(range(400))
+        assert {thread_id for _, thread_id in done} == {threading.get_ident()}
+        assert errors == [None] * 400
+
+    def test_metrics(self):
+        registry = MetricsRegistry()
+        queue = UpdateQueue(None, maxsize=10, workers=1)
+        queue.rejected = 3
+        queue.wait_latency.record("updates", 0.002)
+        register_update_queue_metrics(registry, queue)
+        text = registry.render()
+        assert "bot_update_queue_capacity 10" in text
+        assert "bot_update_queue_rejected_total 3" in text
+        assert 'bot_update_queue_wait_seconds_count{queue="updates"} 1' in text
+
+
+class TestPerChatOrder:
+    """Апдейты одного чата - по порядку, разных чатов - параллельно"""
+
+    def test_chat_key(self):
+        from telegram import Update
+
+        message = {"message_id": 1, "date": 0, "chat": {"id": 42, "type": "private"}, "text": "hi"}
+        callback = {"id": "1", "from": {"id": 7, "is_bot": False, "first_name": "A"}, "chat_instance": "c",
+                    "message": message, "data": "gpt_question"}
+        inline = {"id": "1", "from": {"id": 7, "is_bot": False, "first_name": "A"}, "query": "", "offset": ""}
+        assert chat_key({"update_id": 1, "message": message}) == 42
+        assert chat_key({"update_id": 1, "callback_query": callback}) == 42
+        assert chat_key({"update_id": 1, "inline_query": inline}) == 7
+        assert chat_key({"update_id": 1}) is None
+        assert chat_key(Update.de_json({"update_id": 1, "callback_query": callback}, None)) == 42
+        assert chat_key(Update.de_json({"update_id": 1, "inline_query": inline}, None)) == 7
+        assert chat_key(5) is None
+
+    @pytest.mark.asyncio
+    async def test_order_within_chat(self):
+        seen = {}
+        running = {}
+        overlap = []
+        peak = [0, 0]
+
+        async def process(update):
+            chat, seq = update
+            running[chat] = running.get(chat, 0) + 1
+            overlap.append(running[chat] > 1)
+            peak[0] += 1
+            peak[1] = max(peak)
+            await asyncio.sleep(random.random() / 500)
+            seen.setdefault(chat, []).append(seq)
+            running[chat] -= 1
+            peak[0] -= 1
+
+        queue = UpdateQueue(process, maxsize=10_000, workers=8, key=lambda update: update[0]).start()
+        for seq in range(20):
+            for chat in range(30):
+                queue.put((chat, seq))
+        await queue.stop()
+
+        assert seen == {chat: list(range(20)) for chat in range(30)}
+        assert not any(overlap)
+        assert peak[1] == 8
+        assert queue.get_metrics()["chats_active"] == 0
+
+    @pytest.mark.asyncio
+    async def test_key_error_does_not_kill_worker(self):
+        done = []
+
+        async def process(update):
+            done.append(update)
+
+        def key(update):
+            if update == "bad":
+                raise KeyError("chat")
+            return update[0]
+
+        def on_done(error):
+            raise RuntimeError("callback")
+
+        queue = UpdateQueue(process, maxsize=10, workers=1, key=key).start()
+        queue.put("bad")
+        queue.put(("a", 1), on_done)
+        queue.put(("a", 2))
+        await queue.stop(timeout=1)
+
+        # Единственный обработчик жив, место в очереди освобождено
+        assert done == ["bad", ("a", 1), ("a", 2)]
+        assert queue.in_flight == 0
+        assert queue.get_metrics()["chats_active"] == 0
+
+    @pytest.mark.asyncio
+    async def test_hot_chat_does_not_block_workers(self):
+        release = asyncio.Event()
+        done = []
+
+        async def process(update):
+            if update[0] == "hot":
+                await release.wait()
+            done.append(update)
+
+        queue = UpdateQueue(process, maxsize=1000, workers=2, key=lambda update: update[0]).start()
+        for seq in range(50):
+            queue.put(("hot", seq))
+        for chat in range(10):
+            queue.put((chat, 0))
+        await asyncio.sleep(0.05)
+        # Очередь горячего чата ждет в цепочке, второй обработчик свободен для остальных
+        assert sorted(done) == [(chat, 0) for chat in range(10)]
+        release.set()
+        await queue.stop()
+        assert [seq for chat, seq in done if chat == "hot"] == list(range(50))
+
+
+@pytest.mark.slow
+def test_benchmark_per_chat_dispatcher():
+    """Бенчмарк: 500 чатов по 10 апдейтов, обработка ~2 мс (ожидание сети)
+
+    Один обработчик (порядок есть, параллелизма нет), 32 обработчика без
+    ключа (параллельно, порядок не гарантирован) и 32 обработчика с
+    порядком по чату.
+    """
+    chats, per_chat = 500, 10
+
+    def run(workers, key):
+        seen = {}
+
+        async def process(update):
+            await asyncio.sleep(random.uniform(0.001, 0.003))
+            seen.setdefault(update[0], []).append(update[1])
+
+        async def main():
+            queue = UpdateQueue(process, maxsize=chats * per_chat, workers=workers, key=key).start()
+            started = time.perf_counter()
+            # Чаты пишут очередями сообщений подряд, как при быстром наборе
+            for chat in range(chats):
+                for seq in range(per_chat):
+                    queue.put((chat, seq))
+            await queue.stop(timeout=120)
+            return time.perf_counter() - started
+
+        elapsed = asyncio.run(main())
+        reordered = sum(seqs != sorted(seqs) for seqs in seen.values())
+        return chats * per_chat / elapsed, reordered
+
+    serial, _ = run(1, None)
+    unordered, unordered_bad = run(32, None)
+    ordered, ordered_bad = run(32, lambda update: update[0])
+    print(
+        f"\n1 обработчик: {serial:.0f} апд/с; 32 без порядка: {unordered:.0f} апд/с, "
+        f"чатов с нарушенным порядком {unordered_bad}; 32 с порядком по чату: {ordered:.0f} апд/с, "
+        f"нарушений {ordered_bad}"
+    )
+    assert ordered_bad == 0
+    assert ordered > 10 * serial
+
+
+def test_flask_webhook_returns_503_when_full(monkeypatch):
+    from telegram.ext import Application
+
+    import main_bot_railway
+
+    release = threading.Event()
+
+    class Blocking:
+        async def initialize(self):
+            pass
+
+        async def shutdown(self):
+            pass
+
+        async def process_update(self, update):
+            while not release.is_set():
+                await asyncio.sleep(0.005)
+
+    update_loop = UpdateLoop(Blocking(), queue_size=1, queue_workers=1).start()
+    monkeypatch.setattr(main_bot_railway, "application", Application.builder().token("123:TEST").build())
+    monkeypatch.setattr(main_bot_railway, "update_loop", update_loop)
+    monkeypatch.setattr(main_bot_railway, "BOT_TOKEN", "123:TEST")
+    client = main_bot_railway.app.test_client()
+
+    responses = []
+    for update_id in range(4):
+        responses.append(client.post("/webhook/123:TEST", json={
+            "update_id": update_id,
+            "message": {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "hi"},
+        }))
+    # Первый в обработке или в очереди, очередь на 1 место - хотя бы последний отклонен
+    assert responses[-1].status_code == 503 and responses[-1].headers["Retry-After"] == "1"
+    assert update_loop.queue.rejected >= 1
+    release.set()
+    update_loop.stop()
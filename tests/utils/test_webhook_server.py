@@ -0,0 +1,113 @@
+# tests/utils/test_webhook_server.py - Тесты асинхронного webhook-сервера
+
+import asyncio
+import json
+import threading
+
+import pytest
+
+tornado = pytest.importorskip("tornado")
+from tornado.httpclient import AsyncHTTPClient  # noqa: E402
+from tornado.netutil import bind_sockets  # noqa: E402
+from telegram.ext import Application  # noqa: E402
+
+from utils.webhook_server import WebhookServer, serve_webhook  # noqa: E402
+
+MESSAGE = {
+    "update_id": 7,
+    "message": {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "hi"},
+}
+
+
+class FakeApplication:
+    """process_update без сети: запоминает loop и поток обработки"""
+
+    def __init__(self):
+        self.bot = Application.builder().token("123:TEST").build().bot
+        self.updates = []
+        self.loops = set()
+        self.threads = set()
+        self.initialized = self.shut_down = False
+
+    async def initialize(self):
+        self.initialized = True
+
+    async def shutdown(self):
+        self.shut_down = True
+
+    async def process_update(self, update):
+        self.loops.add(asyncio.get_running_loop())
+        self.threads.add(threading.get_ident())
+        await asyncio.sleep(0.01)
+        self.updates.append(update.update_id)
+
+
+def start_server():
+    """Сервер на свободном порту 127.0.0.1 и его базовый URL"""
+    application = FakeApplication()
+    server = WebhookServer(
+        application, "123:TEST", health=lambda: {"status": "healthy"}, metrics=lambda: "m_total 1\n",
+        metrics_content_type="text/plain; version=0.0.4",
+    )
+    sockets = bind_sockets(0, "127.0.0.1")
+    server.listen(None, sockets=sockets)
+    base = f"http://127.0.0.1:{sockets[0].getsockname()[1]}"
+    return server, application, base
+
+
+async def fetch(url, method="GET", body=None):
+    response = await AsyncHTTPClient().fetch(url, method=method, body=body, raise_error=False)
+    return response.code, response.body.decode("utf-8"), response.headers
+
+
+class TestWebhookServer:
+    """Маршруты и обработка в loop сервера"""
+
+    @pytest.mark.asyncio
+    async def test_routes(self):
+        server, application, base = start_server()
+
+        code, _, _ = await fetch(f"{base}/webhook/123:TEST", "POST", json.dumps(MESSAGE))
+        assert code == 200
+        assert (await fetch(f"{base}/webhook/wrong", "POST", json.dumps(MESSAGE)))[0] == 404
+        assert (await fetch(f"{base}/webhook/123:TEST", "POST", "not json"))[0] == 400
+        assert (await fetch(f"{base}/webhook/123:TEST", "POST", "{}"))[0] == 400
+
+        code, body, _ = await fetch(f"{base}/health")
+        assert code == 200 and json.loads(body) == {"status": "healthy"}
+        code, body, headers = await fetch(f"{base}/metrics")
+        assert body == "m_total 1\n" and headers["Content-Type"] == "text/plain; version=0.0.4"
+
+        await server.stop()
+        assert application.updates == [7]
+        # Обработка - в том же loop и потоке, что и HTTP-сервер
+        assert application.loops == {asyncio.get_running_loop()}
+        assert application.threads == {threading.get_ident()}
+        assert server.get_metrics()["processed"] == 1
+
+    @pytest.mark.asyncio
+    async def test_stop_waits_for_updates(self):
+        server, application, _ = start_server()
+        for update_id in range(5):
+            server.submit(dict(MESSAGE, update_id=update_id))
+        assert server.in_flight == 5
+        await server.stop()
+        assert sorted(application.updates) == list(range(5))
+
+
+@pytest.mark.asyncio
+async def test_serve_webhook_lifecycle():
+    application = FakeApplication()
+    server = WebhookServer(application, "123:TEST", health=dict, metrics=str)
+    stop_event = asyncio.Event()
+    calls = []
+
+    async def setup():
+        calls.append("setup")
+
+    task = asyncio.create_task(serve_webhook(server, 0, setup, stop_event))
+    await asyncio.sleep(0.05)
+    assert application.initialized and calls == ["setup"]
+    stop_event.set()
+    await asyncio.wait_for(task, 5)
+    assert application.shut_down
@@ -0,0 +1,149 @@
+# tests/utils/test_worker_stats.py - Тесты статистики нескольких процессов-воркеров
+
+import multiprocessing
+import time
+from datetime import datetime
+
+import pytest
+
+from handlers.stats import BotStats
+from utils.storage import JsonStatsStorage, create_stats_storage
+from utils.worker_stats import MergedStatsStorage, merge_stats, worker_ids, worker_storages
+from utils.writer import BackgroundWriter
+
+COMMANDS = ("start", "help", "tarot", "runes")
+
+
+def worker_events(worker, count):
+    """События воркера: пользователи пересекаются между воркерами"""
+    now = time.time()
+    return [
+        (now, (worker * 7 + i) % 40, f"user{i % 40}", None, COMMANDS[i % len(COMMANDS)], i % 3 == 0, None)
+        for i in range(count)
+    ]
+
+
+def run_worker(stats_file, backend, db_file, worker, count):
+    """Процесс-воркер: применяет события пачками, групповая запись сбрасывает их на диск"""
+    stats = BotStats(
+        storage=create_stats_storage(stats_file, backend, str(worker), db_file),
+        writer=BackgroundWriter(f"writer-{worker}"), worker_id=str(worker),
+    )
+    committer = stats.enable_group_commit(interval_ms=5, max_mutations=20)
+    events = worker_events(worker, count)
+    for start in range(0, count, 10):
+        stats.apply_events(events[start:start + 10])
+        time.sleep(0.001)
+    committer.close()
+    stats.writer.flush()
+
+
+def expected_totals(workers, count):
+    commands, messages, users = {}, 0, {}
+    for worker in range(workers):
+        for _, user_id, _, _, command, is_message, _ in worker_events(worker, count):
+            commands[command] = commands.get(command, 0) + 1
+            messages += is_message
+            user = users.setdefault(str(user_id), {"messages": 0, "commands": 0})
+            user["messages"] += is_message
+            user["commands"] += 1
+    return commands, messages, users
+
+
+class TestMergeStats:
+    """Слияние статистики процессов"""
+
+    def test_merge_users_days_and_rollups(self, tmp_path):
+        first = BotStats(storage=JsonStatsStorage(str(tmp_path / "a.json")), worker_id=None)
+        second = BotStats(storage=JsonStatsStorage(str(tmp_path / "b.json")), worker_id=None)
+        first.add_user(1, "old", "Старое", today="2024-01-01")
+        first.add_user(1, "old", "Старое", today="2024-01-05")
+        second.add_user(1, "new", "Новое", today="2024-01-03")
+        for stats in (first, second):
+            stats.add_command(1, "start", today="2024-01-03")
+            stats.add_message(1)
+            stats.add_user(2, None, None, today="2024-01-03")
+
+        merged = merge_stats([first.stats, second.stats])
+        user = merged["users"]["1"]
+        assert (user["first_seen"], user["last_seen"], user["username"]) == ("2024-01-01", "2024-01-05", "old")
+        assert user["message_count"] == 2 and user["commands_used"] == {"start": 2}
+        assert merged["commands"] == {"start": 2} and merged["total_messages"] == 2
+        assert merged["daily_stats"]["2024-01-03"]["commands"] == {"start": 2}
+        assert merged["daily_stats"]["2024-01-03"]["unique_users"].count() == 1
+        # Пользователь 2 новый в обоих процессах, но в сумме - один
+        assert dict(merged["rollups"].first_seen_days) == {"2024-01-01": 1, "2024-01-03": 1}
+        assert merged["rollups"].buckets["day"]["2024-01-03"]["new"] == 1
+        # Исходные данные не изменились
+        assert first.stats["users"]["1"]["message_count"] == 1
+
+    def test_merged_view_includes_memory_and_base_file(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        legacy = BotStats(storage=create_stats_storage("bot_stats.json", "json"), worker_id=None)
+        legacy.add_user(100, "legacy", None)
+        legacy.add_command(100, "start")
+        legacy.save_stats()
+
+        other = BotStats(storage=create_stats_storage("bot_stats.json", "json", "b"), worker_id="b")
+        other.add_user(200, "other", None)
+        other.add_command(200, "help")
+        other.save_stats()
+
+        local = BotStats(storage=create_stats_storage("bot_stats.json", "json", "a"), worker_id="a")
+        local.add_user(300, "local", None)
+        local.add_command(300, "help")
+
+        assert worker_ids("bot_stats.json", "json") == ["b"]
+        view = local.merged_view()
+        assert view.get_user_count() == 3
+        assert view.stats["commands"] == {"start": 1, "help": 2}
+        assert view.get_active_users(1) == 3
+        assert len(worker_storages("bot_stats.json", "json")) == 2
+        with pytest.raises(NotImplementedError):
+            MergedStatsStorage([]).prepare({})
+        # Без STATS_WORKER_ID отчет - сам объект
+        assert legacy.merged_view() is legacy
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="нужен fork")
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_concurrent_workers_add_up(tmp_path, backend):
+    """Несколько процессов пишут параллельно; слияние при чтении сходится точно"""
+    workers, count = 4, 600
+    stats_file = str(tmp_path / "bot_stats.json")
+    db_file = str(tmp_path / "bot_data.sqlite3")
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=run_worker, args=(stats_file, backend, db_file, worker, count))
+        for worker in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    # Чтение во время записи: файлы воркеров заменяются атомарно, счетчики только растут
+    seen = 0
+    while any(process.is_alive() for process in processes):
+        merged = MergedStatsStorage(worker_storages(stats_file, backend, db_file)).load()
+        assert merged["total_messages"] >= seen
+        seen = merged["total_messages"]
+        time.sleep(0.01)
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    commands, messages, users = expected_totals(workers, count)
+    assert worker_ids(stats_file, backend, db_file) == [str(worker) for worker in range(workers)]
+    storage = MergedStatsStorage(worker_storages(stats_file, backend, db_file))
+    merged = storage.load()
+    storage.close()
+    assert dict(merged["commands"]) == commands
+    assert merged["total_messages"] == messages
+    assert set(merged["users"]) == set(users)
+    for user_key, expected in users.items():
+        user = merged["users"][user_key]
+        assert user["message_count"] == expected["messages"]
+        assert sum(user["commands_used"].values()) == expected["commands"]
+    today = datetime.now().strftime('%Y-%m-%d')
+    assert sum(merged["daily_stats"][today]["commands"].values()) == workers * count
+    assert merged["rollups"].recent("day", 1)["commands"] == workers * count
+    assert merged["rollups"].new_users(0) == len(users)
@@ -0,0 +1,184 @@
+# tests/utils/test_writer.py - Тесты фоновой записи
+
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from utils.database import AsyncReactionsDB, ReactionsDB
+from utils.storage import JsonStatsStorage
+from utils.writer import BackgroundWriter
+from handlers.stats import BotStats
+
+
+def block_writer(writer):
+    """Занимает поток записи, пока не будет установлено возвращенное событие"""
+    started = threading.Event()
+    gate = threading.Event()
+    writer.submit(lambda: (started.set(), gate.wait()))
+    started.wait(timeout=5)
+    return gate
+
+
+class TestBackgroundWriter:
+    """Тесты потока записи"""
+
+    def test_jobs_run_in_order_on_writer_thread(self):
+        writer = BackgroundWriter()
+        calls = []
+        for i in range(5):
+            writer.submit(lambda i=i: calls.append((i, threading.current_thread().name)))
+        writer.flush(timeout=5)
+
+        assert [i for i, _ in calls] == list(range(5))
+        assert {name for _, name in calls} == {writer.name}
+
+    def test_metrics(self):
+        writer = BackgroundWriter()
+        gate = block_writer(writer)
+        writer.submit(lambda: None)
+        assert writer.queue_depth == 1
+
+        gate.set()
+        writer.flush(timeout=5)
+        metrics = writer.get_metrics()
+        assert metrics["queue_depth"] == 0
+        assert metrics["jobs_done"] == 3
+        assert metrics["max_flush_ms"] >= metrics["avg_flush_ms"] >= 0
+
+    def test_errors_are_counted(self):
+        writer = BackgroundWriter()
+        future = writer.submit(lambda: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            future.result(timeout=5)
+        assert writer.get_metrics()["errors"] == 1
+
+
+class TestAsyncReactionsDB:
+    """Тесты асинхронного API реакций"""
+
+    @pytest.mark.asyncio
+    async def test_add_reaction_returns_before_disk_write(self, tmp_path):
+        writer = BackgroundWriter()
+        gate = block_writer(writer)
+
+        db = ReactionsDB(str(tmp_path / "reactions.json"))
+        async_db = AsyncReactionsDB(db, writer)
+        await async_db.add_reaction(1, "post", "❤️")
+
+        # Память обновлена сразу, журнал еще не записан
+        assert async_db.get_post_reactions("post") == {"❤️": 1}
+        assert writer.queue_depth == 1
+
+        gate.set()
+        await async_db.flush()
+        db.close()
+        assert ReactionsDB(str(tmp_path / "reactions.json")).get_reaction(1, "post") == "❤️"
+
+
+def test_bot_stats_request_save_coalesces(tmp_path):
+    """Несколько запросов сохранения до записи дают одну запись"""
+    writer = BackgroundWriter()
+    gate = block_writer(writer)
+
+    stats_file = tmp_path / "bot_stats.json"
+    stats = BotStats(storage=JsonStatsStorage(str(stats_file)), writer=writer)
+    for user_id in range(3):
+        stats.add_user(user_id)
+        stats.request_save()
+    assert writer.queue_depth == 1
+    assert not stats_file.exists()
+
+    gate.set()
+    writer.flush(timeout=5)
+    reloaded = BotStats(storage=JsonStatsStorage(str(stats_file)), writer=writer)
+    assert reloaded.get_user_count() == 3
+
+
+class TestGroupCommit:
+    """Тесты групповой записи"""
+
+    def test_burst_is_written_in_a_few_flushes(self, tmp_path):
+        """500 реакций подряд дают единицы сбросов, а не 500 перезаписей"""
+        writer = BackgroundWriter()
+        db = ReactionsDB(str(tmp_path / "reactions.json"), use_log=False)
+        committer = db.enable_group_commit(writer, interval_ms=200, max_mutations=100)
+
+        for user_id in range(500):
+            db.add_reaction(user_id, "post", "❤️")
+        db.close()
+
+        assert committer.mutations == 500
+        assert 1 <= committer.flushes <= 10
+        reloaded = ReactionsDB(str(tmp_path / "reactions.json"), use_log=False)
+        assert reloaded.get_post_reactions("post") == {"❤️": 500}
+
+    def test_interval_flush_without_reaching_limit(self, tmp_path):
+        writer = BackgroundWriter()
+        db = ReactionsDB(str(tmp_path / "reactions.json"))
+        committer = db.enable_group_commit(writer, interval_ms=50, max_mutations=1000)
+        db.add_reaction(1, "post", "❤️")
+
+        for _ in range(100):
+            if committer.flushes:
+                break
+            time.sleep(0.02)
+        writer.flush(timeout=5)
+        assert committer.flushes == 1
+        assert ReactionsDB(str(tmp_path / "reactions.json")).get_reaction(1, "post") == "❤️"
+        db.close()
+
+    def test_reactions_not_blocked_by_storage_io(self, tmp_path):
+        """Пока пачка пишется на диск, реакции применяются без ожидания"""
+        writer = BackgroundWriter()
+        db = ReactionsDB(str(tmp_path / "reactions.json"))
+        db.enable_group_commit(writer, interval_ms=60_000, max_mutations=1)
+        writing = threading.Event()
+        gate = threading.Event()
+        record_many = db.storage.record_many
+
+        def slow_record_many(records, data):
+            writing.set()
+            gate.wait(timeout=5)
+            record_many(records, data)
+
+        db.storage.record_many = slow_record_many
+        db.add_reaction(1, "post", "❤️")
+        assert writing.wait(timeout=5)
+
+        started = time.perf_counter()
+        db.apply_reaction(2, "post", "👍")
+        assert db.get_post_reactions("post") == {"❤️": 1, "👍": 1}
+        assert time.perf_counter() - started < 0.5
+        gate.set()
+        db.close()
+        assert ReactionsDB(str(tmp_path / "reactions.json")).get_reaction(1, "post") == "❤️"
+
+    def test_compaction_snapshot_includes_logged_reactions(self, tmp_path):
+        """Компактизация из пачки: снапшот снят до записи и содержит весь журнал"""
+        writer = BackgroundWriter()
+        db = ReactionsDB(str(tmp_path / "reactions.json"), compact_every=50)
+        db.enable_group_commit(writer, interval_ms=5, max_mutations=7)
+        for user_id in range(200):
+            db.add_reaction(user_id, f"p{user_id % 3}", "❤️")
+        db.close()
+        assert db.storage.snapshot_versions()
+
+        reloaded = ReactionsDB(str(tmp_path / "reactions.json"))
+        assert reloaded.data == db.data
+
+    def test_stats_close_forces_final_flush(self, tmp_path):
+        writer = BackgroundWriter()
+        stats_file = tmp_path / "bot_stats.json"
+        stats = BotStats(storage=JsonStatsStorage(str(stats_file)), writer=writer)
+        committer = stats.enable_group_commit(interval_ms=60_000, max_mutations=1000)
+        stats.add_user(1)
+        stats.request_save()
+        assert not stats_file.exists()
+
+        committer.close()
+        assert committer.flushes == 1
+        assert json.loads(stats_file.read_text(encoding="utf-8"))["users"]["1"]
+        assert not os.path.exists(f"{stats_file}.tmp")
@@ -0,0 +1,109 @@
+# utils/bitmap.py - Компактное множество неотрицательных целых (roaring bitmap)
+from array import array
+from bisect import bisect_left
+
+# Контейнер-массив переводится в битовую карту, когда в нем больше значений
+ARRAY_LIMIT = 4096
+_BITMAP_BYTES = 1 << 13  # 65536 бит
+
+
+class RoaringBitmap:
+    """Множество целых в стиле Roaring
+
+    Старшие биты значения (value >> 16) выбирают контейнер, младшие 16 бит
+    хранятся в нем: до ARRAY_LIMIT значений - отсортированный array('H')
+    по 2 байта на значение, дальше - битовая карта на 8 КБ. Число значений
+    поддерживается счетчиком, поэтому len() - O(1).
+    """
+
+    __slots__ = ("containers", "_len")
+
+    def __init__(self, values=()):
+        self.containers = {}
+        self._len = 0
+        for value in values:
+            self.add(value)
+
+    def add(self, value):
+        """Добавляет значение; возвращает True, если его не было"""
+        high, low = value >> 16, value & 0xFFFF
+        container = self.containers.get(high)
+        if container is None:
+            self.containers[high] = array('H', (low,))
+        elif type(container) is array:
+            position = bisect_left(container, low)
+            if position < len(container) and container[position] == low:
+                return False
+            container.insert(position, low)
+            if len(container) > ARRAY_LIMIT:
+                self.containers[high] = self._to_bitmap(container)
+        else:
+            byte, bit = low >> 3, 1 << (low & 7)
+            if container[byte] & bit:
+                return False
+            container[byte] |= bit
+        self._len += 1
+        return True
+
+    def discard(self, value):
+        """Удаляет значение; возвращает True, если оно было"""
+        high, low = value >> 16, value & 0xFFFF
+        container = self.containers.get(high)
+        if container is None:
+            return False
+        if type(container) is array:
+            position = bisect_left(container, low)
+            if position == len(container) or container[position] != low:
+                return False
+            del container[position]
+            if not container:
+                del self.containers[high]
+        else:
+            byte, bit = low >> 3, 1 << (low & 7)
+            if not container[byte] & bit:
+                return False
+            container[byte] &= ~bit & 0xFF
+        self._len -= 1
+        return True
+
+    def __contains__(self, value):
+        container = self.containers.get(value >> 16)
+        if container is None:
+            return False
+        low = value & 0xFFFF
+        if type(container) is array:
+            position = bisect_left(container, low)
+            return position < len(container) and container[position] == low
+        return bool(container[low >> 3] & (1 << (low & 7)))
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        """Значения по возрастанию"""
+        for high in sorted(self.containers):
+            base = high << 16
+            container = self.containers[high]
+            if type(container) is array:
+                for low in container:
+                    yield base | low
+            else:
+                for byte_index, byte in enumerate(container):
+                    while byte:
+                        lowest = byte & -byte
+                        yield base | (byte_index << 3) | (lowest.bit_length() - 1)
+                        byte ^= lowest
+
+    @staticmethod
+    def _to_bitmap(values):
+        bitmap = bytearray(_BITMAP_BYTES)
+        for low in values:
+            bitmap[low >> 3] |= 1 << (low & 7)
+        return bitmap
+
+    def memory_usage(self):
+        """Приблизительный объем данных контейнеров в байтах"""
+        return sum(
+            len(container) * container.itemsize if type(container) is array else len(container)
+            for container in self.containers.values()
+        )
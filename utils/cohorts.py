@@ -0,0 +1,125 @@
+# utils/cohorts.py - Матрица удержания по недельным когортам first_seen
+import csv
+import io
+from datetime import date, timedelta
+
+from utils.last_seen import iter_user_dates
+
+_week_cache = {}
+
+
+def week_start(day):
+    """Понедельник недели даты 'YYYY-MM-DD' (дат в статистике немного - кэшируются)"""
+    monday = _week_cache.get(day)
+    if monday is None:
+        parsed = date.fromisoformat(day)
+        monday = _week_cache[day] = (parsed - timedelta(days=parsed.weekday())).isoformat()
+    return monday
+
+
+def weeks_between(start, end):
+    """Число недель между понедельниками start и end"""
+    return (date.fromisoformat(end) - date.fromisoformat(start)).days // 7
+
+
+class CohortRetention:
+    """Удержание: неделя first_seen × недель с первого визита
+
+    cells[когорта][k] - сколько пользователей когорты (понедельник недели
+    first_seen) были активны через k недель; cells[когорта][0] - размер
+    когорты. Матрица ведется по ходу событий: пользователь попадает в
+    ячейку при первом визите в неделю, то есть когда неделя его
+    last_seen меняется. Отчет - чтение готовых чисел, без обхода
+    пользователей.
+    """
+
+    def __init__(self):
+        self.cells = {}
+
+    def record(self, first_seen, previous_last_seen, today):
+        """Визит пользователя в день today (previous_last_seen is None - новый)
+
+        Возвращает True, если матрица изменилась.
+        """
+        if previous_last_seen == today:
+            return False
+        week = week_start(today)
+        if previous_last_seen is not None and week_start(previous_last_seen) >= week:
+            return False
+        self._add(week_start(first_seen or today), week)
+        return True
+
+    def _add(self, cohort, week, count=1):
+        offset = weeks_between(cohort, week)
+        if offset < 0:
+            return
+        row = self.cells.setdefault(cohort, [])
+        if len(row) <= offset:
+            row.extend([0] * (offset + 1 - len(row)))
+        row[offset] += count
+
+    def matrix(self, cohorts=None):
+        """[(когорта, размер, [доля удержания по неделям])] по возрастанию когорт"""
+        rows = []
+        for cohort in sorted(self.cells)[-cohorts if cohorts else None:]:
+            counts = self.cells[cohort]
+            size = counts[0] if counts else 0
+            rows.append((cohort, size, [count / size if size else 0.0 for count in counts]))
+        return rows
+
+    def render(self, cohorts=8, weeks=8):
+        """Таблица для сообщения: последние cohorts когорт, до weeks недель, в процентах"""
+        lines = ["Неделя     Польз. " + " ".join(f"{f'+{k}':>4}" for k in range(1, weeks))]
+        for cohort, size, shares in self.matrix(cohorts):
+            cells = " ".join(f"{round(share * 100):>3}%" for share in shares[1:weeks])
+            lines.append(f"{cohort} {size:>6} {cells}".rstrip())
+        return "\n".join(lines)
+
+    def to_csv(self):
+        """CSV: cohort, users, week_0..week_N (абсолютные числа)"""
+        width = max((len(row) for row in self.cells.values()), default=1)
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(["cohort", "users"] + [f"week_{k}" for k in range(width)])
+        for cohort in sorted(self.cells):
+            row = self.cells[cohort]
+            writer.writerow([cohort, row[0] if row else 0] + row + [0] * (width - len(row)))
+        return out.getvalue()
+
+    def merge(self, other):
+        """Прибавляет матрицу другого процесса
+
+        Пользователь, активный за неделю в двух процессах, учитывается
+        дважды - при нескольких воркерах сумма дает оценку сверху.
+        """
+        for cohort, row in other.cells.items():
+            for offset, count in enumerate(row):
+                if count:
+                    self._add(cohort, (date.fromisoformat(cohort) + timedelta(weeks=offset)).isoformat(), count)
+        return self
+
+    def to_dict(self):
+        return {"cells": self.cells}
+
+    @classmethod
+    def from_dict(cls, data):
+        cohorts = cls()
+        cohorts.cells = {cohort: list(row) for cohort, row in data.get("cells", {}).items()}
+        return cohorts
+
+    @classmethod
+    def backfill(cls, users):
+        """Матрица из накопленных first_seen/last_seen
+
+        Недели между первым и последним визитом в старых данных не
+        хранились: пользователь попадает в неделю 0 и в неделю last_seen.
+        """
+        cohorts = cls()
+        for _, first_seen, last_seen in iter_user_dates(users):
+            if not first_seen:
+                continue
+            cohort = week_start(first_seen)
+            cohorts._add(cohort, cohort)
+            if last_seen and week_start(last_seen) > cohort:
+                cohorts._add(cohort, week_start(last_seen))
+        return cohorts
@@ -0,0 +1,294 @@
+# utils/compact_reactions.py - Компактное хранение реакций в памяти
+import sys
+from array import array
+
+from config import REACTION_EMOJIS
+
+# Начальная емкость хеш-таблицы (степень двойки)
+_INITIAL_CAPACITY = 1024
+_FIB_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+
+class CompactReactionStore:
+    """Реакции в колонках array вместо вложенных dict
+
+    Одна реакция - одна строка в трех колонках: user_id (int64), индекс
+    интернированного post_id (uint32) и индекс эмодзи (uint8) в таблице,
+    начинающейся с config.REACTION_EMOJIS. Поиск строки по (user, post)
+    идет через хеш-таблицу с открытой адресацией, тоже в array, а
+    счетчики по постам лежат в плоском array: post_idx * n_emojis + emoji.
+
+    Интерфейс совпадает с тем, что ReactionsDB использует у dict:
+    items() отдает пары (user_key, {post_key: reaction}).
+    """
+
+    __slots__ = (
+        "users", "posts", "reactions", "_slots", "_mask",
+        "post_names", "_post_ids", "emojis", "_emoji_ids",
+        "_foreign_users", "_foreign_user_ids", "counts", "extra",
+    )
+
+    def __init__(self, emojis=REACTION_EMOJIS):
+        self.users = array("q")
+        self.posts = array("I")
+        self.reactions = array("B")
+        # Слоты хеш-таблицы: номер строки + 1, 0 - пусто
+        self._slots = array("q", bytes(8 * _INITIAL_CAPACITY))
+        self._mask = _INITIAL_CAPACITY - 1
+        self.post_names = []
+        self._post_ids = {}
+        self.emojis = list(emojis)
+        self._emoji_ids = {emoji: i for i, emoji in enumerate(self.emojis)}
+        # Нечисловые id пользователей (наследованные "test_123", "-1", "007") - отрицательные
+        self._foreign_users = []
+        self._foreign_user_ids = {}
+        self.counts = array("I")
+        # Записи, которые не являются реакциями (агрегаты main_bot.py), храним как есть
+        self.extra = {}
+
+    @classmethod
+    def from_dict(cls, data, emojis=REACTION_EMOJIS):
+        """Строит хранилище из {user_id: {post_id: reaction}}"""
+        store = cls(emojis)
+        for user_key, posts in data.items():
+            store.put_user(user_key, posts)
+        return store
+
+    def put_user(self, user_key, posts):
+        """Добавляет запись верхнего уровня {post_id: reaction}
+
+        Наследованные агрегаты ("reactions"/"reaction_users" из main_bot.py)
+        не являются реакциями и откладываются в extra.
+        """
+        if not isinstance(posts, dict) or not all(isinstance(r, str) for r in posts.values()):
+            self.extra[user_key] = posts
+            return
+        for post_key, reaction in posts.items():
+            self.set(user_key, post_key, reaction)
+
+    def __len__(self):
+        return len(self.users)
+
+    def _user_id(self, user_key, create):
+        """Переводит ключ пользователя в int64
+
+        Числом хранится только каноническая запись неотрицательного int64
+        ("42", но не "007" или "-1") - иначе ключ не вернулся бы прежним.
+        Остальные ключи получают отрицательные id, которые числовые ключи
+        занять не могут.
+        """
+        user_id = _numeric_user_id(user_key)
+        if user_id is not None:
+            return user_id
+        user_id = self._foreign_user_ids.get(user_key)
+        if user_id is None and create:
+            self._foreign_users.append(user_key)
+            user_id = -len(self._foreign_users)
+            self._foreign_user_ids[user_key] = user_id
+        return user_id
+
+    def _post_idx(self, post_key, create):
+        idx = self._post_ids.get(post_key)
+        if idx is None and create:
+            idx = len(self.post_names)
+            self.post_names.append(post_key)
+            self._post_ids[post_key] = idx
+            self.counts.extend([0] * len(self.emojis))
+        return idx
+
+    def _emoji_idx(self, reaction):
+        idx = self._emoji_ids.get(reaction)
+        if idx is None:
+            if len(self.emojis) >= 255:
+                raise ValueError("Слишком много разных реакций для uint8")
+            idx = len(self.emojis)
+            self.emojis.append(reaction)
+            self._emoji_ids[reaction] = idx
+            # Расширяем матрицу счетчиков на новый столбец
+            old_width = idx
+            old_counts = self.counts
+            self.counts = array("I", [0] * (len(self.post_names) * len(self.emojis)))
+            for post in range(len(self.post_names)):
+                for emoji in range(old_width):
+                    self.counts[post * len(self.emojis) + emoji] = old_counts[post * old_width + emoji]
+        return idx
+
+    def _find_slot(self, user_id, post_idx):
+        """Возвращает (позиция слота, номер строки или -1)"""
+        mask = self._mask
+        # Фибоначчиево хеширование: hash() кортежа из соседних int дает
+        # длинные кластеры при линейном пробировании
+        key = ((user_id << 32) ^ post_idx) & _MASK64
+        pos = ((key * _FIB_MULTIPLIER) & _MASK64) >> 32 & mask
+        slots = self._slots
+        while True:
+            row = slots[pos] - 1
+            if row < 0:
+                return pos, -1
+            if self.users[row] == user_id and self.posts[row] == post_idx:
+                return pos, row
+            pos = (pos + 1) & mask
+
+    def _grow(self):
+        """Удваивает хеш-таблицу при заполнении больше чем на 2/3"""
+        capacity = (self._mask + 1) * 2
+        self._slots = array("q", bytes(8 * capacity))
+        self._mask = capacity - 1
+        for row in range(len(self.users)):
+            pos, _ = self._find_slot(self.users[row], self.posts[row])
+            self._slots[pos] = row + 1
+
+    def set(self, user_key, post_key, reaction):
+        """Ставит реакцию, возвращает предыдущую (или None)"""
+        user_id = self._user_id(str(user_key), create=True)
+        post_idx = self._post_idx(str(post_key), create=True)
+        emoji_idx = self._emoji_idx(reaction)
+        width = len(self.emojis)
+
+        pos, row = self._find_slot(user_id, post_idx)
+        if row >= 0:
+            previous_idx = self.reactions[row]
+            if previous_idx == emoji_idx:
+                return reaction
+            self.reactions[row] = emoji_idx
+            self.counts[post_idx * width + previous_idx] -= 1
+            self.counts[post_idx * width + emoji_idx] += 1
+            return self.emojis[previous_idx]
+
+        self.users.append(user_id)
+        self.posts.append(post_idx)
+        self.reactions.append(emoji_idx)
+        self._slots[pos] = len(self.users)
+        self.counts[post_idx * width + emoji_idx] += 1
+        if len(self.users) * 3 > (self._mask + 1) * 2:
+            self._grow()
+        return None
+
+    def get(self, user_key, post_key):
+        """Реакция пользователя на пост или None"""
+        user_id = self._user_id(str(user_key), create=False)
+        post_idx = self._post_idx(str(post_key), create=False)
+        if user_id is None or post_idx is None:
+            return None
+        _, row = self._find_slot(user_id, post_idx)
+        return self.emojis[self.reactions[row]] if row >= 0 else None
+
+    def post_reactions(self, post_key):
+        """{emoji: количество} для поста - O(число эмодзи)"""
+        post_idx = self._post_idx(str(post_key), create=False)
+        if post_idx is None:
+            return {}
+        width = len(self.emojis)
+        base = post_idx * width
+        return {
+            self.emojis[i]: self.counts[base + i]
+            for i in range(width)
+            if self.counts[base + i]
+        }
+
+    def rebuild_counts(self):
+        """Пересчитывает счетчики по постам из колонок"""
+        width = len(self.emojis)
+        self.counts = array("I", [0] * (len(self.post_names) * width))
+        for post_idx, emoji_idx in zip(self.posts, self.reactions):
+            self.counts[post_idx * width + emoji_idx] += 1
+
+    def to_dict(self):
+        """Обратное преобразование в {user_id: {post_id: reaction}}"""
+        return dict(self.items())
+
+    def items(self):
+        """Пары (user_key, {post_key: reaction}) - как у dict, но потоком
+
+        Вложенные dict создаются по одному пользователю, а не для всех
+        реакций сразу.
+        """
+        return _iter_user_posts(
+            self.users, self.posts, self.reactions, self.post_names, self.emojis,
+            self._foreign_users, self.extra,
+        )
+
+    def copy_rows(self):
+        """Копия колонок для записи снапшота вне блокировки (RowsSnapshot)
+
+        Копируются только array и списки имен - без хеш-таблицы и
+        вложенных dict, поэтому копия дешевая даже под блокировкой.
+        """
+        return RowsSnapshot(
+            array("q", self.users), array("I", self.posts), array("B", self.reactions),
+            list(self.post_names), list(self.emojis), list(self._foreign_users), dict(self.extra),
+        )
+
+    def memory_usage(self):
+        """Примерный объем памяти колонок, таблицы и словарей интернирования"""
+        total = sum(
+            col.buffer_info()[1] * col.itemsize
+            for col in (self.users, self.posts, self.reactions, self._slots, self.counts)
+        )
+        total += sys.getsizeof(self.post_names) + sys.getsizeof(self._post_ids)
+        total += sum(sys.getsizeof(name) for name in self.post_names)
+        return total
+
+
+class RowsSnapshot:
+    """Неизменяемая копия колонок CompactReactionStore для снапшота"""
+
+    __slots__ = ("users", "posts", "reactions", "post_names", "emojis", "foreign_users", "extra")
+
+    def __init__(self, users, posts, reactions, post_names, emojis, foreign_users, extra):
+        self.users = users
+        self.posts = posts
+        self.reactions = reactions
+        self.post_names = post_names
+        self.emojis = emojis
+        self.foreign_users = foreign_users
+        self.extra = extra
+
+    def __len__(self):
+        return len(self.users)
+
+    def items(self):
+        """Пары (user_key, {post_key: reaction}) потоком"""
+        return _iter_user_posts(
+            self.users, self.posts, self.reactions, self.post_names, self.emojis,
+            self.foreign_users, self.extra,
+        )
+
+
+def _iter_user_posts(users, posts, reactions, post_names, emojis, foreign_users, extra):
+    """Группирует строки колонок по пользователю: (user_key, {post_key: reaction})
+
+    Строки сортируются по user_id (список номеров строк), и за раз
+    собирается dict одного пользователя.
+    """
+    order = sorted(range(len(users)), key=users.__getitem__)
+    current = None
+    user_posts = None
+    for row in order:
+        user_id = users[row]
+        if user_id != current:
+            if user_posts is not None:
+                yield _user_key(current, foreign_users), user_posts
+            current = user_id
+            user_posts = {}
+        user_posts[post_names[posts[row]]] = emojis[reactions[row]]
+    if user_posts is not None:
+        yield _user_key(current, foreign_users), user_posts
+    yield from extra.items()
+
+
+def _numeric_user_id(user_key):
+    """int для ключа вида "42" в диапазоне 0..2^63-1, иначе None"""
+    if not (user_key.isascii() and user_key.isdigit()):
+        return None
+    user_id = int(user_key)
+    if str(user_id) != user_key or user_id >= 1 << 63:
+        return None
+    return user_id
+
+
+def _user_key(user_id, foreign_users):
+    if user_id < 0:
+        return foreign_users[-user_id - 1]
+    return str(user_id)
@@ -1,61 +1,269 @@
 # utils/database.py - Простая база данных для реакций
-import json
-import os
+import atexit
+import threading
+
+from config import FLUSH_INTERVAL_MS, FLUSH_MAX_MUTATIONS, REACTIONS_COMPACT_MEMORY
+from utils.compact_reactions import CompactReactionStore
+from utils.leaderboard import ALL_EMOJIS, ReactionLeaderboard
+from utils.storage import create_reaction_storage
+from utils.writer import GroupCommitter, storage_writer
 
 class ReactionsDB:
-    """Простая база данных для хранения реакций пользователей"""
-    
-    def __init__(self, db_file="reactions_data.json"):
+    """Простая база данных для хранения реакций пользователей
+
+    Данные держатся в памяти, а персистентность отдана хранилищу из
+    utils.storage: по умолчанию JSON-снапшот с журналом добавлений, либо
+    SQLite при STORAGE_BACKEND=sqlite. С compact_memory=True данные в
+    памяти лежат в CompactReactionStore (колонки array) вместо dict.
+
+    Если хранилище общее для нескольких процессов (storage.shared, бэкенд
+    sharded), реакции и счетчики постов читаются из хранилища, чтобы
+    видеть записи других воркеров.
+    """
+
+    def __init__(self, db_file="reactions_data.json", use_log=True, compact_every=10000, storage=None,
+                 compact_memory=REACTIONS_COMPACT_MEMORY):
         self.db_file = db_file
+        self.compact_memory = compact_memory
+        self.storage = storage or create_reaction_storage(
+            db_file, use_log=use_log, compact_every=compact_every
+        )
+        self.shared = getattr(self.storage, "shared", False)
+        self._lock = threading.RLock()
+        # Запись в хранилище: держится на время I/O, _lock - только на время
+        # снятия пачки и снимка, поэтому обработчики реакций не ждут fsync
+        self._io_lock = threading.Lock()
+        # Групповая запись: реакции, ожидающие сброса в хранилище
+        self.committer = None
+        self._pending = []
         self.data = self.load_data()
-    
+        # Вторичный индекс: post_id -> {emoji: количество}
+        self.post_index = {}
+        # Топ постов по эмодзи и окнам времени
+        self.leaderboard = ReactionLeaderboard()
+        self.rebuild_post_index()
+
     def load_data(self):
-        """Загружает данные из файла"""
-        if os.path.exists(self.db_file):
-            try:
-                with open(self.db_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception:
-                return {}
-        return {}
-    
-    def save_data(self):
-        """Сохраняет данные в файл"""
+        """Загружает данные из хранилища"""
+        factory = CompactReactionStore if self.compact_memory else dict
         try:
-            with open(self.db_file, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            data = self.storage.load(factory)
         except Exception as e:
-            print(f"Ошибка сохранения данных: {e}")
-    
+            print(f"Ошибка загрузки данных: {e}")
+            data = factory()
+        recovery = getattr(self.storage, "recovery", None)
+        if recovery:
+            print(
+                f"Реакции восстановлены за {recovery['seconds'] * 1000:.1f} мс: "
+                f"снапшот v{recovery['snapshot_version'] or '-'}, "
+                f"записей журнала {recovery['log_records']}, "
+                f"поврежденных снапшотов {len(recovery['corrupted_snapshots'])}, "
+                f"пиковый RSS {recovery['peak_rss_mb']} МБ"
+            )
+        return data
+
+    def save_data(self):
+        """Полностью сохраняет данные в хранилище"""
+        with self._io_lock:
+            with self._lock:
+                snapshot = self.storage.snapshot(self.data)
+            self.storage.save(snapshot)
+
     def add_reaction(self, user_id, post_id, reaction):
         """Добавляет реакцию пользователя"""
+        user_key, post_key = self.apply_reaction(user_id, post_id, reaction)
+        if self.committer is not None:
+            with self._lock:
+                self._pending.append((user_key, post_key, reaction))
+            self.committer.mark_dirty()
+        else:
+            self.persist_reaction(user_key, post_key, reaction)
+
+    def enable_group_commit(self, writer, interval_ms=FLUSH_INTERVAL_MS, max_mutations=FLUSH_MAX_MUTATIONS):
+        """Включает групповую запись: реакции копятся и сбрасываются пачкой"""
+        self.committer = GroupCommitter(
+            self.flush_pending, writer, interval_ms, max_mutations, name="reactions-commit"
+        )
+        atexit.register(self.committer.close)
+        return self.committer
+
+    def flush_pending(self):
+        """Сбрасывает накопленные реакции одной пачкой и делает fsync"""
+        with self._io_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                if not pending:
+                    return
+                snapshot = self._snapshot_for(len(pending))
+            try:
+                self.storage.record_many(pending, snapshot)
+                self.storage.sync()
+            except Exception as e:
+                print(f"Ошибка групповой записи реакций: {e}")
+
+    def _snapshot_for(self, count):
+        """Снимок данных, если он нужен хранилищу для пачки (вызывается под _lock)
+
+        Снимок берется под _io_lock: все, что уже записано в журнал
+        предыдущими пачками, в него гарантированно входит.
+        """
+        if self.storage.needs_snapshot(count):
+            return self.storage.snapshot(self.data)
+        return None
+
+    def apply_reaction(self, user_id, post_id, reaction):
+        """Применяет реакцию только в памяти, возвращает (user_key, post_key)"""
         user_key = str(user_id)
         post_key = str(post_id)
-        
-        if user_key not in self.data:
-            self.data[user_key] = {}
-        
-        self.data[user_key][post_key] = reaction
-        self.save_data()
-    
+
+        with self._lock:
+            if self.compact_memory:
+                # Счетчики по постам CompactReactionStore ведет сам
+                previous = self.data.set(user_key, post_key, reaction)
+            else:
+                if user_key not in self.data:
+                    self.data[user_key] = {}
+
+                previous = self.data[user_key].get(post_key)
+                self.data[user_key][post_key] = reaction
+                self._update_post_index(post_key, previous, reaction)
+            self.leaderboard.record(user_key, post_key, previous, reaction)
+        return user_key, post_key
+
+    def persist_reaction(self, user_key, post_key, reaction):
+        """Записывает уже примененную реакцию в хранилище"""
+        with self._io_lock:
+            with self._lock:
+                snapshot = self._snapshot_for(1)
+            try:
+                self.storage.record_many([(user_key, post_key, reaction)], snapshot)
+            except Exception as e:
+                print(f"Ошибка сохранения реакции: {e}")
+
+    def compact(self, wait=False):
+        """Компактизирует журнал хранилища (если он есть)"""
+        if hasattr(self.storage, "compact"):
+            with self._io_lock:
+                with self._lock:
+                    snapshot = self.storage.snapshot(self.data)
+                self.storage.compact(snapshot)
+            if wait:
+                self.storage.wait_for_compaction()
+
+    def close(self):
+        """Сбрасывает накопленные реакции и закрывает хранилище"""
+        if self.committer is not None:
+            self.committer.close()
+        self.storage.close()
+
+    def rebuild_post_index(self):
+        """Перестраивает индекс реакций по постам из основных данных"""
+        index = {}
+        with self._lock:
+            if self.compact_memory:
+                self.data.rebuild_counts()
+                self.leaderboard.load_totals(
+                    (post_key, self.data.post_reactions(post_key)) for post_key in self.data.post_names
+                )
+                return index
+            for user_data in self.data.values():
+                if not isinstance(user_data, dict):
+                    continue
+                for post_key, reaction in user_data.items():
+                    # Наследованные служебные ключи хранят числа и списки, а не эмодзи
+                    if not isinstance(reaction, str):
+                        continue
+                    counts = index.setdefault(post_key, {})
+                    counts[reaction] = counts.get(reaction, 0) + 1
+            self.post_index = index
+            self.leaderboard.load_totals(index.items())
+        return index
+
+    def _update_post_index(self, post_key, previous, reaction):
+        """Учитывает смену реакции пользователя в индексе"""
+        if previous == reaction:
+            return
+
+        counts = self.post_index.setdefault(post_key, {})
+        if isinstance(previous, str) and previous in counts:
+            counts[previous] -= 1
+            if counts[previous] <= 0:
+                del counts[previous]
+        counts[reaction] = counts.get(reaction, 0) + 1
+
     def get_reaction(self, user_id, post_id):
         """Получает реакцию пользователя на пост"""
         user_key = str(user_id)
         post_key = str(post_id)
-        
+
+        if self.shared:
+            return self.storage.get_reaction(user_key, post_key)
+        if self.compact_memory:
+            return self.data.get(user_key, post_key)
         return self.data.get(user_key, {}).get(post_key)
-    
+
+    def get_post_reactions(self, post_id):
+        """Получает все реакции на пост (из индекса, без обхода пользователей)"""
+        if self.shared:
+            # Записи этого процесса видны после сброса группы (FLUSH_INTERVAL_MS)
+            return self.storage.post_counts(str(post_id))
+        with self._lock:
+            if self.compact_memory:
+                return self.data.post_reactions(post_id)
+            return dict(self.post_index.get(str(post_id), {}))
+
+    def top_posts(self, emoji=ALL_EMOJIS, window="all", n=10):
+        """Топ n постов по эмодзи (ALL_EMOJIS - по всем) за окно all/week/day
+
+        В общем хранилище окно all считается запросом к нему - с реакциями
+        других воркеров; окна week/day - только реакции этого процесса.
+        """
+        if self.shared and window == "all":
+            return self.storage.top_posts(None if emoji == ALL_EMOJIS else emoji, n)
+        return self.leaderboard.top(emoji, window, n)
+
+
+class AsyncReactionsDB:
+    """Асинхронный API над ReactionsDB для обработчиков
+
+    Реакция сразу применяется в памяти, а запись в хранилище уходит в
+    поток BackgroundWriter, так что ``await add_reaction(...)`` не делает
+    файлового ввода-вывода в event loop. Чтение обслуживается из памяти.
+    """
+
+    def __init__(self, db, writer):
+        self.db = db
+        self.writer = writer
+
+    async def add_reaction(self, user_id, post_id, reaction):
+        """Добавляет реакцию, не дожидаясь записи на диск"""
+        if self.db.committer is not None:
+            # Групповая запись сама отправит пачку в поток записи
+            self.db.add_reaction(user_id, post_id, reaction)
+            return
+        user_key, post_key = self.db.apply_reaction(user_id, post_id, reaction)
+        self.writer.submit(self.db.persist_reaction, user_key, post_key, reaction)
+
+    def get_reaction(self, user_id, post_id):
+        """Получает реакцию пользователя на пост"""
+        return self.db.get_reaction(user_id, post_id)
+
     def get_post_reactions(self, post_id):
         """Получает все реакции на пост"""
-        post_key = str(post_id)
-        reactions = {}
-        
-        for user_data in self.data.values():
-            if post_key in user_data:
-                reaction = user_data[post_key]
-                reactions[reaction] = reactions.get(reaction, 0) + 1
-        
-        return reactions
+        return self.db.get_post_reactions(post_id)
+
+    def top_posts(self, emoji=ALL_EMOJIS, window="all", n=10):
+        """Топ постов по реакциям (из памяти)"""
+        return self.db.top_posts(emoji, window, n)
+
+    async def flush(self):
+        """Дожидается записи всех поставленных реакций"""
+        if self.db.committer is not None:
+            self.db.committer.request_flush()
+        await self.writer.flush_async()
 
 # Глобальный экземпляр базы данных
 reactions_db = ReactionsDB()
+if FLUSH_INTERVAL_MS > 0:
+    reactions_db.enable_group_commit(storage_writer)
+async_reactions_db = AsyncReactionsDB(reactions_db, storage_writer)
@@ -0,0 +1,149 @@
+# utils/event_queue.py - Очередь событий с фоновым пакетным агрегатором
+import asyncio
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class EventPipeline:
+    """asyncio-очередь событий и агрегатор, применяющий их пачками
+
+    Агрегатор работает в собственном event loop в отдельном потоке, так
+    что publish() можно вызывать из любого потока и любого loop. Вызов
+    кладет кортеж в deque и будит loop через call_soon_threadsafe, только
+    если тот еще не разбужен: запись в self-pipe на каждое событие стоила
+    бы ~20 мкс вместо долей микросекунды. Разбуженный loop переносит
+    накопленное в asyncio.Queue, агрегатор забирает до batch_size событий
+    и передает их apply_batch одним вызовом. Лаг очереди - время от
+    publish до применения события.
+    """
+
+    def __init__(self, apply_batch, batch_size=500, name="event-pipeline"):
+        self.apply_batch = apply_batch
+        self.batch_size = batch_size
+        self.name = name
+        self._loop = None
+        self._queue = None
+        self._task = None
+        self._inbox = deque()
+        self._wakeup_pending = False
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self.published = 0
+        self.processed = 0
+        self.batches = 0
+        self.errors = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def _ensure_started(self):
+        """Запускает поток агрегатора при первом событии"""
+        if self._loop is not None:
+            return
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(ready,), name=self.name, daemon=True)
+            self._thread.start()
+            ready.wait()
+            atexit.register(self.close)
+
+    def _run(self, ready):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._queue = asyncio.Queue()
+        self._task = loop.create_task(self._aggregate())
+        self._loop = loop
+        ready.set()
+        try:
+            loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            loop.close()
+
+    def publish(self, *event):
+        """Кладет событие в очередь и сразу возвращается"""
+        if self._closed:
+            return
+        self._ensure_started()
+        self.published += 1
+        self._inbox.append((time.perf_counter(), event))
+        if not self._wakeup_pending:
+            self._wakeup_pending = True
+            self._loop.call_soon_threadsafe(self._drain_inbox)
+
+    def _drain_inbox(self):
+        """Переносит опубликованные события в asyncio.Queue (в потоке loop)"""
+        # Флаг сбрасывается до разбора: событие, добавленное позже, разбудит loop снова
+        self._wakeup_pending = False
+        inbox = self._inbox
+        while inbox:
+            self._queue.put_nowait(inbox.popleft())
+
+    async def _aggregate(self):
+        """Цикл агрегатора: ждет событие и забирает все накопившиеся"""
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                self.apply_batch([event for _, event in batch])
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Ошибка применения пачки событий: {e}")
+            finally:
+                lag = time.perf_counter() - batch[0][0]
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                self.processed += len(batch)
+                self.batches += 1
+                for _ in batch:
+                    queue.task_done()
+
+    def flush(self, timeout=None):
+        """Блокирующе ждет, пока агрегатор применит все опубликованные события"""
+        if self._loop is None:
+            return
+        future = asyncio.run_coroutine_threadsafe(self._join(), self._loop)
+        future.result(timeout)
+
+    async def _join(self):
+        self._drain_inbox()
+        await self._queue.join()
+
+    @property
+    def queue_depth(self):
+        """События, еще не примененные агрегатором"""
+        return self.published - self.processed
+
+    def get_metrics(self):
+        """Метрики очереди: глубина и лаг агрегатора"""
+        return {
+            "queue_depth": self.queue_depth,
+            "published": self.published,
+            "processed": self.processed,
+            "batches": self.batches,
+            "errors": self.errors,
+            "last_lag_ms": round(self.last_lag * 1000, 3),
+            "max_lag_ms": round(self.max_lag * 1000, 3),
+        }
+
+    def close(self, timeout=10):
+        """Применяет оставшиеся события и останавливает агрегатор"""
+        if self._closed or self._loop is None:
+            self._closed = True
+            return
+        try:
+            self.flush(timeout)
+        finally:
+            self._closed = True
+            self._loop.call_soon_threadsafe(self._task.cancel)
+            self._thread.join(timeout)
@@ -0,0 +1,152 @@
+# utils/hyperloglog.py - Вероятностный счетчик уникальных значений
+import base64
+import hashlib
+import math
+import zlib
+
+# Формат сериализации: "hll1:<p>:<base64(zlib(регистры))>"
+_PREFIX = "hll1:"
+
+
+class HyperLogLog:
+    """HyperLogLog с разреженным режимом для малых множеств
+
+    2**p регистров по байту; ошибка оценки ~1.04/sqrt(2**p): 2.3% при p=11.
+    Пока заполнено меньше четверти регистров, они хранятся в dict
+    {индекс: ранг} - дни с десятком пользователей не занимают 2 КБ.
+    Скетчи с одинаковым p объединяются поэлементным максимумом, поэтому
+    недельные и месячные уникальные считаются слиянием дневных.
+    """
+
+    __slots__ = ("p", "m", "registers", "_serialized")
+
+    def __init__(self, p=11):
+        if not 4 <= p <= 16:
+            raise ValueError("Точность HyperLogLog должна быть от 4 до 16")
+        self.p = p
+        self.m = 1 << p
+        # dict в разреженном режиме, bytearray - в плотном
+        self.registers = {}
+        self._serialized = None
+
+    @staticmethod
+    def hash(item):
+        """64-битный хеш, одинаковый во всех процессах (в отличие от hash())"""
+        digest = hashlib.blake2b(str(item).encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big')
+
+    def add(self, item):
+        """Добавляет значение"""
+        self.add_hash(self.hash(item))
+
+    def add_hash(self, hashed):
+        """Добавляет заранее посчитанный hash(item) - один хеш на несколько скетчей"""
+        index = hashed >> (64 - self.p)
+        rest_bits = 64 - self.p
+        rank = rest_bits - (hashed & ((1 << rest_bits) - 1)).bit_length() + 1
+        registers = self.registers
+        if isinstance(registers, dict):
+            if registers.get(index, 0) >= rank:
+                return
+            registers[index] = rank
+            if len(registers) > self.m // 4:
+                self._densify()
+        elif registers[index] < rank:
+            registers[index] = rank
+        else:
+            return
+        self._serialized = None
+
+    def _densify(self):
+        dense = bytearray(self.m)
+        for index, rank in self.registers.items():
+            dense[index] = rank
+        self.registers = dense
+
+    def count(self):
+        """Оценка числа уникальных значений"""
+        registers = self.registers
+        m = self.m
+        if isinstance(registers, dict):
+            # Линейный подсчет по пустым регистрам точен для малых множеств
+            zeros = m - len(registers)
+            return round(m * math.log(m / zeros)) if registers else 0
+
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -rank for rank in registers)
+        zeros = registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def __len__(self):
+        return self.count()
+
+    def merge(self, other):
+        """Объединяет other в этот скетч (максимум по регистрам)"""
+        if other.p != self.p:
+            raise ValueError("Нельзя объединить скетчи с разной точностью")
+        if isinstance(other.registers, dict):
+            for index, rank in other.registers.items():
+                self._set_max(index, rank)
+        else:
+            if isinstance(self.registers, dict):
+                self._densify()
+            self.registers = bytearray(map(max, self.registers, other.registers))
+        self._serialized = None
+        return self
+
+    def _set_max(self, index, rank):
+        registers = self.registers
+        if isinstance(registers, dict):
+            if registers.get(index, 0) < rank:
+                registers[index] = rank
+                if len(registers) > self.m // 4:
+                    self._densify()
+        elif registers[index] < rank:
+            registers[index] = rank
+
+    @classmethod
+    def union(cls, sketches, p=11):
+        """Новый скетч - объединение нескольких"""
+        result = None
+        for sketch in sketches:
+            if result is None:
+                result = cls(sketch.p)
+            result.merge(sketch)
+        return result if result is not None else cls(p)
+
+    def to_json(self):
+        """Строка для JSON/SQLite (кэшируется до следующего изменения)"""
+        if self._serialized is None:
+            registers = self.registers
+            if isinstance(registers, dict):
+                dense = bytearray(self.m)
+                for index, rank in registers.items():
+                    dense[index] = rank
+                registers = dense
+            packed = base64.b64encode(zlib.compress(bytes(registers))).decode('ascii')
+            self._serialized = f"{_PREFIX}{self.p}:{packed}"
+        return self._serialized
+
+    @classmethod
+    def from_json(cls, value):
+        """Восстанавливает скетч из строки to_json()"""
+        if not cls.is_serialized(value):
+            raise ValueError("Строка не является скетчем HyperLogLog")
+        p, packed = value[len(_PREFIX):].split(":", 1)
+        sketch = cls(int(p))
+        dense = zlib.decompress(base64.b64decode(packed))
+        if len(dense) != sketch.m:
+            raise ValueError("Неверное число регистров HyperLogLog")
+        filled = sum(1 for rank in dense if rank)
+        if filled > sketch.m // 4:
+            sketch.registers = bytearray(dense)
+        else:
+            sketch.registers = {index: rank for index, rank in enumerate(dense) if rank}
+        sketch._serialized = value
+        return sketch
+
+    @staticmethod
+    def is_serialized(value):
+        return isinstance(value, str) and value.startswith(_PREFIX)
@@ -0,0 +1,121 @@
+# utils/json_stream.py - Потоковое чтение больших JSON-файлов
+import hashlib
+import io
+import json
+
+# Размер порции чтения по умолчанию
+CHUNK_SIZE = 1 << 16
+
+
+class JsonObjectStream:
+    """Читает JSON-объект по парам ключ-значение, не загружая файл целиком
+
+    В памяти держится только текущая порция текста и разбираемое
+    значение. iter_keys() выдает ключи объекта; после каждого ключа
+    вызывающий обязан прочитать значение - decode_value() целиком или
+    вложенным iter_keys(), если значение тоже большой объект.
+    """
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self._file = f
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Дочитывает порцию; размер растет вместе с недоразобранным хвостом"""
+        if self._eof:
+            return False
+        tail = self._buf[self._pos:]
+        # Без роста порции одно большое значение разбиралось бы за O(n^2)
+        chunk = self._file.read(max(self._chunk_size, len(tail)))
+        if not chunk:
+            self._eof = True
+        self._buf = tail + chunk
+        self._pos = 0
+        return bool(chunk)
+
+    def _peek(self):
+        """Пропускает пробелы и возвращает следующий символ ('' в конце)"""
+        while True:
+            buf = self._buf
+            pos = self._pos
+            while pos < len(buf) and buf[pos] in " \t\n\r":
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Ожидался '{char}', найдено '{found}' в позиции {self._pos}")
+        self._pos += 1
+
+    def decode_value(self):
+        """Разбирает одно значение целиком"""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except ValueError:
+                if not self._fill():
+                    raise
+                continue
+            if end == len(self._buf) and not self._eof and self._fill():
+                # Число на границе порции могло быть обрезано - разбираем заново
+                continue
+            self._pos = end
+            return value
+
+    def iter_keys(self):
+        """Выдает ключи объекта, начинающегося в текущей позиции"""
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.decode_value()
+            self._expect(":")
+            yield key
+            separator = self._peek()
+            self._pos += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError(f"Ожидался ',' или '}}', найдено '{separator}'")
+
+    def iter_items(self):
+        """Выдает пары (ключ, значение) объекта"""
+        for key in self.iter_keys():
+            yield key, self.decode_value()
+
+
+def iter_json_object(path, chunk_size=CHUNK_SIZE):
+    """Пары (ключ, значение) JSON-объекта верхнего уровня из файла"""
+    with open(path, 'r', encoding='utf-8') as f:
+        yield from JsonObjectStream(f, chunk_size).iter_items()
+
+
+class HashingReader(io.RawIOBase):
+    """Обертка над бинарным файлом, считающая sha256 и длину прочитанного"""
+
+    def __init__(self, f):
+        self._file = f
+        self.sha256 = hashlib.sha256()
+        self.length = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._file.read(len(buffer))
+        size = len(data)
+        buffer[:size] = data
+        self.sha256.update(data)
+        self.length += size
+        return size
@@ -0,0 +1,103 @@
+# utils/last_seen.py - Индекс "дата последнего визита -> пользователи"
+from datetime import datetime, timedelta
+
+from utils.bitmap import RoaringBitmap
+
+
+def iter_user_dates(users):
+    """(ключ, first_seen, last_seen) по stats["users"]
+
+    LazyUsers отдает даты из колонок снапшота, не декодируя записи.
+    """
+    iter_dates = getattr(users, "iter_dates", None)
+    if iter_dates is not None:
+        return iter_dates()
+    return (
+        (user_key, user_data.get("first_seen"), user_data.get("last_seen"))
+        for user_key, user_data in users.items()
+    )
+
+
+class LastSeenIndex:
+    """Пользователи, разложенные по дате last_seen
+
+    Каждый пользователь лежит ровно в одной корзине - дате последнего
+    визита; при визите в новый день он переносится из старой корзины в
+    сегодняшнюю. "Активные за N дней" - сумма размеров N+1 корзин.
+    Числовые id хранятся в RoaringBitmap, редкие нечисловые - в set.
+    """
+
+    def __init__(self):
+        self.days = {}
+        self.other_ids = {}
+
+    @classmethod
+    def from_users(cls, users):
+        """Строит индекс по словарю users статистики"""
+        index = cls()
+        for user_key, _, last_seen in iter_user_dates(users):
+            if last_seen:
+                index.add(user_key, last_seen)
+        return index
+
+    @staticmethod
+    def _as_int(user_id):
+        try:
+            value = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        return value if value >= 0 else None
+
+    def add(self, user_id, day):
+        value = self._as_int(user_id)
+        if value is None:
+            self.other_ids.setdefault(day, set()).add(str(user_id))
+            return
+        bucket = self.days.get(day)
+        if bucket is None:
+            bucket = self.days[day] = RoaringBitmap()
+        bucket.add(value)
+
+    def discard(self, user_id, day):
+        value = self._as_int(user_id)
+        if value is None:
+            bucket = self.other_ids.get(day)
+            if bucket is not None:
+                bucket.discard(str(user_id))
+                if not bucket:
+                    del self.other_ids[day]
+            return
+        bucket = self.days.get(day)
+        if bucket is not None:
+            bucket.discard(value)
+            if not bucket:
+                del self.days[day]
+
+    def move(self, user_id, previous_day, day):
+        """Переносит пользователя в корзину day (previous_day is None - новый)"""
+        if previous_day == day:
+            return
+        if previous_day is not None:
+            self.discard(user_id, previous_day)
+        self.add(user_id, day)
+
+    def _recent_days(self, days, now=None):
+        now = now or datetime.now()
+        return [(now - timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(days + 1)]
+
+    def count_since(self, days, now=None):
+        """Число пользователей с last_seen за последние days дней"""
+        return sum(
+            len(self.days.get(day, ())) + len(self.other_ids.get(day, ()))
+            for day in self._recent_days(days, now)
+        )
+
+    def users_since(self, days, now=None):
+        """Итератор id пользователей с last_seen за последние days дней"""
+        for day in self._recent_days(days, now):
+            yield from self.days.get(day, ())
+            yield from self.other_ids.get(day, ())
+
+    def memory_usage(self):
+        """Объем данных корзин-битмапов в байтах"""
+        return sum(bucket.memory_usage() for bucket in self.days.values())
@@ -0,0 +1,169 @@
+# utils/latency.py - Гистограммы времени обработчиков (p50/p95/p99)
+import functools
+import math
+import threading
+import time
+from array import array
+
+# Границы корзин: от 0.1 мс с шагом 2**(1/4) (~19% на корзину) до ~150 с
+MIN_MS = 0.1
+GROWTH = 2 ** 0.25
+BUCKETS = 82
+_LOG_GROWTH = math.log(GROWTH)
+
+
+def bucket_upper_ms(index):
+    """Верхняя граница корзины index в миллисекундах"""
+    return MIN_MS * GROWTH ** (index + 1)
+
+
+class LatencyHistogram:
+    """Гистограмма длительностей с фиксированными логарифмическими корзинами
+
+    Запись - вычисление индекса и инкремент в array('Q'): объектов на
+    замер не создается. Гистограммы с одинаковой сеткой складываются
+    поэлементно, поэтому их можно объединять между процессами и
+    периодами. Перцентиль - верхняя граница корзины, где он лежит
+    (ошибка не больше ширины корзины, ~19%).
+    """
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = array('Q', bytes(8 * BUCKETS))
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        if ms <= MIN_MS:
+            index = 0
+        else:
+            index = min(int(math.log(ms / MIN_MS) / _LOG_GROWTH), BUCKETS - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, q):
+        """Перцентиль q (0..100) в миллисекундах"""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * q / 100) or 1
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                # Последняя корзина открыта сверху - ее граница - максимум
+                if index == BUCKETS - 1:
+                    return self.max
+                return min(bucket_upper_ms(index), self.max)
+        return self.max
+
+    def merge(self, other):
+        """Прибавляет other к этой гистограмме"""
+        for index, bucket_count in enumerate(other.counts):
+            if bucket_count:
+                self.counts[index] += bucket_count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        return self
+
+    def summary(self):
+        """count, среднее, p50/p95/p99 и максимум в мс"""
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count, 2) if self.count else 0.0,
+            "p50_ms": round(self.percentile(50), 2),
+            "p95_ms": round(self.percentile(95), 2),
+            "p99_ms": round(self.percentile(99), 2),
+            "max_ms": round(self.max, 2),
+        }
+
+
+class LatencyRecorder:
+    """Гистограммы по ключам: команда (/start) или префикс callback (cb:reaction)
+
+    Число ключей ограничено max_keys: callback data приходит от клиента,
+    и произвольные префиксы сверх лимита учитываются под ключом "other".
+    """
+
+    def __init__(self, max_keys=200):
+        self.histograms = {}
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                if len(self.histograms) >= self.max_keys:
+                    key = "other"
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def get(self, key):
+        return self.histograms.get(key)
+
+    def snapshot(self):
+        """Копия гистограмм (для отчета без удержания блокировки)"""
+        with self._lock:
+            return {key: LatencyHistogram().merge(histogram) for key, histogram in self.histograms.items()}
+
+    def summary(self):
+        """Сводка по ключам, самые медленные по p95 первыми"""
+        summaries = {key: histogram.summary() for key, histogram in self.snapshot().items()}
+        return dict(sorted(summaries.items(), key=lambda item: item[1]["p95_ms"], reverse=True))
+
+    def timed(self, callback, key):
+        """Оборачивает async-обработчик: key - строка или функция(update) -> строка"""
+
+        @functools.wraps(callback)
+        async def wrapper(update, context):
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            finally:
+                self.record(key(update) if callable(key) else key, time.perf_counter() - started)
+
+        wrapper.__wrapped_latency__ = True
+        return wrapper
+
+
+def callback_key(update):
+    """Ключ callback-запроса: префикс data до первого "_" (reaction_1_❤️ -> cb:reaction)"""
+    query = getattr(update, "callback_query", None)
+    data = getattr(query, "data", None) or ""
+    return f"cb:{data.split('_', 1)[0] or '-'}"
+
+
+def handler_key(handler):
+    """Ключ гистограммы для обработчика telegram.ext"""
+    commands = getattr(handler, "commands", None)
+    if commands:
+        return "/" + sorted(commands)[0]
+    name = type(handler).__name__
+    if name == "CallbackQueryHandler":
+        return callback_key
+    return name.replace("Handler", "").lower() or "handler"
+
+
+def instrument_handlers(application, recorder):
+    """Оборачивает callback каждого зарегистрированного обработчика замером времени"""
+    wrapped = 0
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            if getattr(handler.callback, "__wrapped_latency__", False):
+                continue
+            handler.callback = recorder.timed(handler.callback, handler_key(handler))
+            wrapped += 1
+    return wrapped
+
+
+# Общие гистограммы обработчиков бота
+handler_latency = LatencyRecorder()
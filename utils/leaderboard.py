@@ -0,0 +1,203 @@
+# utils/leaderboard.py - Топ постов по реакциям с инкрементальным обновлением
+import heapq
+import threading
+from datetime import datetime
+
+# Ключ эмодзи для суммы по всем реакциям
+ALL_EMOJIS = "*"
+# Окна: все время (текущее состояние), текущая ISO-неделя, текущий день
+WINDOWS = ("all", "week", "day")
+
+
+class IndexedMaxHeap:
+    """Max-куча счетов с индексом позиций
+
+    Изменение счета элемента - O(log n) (просеивание от его позиции),
+    чтение n лучших - O(n log n) обходом кучи без ее изменения.
+    """
+
+    __slots__ = ("_items", "_scores", "_pos")
+
+    def __init__(self):
+        self._items = []
+        self._scores = []
+        self._pos = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, item):
+        """Счет элемента (0, если его нет)"""
+        pos = self._pos.get(item)
+        return self._scores[pos] if pos is not None else 0
+
+    def add(self, item, delta):
+        """Меняет счет элемента на delta; элементы со счетом <= 0 удаляются"""
+        pos = self._pos.get(item)
+        if pos is None:
+            if delta <= 0:
+                return
+            self._items.append(item)
+            self._scores.append(delta)
+            pos = len(self._items) - 1
+            self._pos[item] = pos
+            self._sift_up(pos)
+            return
+
+        score = self._scores[pos] + delta
+        if score <= 0:
+            self._remove(pos)
+            return
+        self._scores[pos] = score
+        if delta > 0:
+            self._sift_up(pos)
+        else:
+            self._sift_down(pos)
+
+    def top(self, n):
+        """n элементов с наибольшим счетом: [(item, score)]"""
+        result = []
+        if not self._items or n <= 0:
+            return result
+        scores = self._scores
+        frontier = [(-scores[0], 0)]
+        while frontier and len(result) < n:
+            neg_score, pos = heapq.heappop(frontier)
+            result.append((self._items[pos], -neg_score))
+            for child in (2 * pos + 1, 2 * pos + 2):
+                if child < len(scores):
+                    heapq.heappush(frontier, (-scores[child], child))
+        return result
+
+    def _swap(self, i, j):
+        items, scores = self._items, self._scores
+        items[i], items[j] = items[j], items[i]
+        scores[i], scores[j] = scores[j], scores[i]
+        self._pos[items[i]] = i
+        self._pos[items[j]] = j
+
+    def _sift_up(self, pos):
+        scores = self._scores
+        while pos > 0:
+            parent = (pos - 1) // 2
+            if scores[pos] <= scores[parent]:
+                break
+            self._swap(pos, parent)
+            pos = parent
+
+    def _sift_down(self, pos):
+        scores = self._scores
+        size = len(scores)
+        while True:
+            largest = pos
+            for child in (2 * pos + 1, 2 * pos + 2):
+                if child < size and scores[child] > scores[largest]:
+                    largest = child
+            if largest == pos:
+                return
+            self._swap(pos, largest)
+            pos = largest
+
+    def _remove(self, pos):
+        last = len(self._items) - 1
+        if pos != last:
+            self._swap(pos, last)
+        del self._pos[self._items.pop()]
+        self._scores.pop()
+        if pos < last:
+            self._sift_up(pos)
+            self._sift_down(pos)
+
+
+class ReactionLeaderboard:
+    """Топ постов по каждому эмодзи и окну времени
+
+    Окно "all" отражает текущее состояние: смена реакции переносит голос
+    с прежнего эмодзи на новый, как post_index в ReactionsDB. Окна
+    "week" и "day" считают пользователей, реагировавших на пост в текущем
+    периоде: смена реакции внутри периода тоже переносит голос, а не
+    добавляет новый (для этого помнится последняя реакция каждой пары
+    пользователь-пост за период). При смене периода окна начинаются
+    заново. ALL_EMOJIS ("*") - сумма по всем эмодзи.
+
+    Окна по времени живут только в памяти процесса: после перезапуска
+    они пустые (время реакций в хранилище не пишется), а при нескольких
+    воркерах каждый видит только свои реакции.
+    """
+
+    def __init__(self, clock=datetime.now):
+        self._clock = clock
+        self._lock = threading.Lock()
+        # window -> {emoji: IndexedMaxHeap}
+        self._boards = {window: {} for window in WINDOWS}
+        self._periods = {"week": None, "day": None}
+        # window -> {(user_key, post_key): эмодзи, учтенный в текущем периоде}
+        self._counted = {window: {} for window in self._periods}
+
+    @staticmethod
+    def period_of(window, moment):
+        """Ключ периода окна для момента времени"""
+        if window == "day":
+            return moment.date().isoformat()
+        if window == "week":
+            year, week, _ = moment.isocalendar()
+            return f"{year}-W{week:02d}"
+        return "all"
+
+    def _roll_periods(self):
+        """Сбрасывает окна, период которых закончился (под блокировкой)"""
+        now = self._clock()
+        for window in self._periods:
+            period = self.period_of(window, now)
+            if period != self._periods[window]:
+                self._periods[window] = period
+                self._boards[window] = {}
+                self._counted[window] = {}
+
+    def _add(self, window, emoji, post_key, delta):
+        board = self._boards[window].get(emoji)
+        if board is None:
+            board = self._boards[window][emoji] = IndexedMaxHeap()
+        board.add(post_key, delta)
+
+    def record(self, user_key, post_key, previous, reaction):
+        """Учитывает реакцию пользователя (previous - его прежняя реакция)"""
+        if previous == reaction:
+            return
+        with self._lock:
+            self._roll_periods()
+            if isinstance(previous, str):
+                self._add("all", previous, post_key, -1)
+            else:
+                self._add("all", ALL_EMOJIS, post_key, 1)
+            self._add("all", reaction, post_key, 1)
+            for window, counted in self._counted.items():
+                before = counted.get((user_key, post_key))
+                if before is None:
+                    self._add(window, ALL_EMOJIS, post_key, 1)
+                else:
+                    self._add(window, before, post_key, -1)
+                self._add(window, reaction, post_key, 1)
+                counted[(user_key, post_key)] = reaction
+
+    def load_totals(self, post_counts):
+        """Перестраивает окно "all" из пар (post_key, {emoji: количество})"""
+        boards = {}
+        for post_key, counts in post_counts:
+            for emoji, count in counts.items():
+                for key in (emoji, ALL_EMOJIS):
+                    board = boards.get(key)
+                    if board is None:
+                        board = boards[key] = IndexedMaxHeap()
+                    board.add(post_key, count)
+        with self._lock:
+            self._boards["all"] = boards
+
+    def top(self, emoji=ALL_EMOJIS, window="all", n=10):
+        """n постов с наибольшим числом реакций: [(post_key, count)]"""
+        if window not in WINDOWS:
+            raise ValueError(f"Неизвестное окно: {window}")
+        with self._lock:
+            self._roll_periods()
+            board = self._boards[window].get(emoji)
+            return board.top(n) if board is not None else []
@@ -0,0 +1,331 @@
+# utils/metrics.py - Метрики процесса в текстовом формате Prometheus (/metrics)
+import os
+import threading
+import time
+
+from utils.latency import BUCKETS, LatencyRecorder, bucket_upper_ms
+
+try:
+    import psutil
+except ImportError:  # метрики процесса необязательны
+    psutil = None
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if isinstance(value, float):
+        if value == float("inf"):
+            return "+Inf"
+        return repr(value)
+    return str(value)
+
+
+class Counter:
+    """Монотонный счетчик с метками без блокировок на горячем пути
+
+    Каждый поток увеличивает свои ячейки (threading.local), чтение
+    суммирует ячейки всех потоков. Блокировка берется только при первом
+    инкременте в новом потоке; ячейки завершившихся потоков при этом
+    сворачиваются в общий итог, чтобы список не рос с числом потоков.
+    """
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._retired = {}
+
+    def _cells(self):
+        cells = getattr(self._local, "cells", None)
+        if cells is None:
+            cells = self._local.cells = {}
+            with self._lock:
+                self._retire_dead()
+                self._threads.append((threading.current_thread(), cells))
+        return cells
+
+    def _retire_dead(self):
+        alive = []
+        for thread, cells in self._threads:
+            if thread.is_alive():
+                alive.append((thread, cells))
+            else:
+                for key, value in cells.items():
+                    self._retired[key] = self._retired.get(key, 0) + value
+        self._threads = alive
+
+    def inc(self, *label_values, amount=1):
+        cells = self._cells()
+        cells[label_values] = cells.get(label_values, 0) + amount
+
+    def values(self):
+        """{значения меток: сумма по потокам}"""
+        with self._lock:
+            self._retire_dead()
+            totals = dict(self._retired)
+            threads = list(self._threads)
+        for _, cells in threads:
+            for key, value in dict(cells).items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def value(self, *label_values):
+        return self.values().get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_labels(self.labels, key)} {_number(value)}")
+        return lines
+
+
+class Gauge:
+    """Значение, вычисляемое при чтении: func() -> число или {значения меток: число}"""
+
+    metric_type = "gauge"
+
+    def __init__(self, name, help_text, func, labels=()):
+        self.name = name
+        self.help = help_text
+        self.func = func
+        self.labels = tuple(labels)
+
+    def render(self):
+        value = self.func()
+        if value is None:
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.metric_type}"]
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for key, item in sorted(items):
+            lines.append(f"{self.name}{_labels(self.labels, key)} {_number(item)}")
+        return lines
+
+
+class CounterFunc(Gauge):
+    """Монотонный счетчик, который ведет другой объект (jobs_done и т.п.)"""
+
+    metric_type = "counter"
+
+
+class SummaryFunc:
+    """Сумма и количество наблюдений из другого объекта: func() -> (sum, count)"""
+
+    def __init__(self, name, help_text, func):
+        self.name = name
+        self.help = help_text
+        self.func = func
+
+    def render(self):
+        total, count = self.func()
+        return [
+            f"# HELP {self.name} {self.help}", f"# TYPE {self.name} summary",
+            f"{self.name}_sum {_number(float(total))}", f"{self.name}_count {count}",
+        ]
+
+
+class LatencyHistograms:
+    """LatencyRecorder (utils/latency.py) как гистограмма Prometheus в секундах
+
+    Сетка корзин одна на все ключи, поэтому ряды можно складывать
+    по le в запросах histogram_quantile.
+    """
+
+    def __init__(self, name, help_text, recorder, label="key"):
+        self.name = name
+        self.help = help_text
+        self.recorder = recorder
+        self.label = label
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        bounds = [_number(round(bucket_upper_ms(index) / 1000, 6)) for index in range(BUCKETS - 1)]
+        for key, histogram in sorted(self.recorder.snapshot().items()):
+            cumulative = 0
+            for le, count in zip(bounds + ["+Inf"], histogram.counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels((self.label, 'le'), (key, le))} {cumulative}")
+            labels = _labels((self.label,), (key,))
+            lines.append(f"{self.name}_sum{labels} {_number(histogram.total / 1000)}")
+            lines.append(f"{self.name}_count{labels} {histogram.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Набор метрик, отдаваемых на /metrics
+
+    Значения берутся из счетчиков и метрик объектов в момент запроса;
+    ни одна метрика не держит блокировку, общую с обработкой апдейтов,
+    дольше копирования своих данных.
+    """
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, func, labels=()):
+        return self.register(Gauge(name, help_text, func, labels))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def update_type(update_data):
+    """Тип апдейта Telegram по JSON: message, callback_query, ..."""
+    for key in update_data:
+        if key != "update_id":
+            return key
+    return "unknown"
+
+
+# Общий реестр бота и счетчики, которые ведут модули
+bot_metrics = MetricsRegistry()
+updates_received = bot_metrics.counter(
+    "bot_updates_received_total", "Апдейты, принятые webhook, по типу", ("type",)
+)
+updates_processed = bot_metrics.counter(
+    "bot_updates_processed_total", "Обработанные апдейты по типу и результату", ("type", "status")
+)
+updates_duplicate = bot_metrics.counter(
+    "bot_updates_duplicate_total", "Повторы апдейтов от Telegram, отброшенные по update_id", ("type",)
+)
+openai_requests = bot_metrics.counter(
+    "bot_openai_requests_total", "Запросы к OpenAI по модели и результату", ("model", "status")
+)
+openai_tokens = bot_metrics.counter(
+    "bot_openai_tokens_total", "Токены OpenAI по модели и виду", ("model", "kind")
+)
+openai_latency = LatencyRecorder(max_keys=20)
+bot_metrics.register(LatencyHistograms(
+    "bot_openai_request_duration_seconds", "Длительность запросов к OpenAI", openai_latency, "model"
+))
+
+
+class OpenAICall:
+    """Замер запроса к OpenAI: with OpenAICall(model) as call: ...
+
+    При исключении или call.status = "error" запрос учитывается как ошибка.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.status = "ok"
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.status = "error"
+        openai_latency.record(self.model, time.perf_counter() - self._started)
+        openai_requests.inc(self.model, self.status)
+        return False
+
+    def record_usage(self, usage):
+        """Токены из response.usage"""
+        if usage is None:
+            return
+        for kind in ("prompt", "completion"):
+            value = getattr(usage, f"{kind}_tokens", None)
+            if value:
+                openai_tokens.inc(self.model, kind, amount=value)
+
+
+def register_process_metrics(registry, started_at=None):
+    """RSS, CPU, потоки и время старта процесса (через psutil)"""
+    if psutil is None:
+        return
+    process = psutil.Process(os.getpid())
+    registry.register(CounterFunc(
+        "process_cpu_seconds_total", "Процессорное время процесса (user + system)",
+        lambda: round(sum(process.cpu_times()[:2]), 3),
+    ))
+    registry.gauge("process_resident_memory_bytes", "RSS процесса", lambda: process.memory_info().rss)
+    registry.gauge("process_threads", "Число потоков процесса", process.num_threads)
+    registry.gauge(
+        "process_start_time_seconds", "Время запуска процесса (unix)",
+        lambda: round(started_at or process.create_time(), 3),
+    )
+
+
+def register_runtime_metrics(registry, writer, pipeline, latency, committers=None):
+    """Метрики очередей и записи бота: поток записи, очередь статистики, обработчики
+
+    committers - {хранилище: GroupCommitter}; хранилища без групповой
+    записи (None) пропускаются.
+    """
+    registry.register(LatencyHistograms(
+        "bot_handler_duration_seconds", "Длительность обработчиков по команде/callback", latency
+    ))
+    registry.gauge("bot_storage_queue_depth", "Задачи в очереди потока записи", lambda: writer.queue_depth)
+    registry.register(SummaryFunc(
+        "bot_storage_flush_seconds", "Длительность задач записи на диск",
+        lambda: (writer.total_flush_latency, writer.jobs_done),
+    ))
+    registry.gauge(
+        "bot_storage_flush_max_seconds", "Самая долгая запись на диск", lambda: writer.max_flush_latency
+    )
+    registry.register(CounterFunc("bot_storage_errors_total", "Ошибки записи", lambda: writer.errors))
+    registry.gauge(
+        "bot_stats_queue_depth", "События статистики, ожидающие агрегатора", lambda: pipeline.queue_depth
+    )
+    registry.register(CounterFunc(
+        "bot_stats_events_total", "События статистики по этапу",
+        lambda: {("published",): pipeline.published, ("processed",): pipeline.processed},
+        ("stage",),
+    ))
+    registry.gauge("bot_stats_lag_seconds", "Лаг последнего события статистики", lambda: pipeline.last_lag)
+    committers = {store: committer for store, committer in (committers or {}).items() if committer is not None}
+    if committers:
+        def by_store(field):
+            return lambda: {(store,): committer.get_metrics()[field] for store, committer in committers.items()}
+
+        registry.gauge(
+            "bot_storage_pending_mutations", "Изменения, ожидающие группового сброса",
+            by_store("pending"), ("store",),
+        )
+        registry.register(CounterFunc(
+            "bot_storage_group_flushes_total", "Групповые сбросы", by_store("flushes"), ("store",)
+        ))
+        registry.register(CounterFunc(
+            "bot_storage_group_flush_seconds_total", "Суммарная длительность групповых сбросов",
+            by_store("flush_seconds"), ("store",),
+        ))
+
+
+def register_update_queue_metrics(registry, queue):
+    """Метрики очереди приема апдейтов (utils/update_queue.py)"""
+    registry.gauge("bot_updates_in_flight", "Апдейты в очереди и в обработке", lambda: queue.in_flight)
+    registry.gauge("bot_update_queue_depth", "Апдейты, ожидающие обработчика", lambda: queue.depth)
+    registry.gauge("bot_update_queue_capacity", "Максимальная длина очереди апдейтов", lambda: queue.maxsize)
+    registry.gauge("bot_update_workers_busy", "Обработчики, занятые апдейтом", lambda: queue.active)
+    registry.register(CounterFunc(
+        "bot_update_queue_rejected_total", "Апдейты, отклоненные из-за полной очереди (503)",
+        lambda: queue.rejected,
+    ))
+    registry.register(LatencyHistograms(
+        "bot_update_queue_wait_seconds", "Время ожидания апдейта в очереди", queue.wait_latency, "queue"
+    ))
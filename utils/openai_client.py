@@ -7,6 +7,8 @@ from typing import List, Dict, Optional, Union
 from openai import AsyncOpenAI
 import json
 
+from utils.metrics import OpenAICall
+
 logger = logging.getLogger(__name__)
 
 class ChatGPTClient:
@@ -88,13 +90,15 @@ class ChatGPTClient:
             logger.info(f"🤖 Отправляем запрос в ChatGPT для пользователя {user_id}")
             logger.debug(f"Сообщений в истории: {len(messages)}")
             
-            # Отправляем запрос в OpenAI
-            response = await self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
+            # Отправляем запрос в OpenAI (время, токены и ошибки - в /metrics)
+            with OpenAICall(model) as call:
+                response = await self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature
+                )
+                call.record_usage(response.usage)
             
             # Извлекаем ответ
             ai_response = response.choices[0].message.content
@@ -0,0 +1,248 @@
+# utils/rollups.py - Инкрементальные агрегаты статистики по часам, дням и неделям
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from utils.hyperloglog import HyperLogLog
+from utils.last_seen import iter_user_dates
+
+# Ключи корзин: час, день и ISO-неделя
+BUCKET_FORMATS = {
+    "hour": "%Y-%m-%dT%H",
+    "day": "%Y-%m-%d",
+    "week": "%G-W%V",
+}
+# Сколько корзин хранить: старые удаляются при создании новых
+BUCKET_RETENTION = {
+    "hour": timedelta(hours=48),
+    "day": timedelta(days=35),
+    "week": timedelta(weeks=53),
+}
+
+
+def _new_bucket(p):
+    return {"active": HyperLogLog(p), "new": 0, "commands": 0, "messages": 0}
+
+
+class StatsRollups:
+    """Агрегаты статистики, обновляемые по мере поступления событий
+
+    Корзины hour/day/week хранят активных (скетч HyperLogLog), новых
+    пользователей, команды и сообщения. Гистограмма first_seen (дата ->
+    число пользователей) дает точное число новых за N дней суммой N+1
+    чисел, без обхода всех пользователей. Активных за N дней считает
+    LastSeenIndex.
+
+    dirty/removed - корзины (уровень, ключ), измененные и удаленные с
+    прошлой записи: хранилище с точечной записью пишет только их.
+    """
+
+    def __init__(self, p=11):
+        self.p = p
+        self.buckets = {granularity: {} for granularity in BUCKET_FORMATS}
+        self.first_seen_days = defaultdict(int)
+        self.dirty = set()
+        self.removed = set()
+
+    def _buckets_for(self, moment):
+        """Корзины всех уровней для момента (создаются при необходимости)"""
+        result = []
+        for granularity, fmt in BUCKET_FORMATS.items():
+            buckets = self.buckets[granularity]
+            key = moment.strftime(fmt)
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = _new_bucket(self.p)
+                self._prune(granularity, moment)
+            self.dirty.add((granularity, key))
+            result.append(bucket)
+        return result
+
+    def _prune(self, granularity, moment):
+        """Удаляет корзины старше срока хранения (ключи сравниваются как строки)"""
+        oldest = (moment - BUCKET_RETENTION[granularity]).strftime(BUCKET_FORMATS[granularity])
+        buckets = self.buckets[granularity]
+        for key in [key for key in buckets if key < oldest]:
+            del buckets[key]
+            self.dirty.discard((granularity, key))
+            self.removed.add((granularity, key))
+
+    def take_changes(self):
+        """Забирает измененные и удаленные корзины (после подготовки записи)"""
+        changes = (self.dirty, self.removed)
+        self.dirty, self.removed = set(), set()
+        return changes
+
+    def restore_changes(self, changes):
+        """Возвращает изменения неудавшейся записи: они уйдут следующей"""
+        dirty, removed = changes
+        self.dirty |= dirty
+        self.removed |= removed
+
+    def record_user(self, user_id, moment, is_new):
+        """Событие пользователя"""
+        hashed = HyperLogLog.hash(user_id)
+        if is_new:
+            self.first_seen_days[moment.strftime(BUCKET_FORMATS["day"])] += 1
+        for bucket in self._buckets_for(moment):
+            bucket["active"].add_hash(hashed)
+            if is_new:
+                bucket["new"] += 1
+
+    def record_command(self, moment):
+        for bucket in self._buckets_for(moment):
+            bucket["commands"] += 1
+
+    def record_message(self, moment):
+        for bucket in self._buckets_for(moment):
+            bucket["messages"] += 1
+
+    @staticmethod
+    def _sum_since(histogram, days, now=None):
+        """Сумма гистограммы за даты от (now - days) до now включительно"""
+        now = now or datetime.now()
+        return sum(
+            histogram.get((now - timedelta(days=offset)).strftime(BUCKET_FORMATS["day"]), 0)
+            for offset in range(days + 1)
+        )
+
+    def new_users(self, days, now=None):
+        """Пользователи с first_seen за последние days дней (точно)"""
+        return self._sum_since(self.first_seen_days, days, now)
+
+    def bucket(self, granularity, moment=None):
+        """Корзина на момент (пустая, если событий не было)"""
+        moment = moment or datetime.now()
+        key = moment.strftime(BUCKET_FORMATS[granularity])
+        return self.buckets[granularity].get(key) or _new_bucket(self.p)
+
+    def recent(self, granularity, count, now=None):
+        """Сводка за последние count корзин: активные (оценка), новые, команды, сообщения"""
+        now = now or datetime.now()
+        step = {"hour": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(weeks=1)}[granularity]
+        buckets = [self.bucket(granularity, now - step * offset) for offset in range(count)]
+        return {
+            "active": HyperLogLog.union([b["active"] for b in buckets], self.p).count(),
+            "new": sum(b["new"] for b in buckets),
+            "commands": sum(b["commands"] for b in buckets),
+            "messages": sum(b["messages"] for b in buckets),
+        }
+
+    def merge(self, other):
+        """Прибавляет агрегаты other (другого процесса) к этим
+
+        Счетчики складываются, скетчи активных объединяются. Гистограмма
+        first_seen и новые по дням/неделям не складываются - пользователь,
+        пришедший в два процесса, новый в обоих; их пересчитывает
+        recount_new() по объединенным пользователям.
+        """
+        for granularity, buckets in other.buckets.items():
+            target = self.buckets[granularity]
+            for key, bucket in buckets.items():
+                current = target.get(key)
+                if current is None:
+                    current = target[key] = _new_bucket(self.p)
+                if bucket["active"].p == self.p:
+                    current["active"].merge(bucket["active"])
+                current["new"] += bucket["new"]
+                current["commands"] += bucket["commands"]
+                current["messages"] += bucket["messages"]
+        return self
+
+    def recount_new(self, users):
+        """Точные новые пользователи по дням и неделям из first_seen users
+
+        Часовые корзины остаются суммой по процессам: дата first_seen
+        хранится без времени.
+        """
+        day_fmt, week_fmt = BUCKET_FORMATS["day"], BUCKET_FORMATS["week"]
+        self.first_seen_days = defaultdict(int)
+        for _, first_seen, _ in iter_user_dates(users):
+            if first_seen:
+                self.first_seen_days[first_seen] += 1
+        for granularity in ("day", "week"):
+            for bucket in self.buckets[granularity].values():
+                bucket["new"] = 0
+        for day, count in self.first_seen_days.items():
+            week = datetime.strptime(day, day_fmt).strftime(week_fmt)
+            for granularity, key in (("day", day), ("week", week)):
+                bucket = self.buckets[granularity].get(key)
+                if bucket is not None:
+                    bucket["new"] += count
+        return self
+
+    @staticmethod
+    def bucket_to_dict(bucket):
+        """Корзина для JSON (скетч - строка)"""
+        return dict(bucket, active=bucket["active"].to_json())
+
+    def header(self):
+        """Все, кроме корзин: точность скетчей и гистограмма first_seen"""
+        return {"p": self.p, "first_seen_days": dict(self.first_seen_days)}
+
+    def to_dict(self):
+        """Структура для JSON (скетчи - строки)"""
+        return dict(
+            self.header(),
+            buckets={
+                granularity: {key: self.bucket_to_dict(bucket) for key, bucket in buckets.items()}
+                for granularity, buckets in self.buckets.items()
+            },
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        rollups = cls(data.get("p", 11))
+        for granularity, buckets in data.get("buckets", {}).items():
+            if granularity not in rollups.buckets:
+                continue
+            for key, bucket in buckets.items():
+                rollups.buckets[granularity][key] = dict(
+                    bucket, active=HyperLogLog.from_json(bucket["active"])
+                )
+        rollups.first_seen_days.update(data.get("first_seen_days", {}))
+        return rollups
+
+    @classmethod
+    def backfill(cls, stats, p=11, now=None):
+        """Строит агрегаты из уже накопленной статистики
+
+        Гистограмма и новые пользователи по дням/неделям восстанавливаются
+        точно из first_seen/last_seen, команды - из daily_stats, активные за
+        день - из дневного скетча и last_seen. Часовые корзины и сообщения
+        по дням в старых данных не хранились и начинают копиться с нуля.
+        """
+        rollups = cls(p)
+        now = now or datetime.now()
+        day_fmt = BUCKET_FORMATS["day"]
+        oldest_day = (now - BUCKET_RETENTION["day"]).strftime(day_fmt)
+        oldest_week = (now - BUCKET_RETENTION["week"]).strftime(BUCKET_FORMATS["week"])
+
+        def buckets_for_day(day):
+            moment = datetime.strptime(day, day_fmt)
+            result = []
+            week = moment.strftime(BUCKET_FORMATS["week"])
+            if day >= oldest_day:
+                result.append(rollups.buckets["day"].setdefault(day, _new_bucket(p)))
+            if week >= oldest_week:
+                result.append(rollups.buckets["week"].setdefault(week, _new_bucket(p)))
+            return result
+
+        for user_key, first_seen, last_seen in iter_user_dates(stats.get("users", {})):
+            if last_seen:
+                # hash() берет str(item): ключ "42" и событие с id 42 совпадают
+                hashed = HyperLogLog.hash(user_key)
+                for bucket in buckets_for_day(last_seen):
+                    bucket["active"].add_hash(hashed)
+            if first_seen:
+                rollups.first_seen_days[first_seen] += 1
+                for bucket in buckets_for_day(first_seen):
+                    bucket["new"] += 1
+
+        for day, day_stats in stats.get("daily_stats", {}).items():
+            sketch = day_stats.get("unique_users")
+            for bucket in buckets_for_day(day):
+                bucket["commands"] += sum(day_stats.get("commands", {}).values())
+                if isinstance(sketch, HyperLogLog) and sketch.p == p:
+                    bucket["active"].merge(sketch)
+        return rollups
+
@@ -0,0 +1,119 @@
+# utils/stats_archive.py - Холодный архив дневной статистики по месяцам
+import gzip
+import json
+import os
+import re
+from collections import defaultdict
+
+from config import HLL_PRECISION, STATS_ARCHIVE_DIR
+from utils.hyperloglog import HyperLogLog
+from utils.storage import _json_default, atomic_write, normalize_day
+
+_MONTH_FILE = re.compile(r"^daily_stats-(\d{4}-\d{2})\.json\.gz$")
+
+
+class StatsArchive:
+    """Сжатые gzip-файлы daily_stats-YYYY-MM.json.gz: {дата: дневная статистика}
+
+    Дни переносятся сюда из горячей статистики; файл месяца дописывается
+    (читается, дополняется и атомарно перезаписывается), так что повторный
+    перенос того же дня идемпотентен.
+    """
+
+    def __init__(self, archive_dir=STATS_ARCHIVE_DIR):
+        self.archive_dir = archive_dir
+
+    def month_file(self, month):
+        return os.path.join(self.archive_dir, f"daily_stats-{month}.json.gz")
+
+    def months(self):
+        """Месяцы в архиве по возрастанию"""
+        if not os.path.isdir(self.archive_dir):
+            return []
+        return sorted(
+            match.group(1)
+            for match in map(_MONTH_FILE.match, os.listdir(self.archive_dir))
+            if match
+        )
+
+    def load_month(self, month, normalize=True):
+        """Дни месяца из архива (скетчи восстановлены, если normalize)"""
+        path = self.month_file(month)
+        if not os.path.exists(path):
+            return {}
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            days = json.load(f)
+        if normalize:
+            for day_stats in days.values():
+                normalize_day(day_stats, exact_uniques=False)
+        return days
+
+    def write_month(self, month, days):
+        """Дописывает дни в файл месяца; возвращает размер файла"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        merged = self.load_month(month, normalize=False)
+        merged.update(days)
+        payload = json.dumps(merged, ensure_ascii=False, sort_keys=True, default=_json_default)
+        path = self.month_file(month)
+        atomic_write(path, gzip.compress(payload.encode('utf-8')))
+        return os.path.getsize(path)
+
+    def iter_days(self, start=None, end=None):
+        """(дата, дневная статистика) из архива за [start, end] по возрастанию"""
+        for month in self.months():
+            if (start and month < start[:7]) or (end and month > end[:7]):
+                continue
+            days = self.load_month(month)
+            for date in sorted(days):
+                if (start and date < start) or (end and date > end):
+                    continue
+                yield date, days[date]
+
+    def size(self):
+        """Суммарный объем файлов архива в байтах"""
+        return sum(os.path.getsize(self.month_file(month)) for month in self.months())
+
+
+def summarize_days(days, p=11):
+    """Агрегат по дням: число дней, команды, категории, объединенный скетч
+
+    Такой агрегат остается в горячей статистике вместо перенесенных дней.
+    """
+    summary = {
+        "days": 0,
+        "commands": defaultdict(int),
+        "categories": defaultdict(int),
+        "unique_users": HyperLogLog(p),
+    }
+    merge_summary(summary, days)
+    return summary
+
+
+def merge_summary(summary, days):
+    """Добавляет дни в существующий агрегат месяца"""
+    summary["commands"] = defaultdict(int, summary.get("commands", {}))
+    summary["categories"] = defaultdict(int, summary.get("categories", {}))
+    for day_stats in days.values():
+        summary["days"] = summary.get("days", 0) + 1
+        for command, count in day_stats.get("commands", {}).items():
+            summary["commands"][command] += count
+        for category, count in day_stats.get("categories", {}).items():
+            summary["categories"][category] += count
+        sketch = day_stats.get("unique_users")
+        if isinstance(sketch, HyperLogLog) and sketch.p == summary["unique_users"].p:
+            summary["unique_users"].merge(sketch)
+    return summary
+
+
+def archive_report(archive, start=None, end=None):
+    """Отчет по архиву за [start, end]: помесячно и итого
+
+    Уникальные пользователи месяца и периода - объединение дневных скетчей.
+    """
+    months = {}
+    total = summarize_days({}, HLL_PRECISION)
+    for date, day_stats in archive.iter_days(start, end):
+        day = {date: day_stats}
+        merge_summary(months.setdefault(date[:7], summarize_days({}, HLL_PRECISION)), day)
+        merge_summary(total, day)
+    return {"months": months, "total": total}
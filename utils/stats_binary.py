@@ -0,0 +1,296 @@
+# utils/stats_binary.py - Бинарный снапшот статистики с ленивой загрузкой пользователей
+import json
+import struct
+import sys
+import zlib
+from array import array
+from collections import defaultdict
+from collections.abc import MutableMapping
+from datetime import date
+
+# Заголовок файла: magic, crc32 тела, длины секций
+MAGIC = b"BSTATS1\n"
+_HEADER = struct.Struct("<8sIIIIII")  # magic, crc32, header_len, strings, blob_len, users, details_len
+_DETAIL = struct.Struct("<IIIH")       # username, first_name, message_count, число команд
+_COMMAND = struct.Struct("<II")        # команда, счетчик
+NONE = 0xFFFFFFFF
+
+
+class BinaryFormatError(ValueError):
+    """Файл не является бинарным снапшотом статистики или поврежден"""
+
+
+def _le_array(typecode, data):
+    """array из little-endian байтов"""
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def _le_bytes(values):
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+_day_cache = {0: None}
+
+
+def _day_str(ordinal):
+    """Порядковый номер дня -> 'YYYY-MM-DD' (дат в статистике немного - кэшируются)"""
+    day = _day_cache.get(ordinal)
+    if day is None and ordinal:
+        day = _day_cache[ordinal] = date.fromordinal(ordinal).isoformat()
+    return day
+
+
+def _day_ordinal(day):
+    return date.fromisoformat(day).toordinal() if day else 0
+
+
+def _numeric_id(user_key):
+    """int для ключей-чисел, иначе None (такие пользователи идут в заголовок)"""
+    try:
+        value = int(user_key)
+    except (TypeError, ValueError):
+        return None
+    return value if str(value) == user_key and -2 ** 63 <= value < 2 ** 63 else None
+
+
+class StringTable:
+    """Таблица строк: массив смещений и общий блоб, строки декодируются по запросу"""
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+        self._cache = {}
+        self._index = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index == NONE:
+            return None
+        value = self._cache.get(index)
+        if value is None:
+            value = self._cache[index] = str(self.blob[self.offsets[index]:self.offsets[index + 1]], 'utf-8')
+        return value
+
+    def index_map(self):
+        """{строка: индекс} - строится один раз, при первой записи"""
+        if self._index is None:
+            self._index = {self[i]: i for i in range(len(self))}
+        return self._index
+
+
+class StatsSnapshot:
+    """Разобранный бинарный снапшот
+
+    Разбор - только заголовок и колонки пользователей (id, first_seen,
+    last_seen, смещения записей) через array.frombytes, без цикла по
+    пользователям в Python. Записи пользователей (имена, сообщения,
+    команды) декодируются по одной при обращении.
+    """
+
+    def __init__(self, data):
+        if len(data) < _HEADER.size:
+            raise BinaryFormatError("Файл короче заголовка")
+        magic, crc, header_len, strings, blob_len, users, details_len = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise BinaryFormatError("Неизвестный формат снапшота статистики")
+        body = memoryview(data)[_HEADER.size:]
+        if zlib.crc32(body) != crc:
+            raise BinaryFormatError("Контрольная сумма снапшота статистики не совпадает")
+
+        position = 0
+
+        def take(size):
+            nonlocal position
+            chunk = body[position:position + size]
+            position += size
+            return chunk
+
+        self.header = json.loads(str(take(header_len), 'utf-8'))
+        self.strings = StringTable(_le_array('I', take(4 * (strings + 1))), take(blob_len))
+        self.ids = _le_array('q', take(8 * users))
+        self.first_seen = _le_array('I', take(4 * users))
+        self.last_seen = _le_array('I', take(4 * users))
+        self.detail_offsets = _le_array('I', take(4 * (users + 1)))
+        self.details = take(details_len)
+        if position != len(body):
+            raise BinaryFormatError("Размеры секций снапшота не сходятся")
+        self.rows = dict(zip(self.ids, range(users)))
+
+    @classmethod
+    def read(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f.read())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row_of(self, user_key):
+        user_id = _numeric_id(user_key)
+        return None if user_id is None else self.rows.get(user_id)
+
+    def raw_detail(self, row):
+        return self.details[self.detail_offsets[row]:self.detail_offsets[row + 1]]
+
+    def decode_user(self, row):
+        """Полная запись пользователя в формате stats["users"]"""
+        detail = self.raw_detail(row)
+        username, first_name, message_count, commands = _DETAIL.unpack_from(detail)
+        commands_used = defaultdict(int)
+        for offset in range(_DETAIL.size, _DETAIL.size + commands * _COMMAND.size, _COMMAND.size):
+            command, count = _COMMAND.unpack_from(detail, offset)
+            commands_used[self.strings[command]] = count
+        return {
+            "username": self.strings[username],
+            "first_name": self.strings[first_name],
+            "first_seen": _day_str(self.first_seen[row]),
+            "last_seen": _day_str(self.last_seen[row]),
+            "message_count": message_count,
+            "commands_used": commands_used,
+        }
+
+
+class LazyUsers(MutableMapping):
+    """stats["users"] поверх снапшота: записи декодируются при первом обращении
+
+    Декодированные (и новые) пользователи живут в обычном dict и дальше
+    изменяются как раньше; остальные остаются байтами снапшота.
+    """
+
+    def __init__(self, snapshot, extra=None):
+        self.snapshot = snapshot
+        self.loaded = dict(extra or {})
+        self.deleted = set()
+        self._unloaded = len(snapshot)
+
+    def _load(self, key):
+        user = self.loaded.get(key)
+        if user is not None or key in self.deleted:
+            return user
+        row = self.snapshot.row_of(key)
+        if row is None:
+            return None
+        user = self.loaded[key] = self.snapshot.decode_user(row)
+        self._unloaded -= 1
+        return user
+
+    def __getitem__(self, key):
+        user = self._load(key)
+        if user is None:
+            raise KeyError(key)
+        return user
+
+    def __contains__(self, key):
+        return key in self.loaded or (key not in self.deleted and self.snapshot.row_of(key) is not None)
+
+    def __setitem__(self, key, value):
+        if key not in self.loaded and key not in self.deleted and self.snapshot.row_of(key) is not None:
+            self._unloaded -= 1
+        self.deleted.discard(key)
+        self.loaded[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if self.loaded.pop(key, None) is None:
+            self._unloaded -= 1
+        self.deleted.add(key)
+
+    def __iter__(self):
+        yield from list(self.loaded)
+        loaded, deleted = self.loaded, self.deleted
+        for user_id in self.snapshot.ids:
+            key = str(user_id)
+            if key not in loaded and key not in deleted:
+                yield key
+
+    def __len__(self):
+        return len(self.loaded) + self._unloaded
+
+    def iter_dates(self):
+        """(ключ, first_seen, last_seen) всех пользователей без декодирования записей"""
+        for key, user in list(self.loaded.items()):
+            yield key, user.get("first_seen"), user.get("last_seen")
+        snapshot, loaded, deleted = self.snapshot, self.loaded, self.deleted
+        for row, user_id in enumerate(snapshot.ids):
+            key = str(user_id)
+            if key not in loaded and key not in deleted:
+                yield key, _day_str(snapshot.first_seen[row]), _day_str(snapshot.last_seen[row])
+
+
+def user_row(user):
+    """Неизменяемый снимок записи пользователя для записи в другом потоке"""
+    return (
+        user.get("username"), user.get("first_name"), user.get("first_seen"), user.get("last_seen"),
+        user.get("message_count", 0), tuple(user.get("commands_used", {}).items()),
+    )
+
+
+def build_snapshot(header_json, source, rows):
+    """Собирает байты снапшота
+
+    source - предыдущий StatsSnapshot (или None): его пользователи, не
+    упомянутые в rows, копируются байтами без декодирования, а таблица
+    строк дополняется новыми строками. rows - {ключ: user_row() или None
+    для удаленного}; ключи должны быть числовыми.
+    """
+    if source is not None:
+        offsets = array('I', source.strings.offsets)
+        blob = bytearray(source.strings.blob)
+        index = dict(source.strings.index_map())
+    else:
+        offsets, blob, index = array('I', [0]), bytearray(), {}
+
+    def intern(value):
+        if value is None:
+            return NONE
+        position = index.get(value)
+        if position is None:
+            blob.extend(value.encode('utf-8'))
+            position = index[value] = len(offsets) - 1
+            offsets.append(len(blob))
+        return position
+
+    ids, first_seen, last_seen = array('q'), array('I'), array('I')
+    detail_offsets, details = array('I', [0]), bytearray()
+
+    if source is not None:
+        replaced = {_numeric_id(key) for key in rows}
+        for row, user_id in enumerate(source.ids):
+            if user_id in replaced:
+                continue
+            ids.append(user_id)
+            first_seen.append(source.first_seen[row])
+            last_seen.append(source.last_seen[row])
+            details += source.raw_detail(row)
+            detail_offsets.append(len(details))
+
+    for key, user in rows.items():
+        if user is None:
+            continue
+        username, first_name, first, last, message_count, commands = user
+        ids.append(_numeric_id(key))
+        first_seen.append(_day_ordinal(first))
+        last_seen.append(_day_ordinal(last))
+        details += _DETAIL.pack(intern(username), intern(first_name), message_count, len(commands))
+        for command, count in commands:
+            details += _COMMAND.pack(intern(command), count)
+        detail_offsets.append(len(details))
+
+    header_bytes = header_json.encode('utf-8')
+    body = b"".join((
+        header_bytes, _le_bytes(offsets), bytes(blob), _le_bytes(ids), _le_bytes(first_seen),
+        _le_bytes(last_seen), _le_bytes(detail_offsets), bytes(details),
+    ))
+    head = _HEADER.pack(
+        MAGIC, zlib.crc32(body), len(header_bytes), len(offsets) - 1, len(blob), len(ids), len(details)
+    )
+    return head + body
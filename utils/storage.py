@@ -0,0 +1,1331 @@
+# utils/storage.py - Хранилища реакций и статистики (JSON / SQLite)
+import hashlib
+import heapq
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime
+
+from config import (
+    STORAGE_BACKEND, SQLITE_DB_FILE, REACTION_SHARDS, HLL_PRECISION, STATS_EXACT_UNIQUES,
+    STATS_FORMAT
+)
+from utils.hyperloglog import HyperLogLog
+from utils.cohorts import CohortRetention
+from utils.rollups import StatsRollups
+from utils.json_stream import HashingReader, JsonObjectStream, iter_json_object
+from utils.stats_binary import LazyUsers, StatsSnapshot, _numeric_id, build_snapshot, user_row
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def atomic_write(path, text):
+    """Атомарно записывает текст (или bytes): временный файл, fsync, rename
+
+    text может быть и списком кусков bytes - они пишутся подряд, без
+    склейки в одну строку. При сбое посреди записи на диске остается
+    либо старый, либо новый файл целиком, но никогда не обрезанный.
+    """
+    tmp_file = f"{path}.tmp"
+    if isinstance(text, (bytes, list)):
+        f = open(tmp_file, 'wb')
+    else:
+        f = open(tmp_file, 'w', encoding='utf-8')
+    with f:
+        if isinstance(text, list):
+            f.writelines(text)
+        else:
+            f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+    if hasattr(os, "O_DIRECTORY"):
+        # Фиксируем сам rename в каталоге
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+SNAPSHOT_FORMAT = "reactions-snapshot/1"
+
+
+def json_object_chunks(data):
+    """JSON-объект {user: posts} кусками bytes, по одному на запись верхнего уровня
+
+    data - dict или снимок CompactReactionStore: нужен только items(),
+    поэтому вложенные dict всех реакций сразу не создаются.
+    """
+    chunks = [b"{"]
+    for index, (key, value) in enumerate(data.items()):
+        item = json.dumps({key: value}, ensure_ascii=False, separators=(',', ':'))[1:-1]
+        chunks.append(((',' if index else '') + item).encode('utf-8'))
+    chunks.append(b"}")
+    return chunks
+
+
+def write_snapshot_file(path, version, data):
+    """Атомарно пишет снапшот: строка-заголовок с sha256, затем JSON
+
+    Заголовок хранит версию, длину и контрольную сумму тела, поэтому
+    поврежденный или неполный снапшот обнаруживается при чтении. Тело
+    собирается по записям (json_object_chunks), сумма - по ходу.
+    """
+    chunks = json_object_chunks(data)
+    digest = hashlib.sha256()
+    for chunk in chunks:
+        digest.update(chunk)
+    header = {
+        "format": SNAPSHOT_FORMAT,
+        "version": version,
+        "created": datetime.now().isoformat(),
+        "length": sum(len(chunk) for chunk in chunks),
+        "sha256": digest.hexdigest(),
+    }
+    atomic_write(path, [(json.dumps(header) + "\n").encode('utf-8')] + chunks)
+
+
+def iter_snapshot_file(path):
+    """Потоково читает снапшот: пары (ключ верхнего уровня, значение)
+
+    Контрольная сумма считается по ходу чтения и проверяется после
+    последней пары. При несовпадении длины, суммы или формата бросает
+    ValueError - уже выданные пары вызывающий должен отбросить.
+    """
+    with open(path, 'rb') as f:
+        header = json.loads(f.readline())
+        if not isinstance(header, dict) or header.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError("неизвестный формат снапшота")
+        reader = HashingReader(f)
+        text = io.TextIOWrapper(io.BufferedReader(reader), encoding='utf-8')
+        yield from JsonObjectStream(text).iter_items()
+        # Хвост после объекта тоже входит в контрольную сумму
+        text.read()
+    if reader.length != header["length"]:
+        raise ValueError(f"длина {reader.length} вместо {header['length']}")
+    if reader.sha256.hexdigest() != header["sha256"]:
+        raise ValueError("контрольная сумма не совпадает")
+
+
+def peak_rss_mb():
+    """Пиковый RSS процесса в МБ (None, если недоступен)"""
+    if resource is None:
+        return None
+    # ru_maxrss - в КБ на Linux и в байтах на macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024 / (1024 if os.uname().sysname == "Darwin" else 1), 1)
+
+
+def _put_user(data, user_key, posts):
+    """Кладет запись верхнего уровня в dict или CompactReactionStore"""
+    if isinstance(data, dict):
+        data[user_key] = posts
+    else:
+        data.put_user(user_key, posts)
+
+
+def _put_reaction(data, user_key, post_key, reaction):
+    """Кладет одну реакцию в dict или CompactReactionStore"""
+    if isinstance(data, dict):
+        data.setdefault(user_key, {})[post_key] = reaction
+    else:
+        data.set(user_key, post_key, reaction)
+
+
+class ReactionStorage:
+    """Интерфейс хранилища реакций
+
+    Хранилище отвечает только за персистентность: ReactionsDB держит
+    данные в памяти и сообщает хранилищу о каждом изменении.
+    """
+
+    def load(self, factory=dict):
+        """Возвращает данные в виде {user_id: {post_id: reaction}}
+
+        factory создает пустой контейнер: dict или CompactReactionStore,
+        который заполняется запись за записью.
+        """
+        raise NotImplementedError
+
+    def record(self, user_key, post_key, reaction, data):
+        """Сохраняет одну реакцию; data - снимок для снапшотов или None
+
+        data - dict или CompactReactionStore; от него нужен только
+        items() с парами (user_key, {post_key: reaction}).
+        """
+        self.record_many([(user_key, post_key, reaction)], data)
+
+    def record_many(self, records, data):
+        """Сохраняет пачку реакций
+
+        data - снимок (snapshot()), если needs_snapshot() его запросил,
+        иначе None: запись идет вне блокировки ReactionsDB, и живые данные
+        в это время меняются.
+        """
+        raise NotImplementedError
+
+    def needs_snapshot(self, count):
+        """Нужен ли record_many снимок данных для пачки из count записей"""
+        return False
+
+    def snapshot(self, data):
+        """Копия data, которую можно писать вне блокировки ReactionsDB
+
+        У CompactReactionStore копируются колонки (copy_rows), без
+        разворачивания во вложенные dict.
+        """
+        if hasattr(data, "copy_rows"):
+            return data.copy_rows()
+        return {
+            user_key: dict(posts) if isinstance(posts, dict) else posts
+            for user_key, posts in data.items()
+        }
+
+    def save(self, data):
+        """Полностью сохраняет состояние"""
+        raise NotImplementedError
+
+    def sync(self):
+        """Гарантирует, что записанное дошло до диска (fsync)"""
+
+    def close(self):
+        """Освобождает ресурсы хранилища"""
+
+
+class JsonReactionStorage(ReactionStorage):
+    """JSON-снапшот + журнал добавлений
+
+    В режиме журнала (use_log=True) каждая реакция дописывается одной
+    компактной строкой в ``<db_file>.log``. Компактизация в фоновом потоке
+    переносит журнал в сегмент ``<db_file>.log.<N>`` и пишет версионный
+    снапшот ``<db_file>.snap.<N>`` с контрольной суммой в заголовке.
+    Хранятся keep_snapshots последних снапшотов и сегменты после самого
+    старого из них: если свежий снапшот поврежден, загрузка берет
+    предыдущий и доигрывает сегменты журнала.
+
+    ``db_file`` без заголовка - исходный файл старого формата; он читается,
+    только когда целых снапшотов нет, и в режиме без журнала.
+    """
+
+    SNAPSHOT_RE = re.compile(r"\.snap\.(\d{8})")
+    SEGMENT_RE = re.compile(r"\.log\.(\d{8})")
+
+    def __init__(self, db_file="reactions_data.json", use_log=True, compact_every=10000, keep_snapshots=3):
+        self.db_file = db_file
+        self.log_file = f"{db_file}.log"
+        # Журнал прерванной компактизации старого формата (до версионных снапшотов)
+        self.rotated_log_file = f"{self.log_file}.1"
+        self.use_log = use_log
+        self.compact_every = compact_every
+        self.keep_snapshots = keep_snapshots
+        self._lock = threading.RLock()
+        self._log = None
+        self._log_records = 0
+        self._version = 0
+        self._compaction_thread = None
+        # Отчет о последней загрузке: снапшот, откаты, записи журнала, время
+        self.recovery = {}
+
+    def snapshot_file(self, version):
+        """Путь к снапшоту версии version"""
+        return f"{self.db_file}.snap.{version:08d}"
+
+    def segment_file(self, version):
+        """Путь к сегменту журнала, вошедшему в снапшот version"""
+        return f"{self.log_file}.{version:08d}"
+
+    def _list_versions(self, pattern):
+        """Версии файлов рядом с db_file, подходящих под pattern, по возрастанию"""
+        directory = os.path.dirname(os.path.abspath(self.db_file))
+        prefix = os.path.basename(self.db_file)
+        versions = []
+        for name in os.listdir(directory):
+            match = name.startswith(prefix) and pattern.fullmatch(name[len(prefix):])
+            if match:
+                versions.append(int(match.group(1)))
+        return sorted(versions)
+
+    def snapshot_versions(self):
+        """Версии снапшотов на диске"""
+        return self._list_versions(self.SNAPSHOT_RE)
+
+    def segment_versions(self):
+        """Версии сегментов журнала на диске"""
+        return self._list_versions(self.SEGMENT_RE)
+
+    def load(self, factory=dict):
+        """Восстанавливает данные: последний целый снапшот + журнал
+
+        Файлы читаются потоково, запись за записью, без json.load всего
+        файла. Поврежденные снапшоты пропускаются с откатом к предыдущей
+        версии; время восстановления и пиковый RSS сохраняются в
+        self.recovery.
+        """
+        started = time.perf_counter()
+        data = None
+        snapshot_version = 0
+        corrupted = []
+        snapshots = self.snapshot_versions() if self.use_log else []
+        for version in reversed(snapshots):
+            data = factory()
+            try:
+                for user_key, posts in iter_snapshot_file(self.snapshot_file(version)):
+                    _put_user(data, user_key, posts)
+                snapshot_version = version
+                break
+            except Exception as e:
+                data = None
+                corrupted.append(version)
+                print(f"Снапшот реакций v{version} поврежден ({e}), откат к предыдущему")
+
+        if data is None:
+            data = self._load_base_file(factory)
+
+        replayed = 0
+        segments = []
+        if self.use_log:
+            if not snapshot_version:
+                replayed += self._replay_log(self.rotated_log_file, data)
+            segments = self.segment_versions()
+            for version in segments:
+                if version > snapshot_version:
+                    replayed += self._replay_log(self.segment_file(version), data)
+            self._log_records = self._replay_log(self.log_file, data)
+            replayed += self._log_records
+
+        self._version = max(snapshots + segments + [0])
+        self.recovery = {
+            "snapshot_version": snapshot_version or None,
+            "corrupted_snapshots": corrupted,
+            "log_records": replayed,
+            "seconds": time.perf_counter() - started,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        return data
+
+    def _load_base_file(self, factory=dict):
+        """Читает db_file старого формата; поврежденный файл откладывает в сторону
+
+        Понимает смешанный формат: служебные "reactions"/"reaction_users"
+        из main_bot.py рядом со словарями пользователей.
+        """
+        data = factory()
+        if not os.path.exists(self.db_file):
+            return data
+        try:
+            for user_key, posts in iter_json_object(self.db_file):
+                _put_user(data, user_key, posts)
+            return data
+        except Exception as e:
+            # Не перезаписываем единственную копию данных пустым состоянием
+            corrupt_file = f"{self.db_file}.corrupt"
+            print(f"Файл реакций поврежден ({e}), сохранен как {corrupt_file}")
+            os.replace(self.db_file, corrupt_file)
+            return factory()
+
+    def _replay_log(self, path, data):
+        """Применяет записи журнала к data, возвращает число записей"""
+        if not os.path.exists(path):
+            return 0
+
+        applied = 0
+        tail = b""
+        tail_ok = False
+        with open(path, 'rb') as f:
+            for line in f:
+                tail = line
+                tail_ok = False
+                try:
+                    record = json.loads(line)
+                    _put_reaction(data, record["u"], record["p"], record["r"])
+                except (ValueError, KeyError, TypeError):
+                    # Оборванная при сбое последняя строка - пропускаем
+                    continue
+                tail_ok = True
+                applied += 1
+        if tail and not tail.endswith(b"\n"):
+            self._repair_tail(path, tail, tail_ok)
+        return applied
+
+    def _repair_tail(self, path, tail, tail_ok):
+        """Чинит последнюю строку без перевода строки, чтобы дозапись не склеилась с ней
+
+        Разобранная строка дополняется "\n", оборванная - отрезается.
+        """
+        try:
+            with open(path, 'r+b') as f:
+                if tail_ok:
+                    f.seek(0, os.SEEK_END)
+                    f.write(b"\n")
+                else:
+                    f.truncate(os.path.getsize(path) - len(tail))
+                    print(f"Оборванная запись в конце {path} отрезана ({len(tail)} байт)")
+        except OSError as e:
+            print(f"Ошибка восстановления хвоста журнала {path}: {e}")
+
+    def save(self, data):
+        """Сохраняет данные в файл"""
+        try:
+            if isinstance(data, dict):
+                atomic_write(self.db_file, json.dumps(data, ensure_ascii=False, indent=2))
+            else:
+                atomic_write(self.db_file, json_object_chunks(data))
+        except Exception as e:
+            print(f"Ошибка сохранения данных: {e}")
+
+    def needs_snapshot(self, count):
+        """Снимок нужен без журнала (файл переписывается) и перед компактизацией"""
+        if not self.use_log:
+            return True
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return False
+        return bool(self.compact_every) and self._log_records + count >= self.compact_every
+
+    def record_many(self, records, data):
+        """Дописывает реакции в журнал или переписывает файл целиком (data - снимок)"""
+        with self._lock:
+            if not self.use_log:
+                if data is not None:
+                    self.save(data)
+                return
+
+            for user_key, post_key, reaction in records:
+                self._append_log(user_key, post_key, reaction)
+            if self._log is not None:
+                self._log.flush()
+            if data is not None and self.compact_every and self._log_records >= self.compact_every:
+                self.compact(data)
+
+    def _append_log(self, user_key, post_key, reaction):
+        """Дописывает одну запись в журнал"""
+        try:
+            if self._log is None:
+                self._log = open(self.log_file, 'a', encoding='utf-8')
+            record = {"u": user_key, "p": post_key, "r": reaction}
+            self._log.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+            self._log_records += 1
+        except Exception as e:
+            print(f"Ошибка записи в журнал реакций: {e}")
+
+    def compact(self, data, wait=False):
+        """Запускает фоновую компактизацию: новый снапшот и обрезка журнала
+
+        Текущий журнал переименовывается в сегмент следующей версии вместе
+        со снимком данных, поэтому новые реакции продолжают писаться в
+        свежий журнал, пока снапшот сохраняется в фоне. data - снимок
+        (snapshot()), который больше не меняется: в нем должны быть все
+        реакции, уже записанные в журнал (ReactionsDB снимает его под
+        своей блокировкой до записи).
+        """
+        with self._lock:
+            if self._compaction_thread is not None and self._compaction_thread.is_alive():
+                return
+
+            snapshot = data
+            try:
+                version = self._rotate_log()
+            except Exception as e:
+                print(f"Ошибка ротации журнала реакций: {e}")
+                return
+
+            self._compaction_thread = threading.Thread(
+                target=self._write_snapshot, args=(version, snapshot), daemon=True
+            )
+            self._compaction_thread.start()
+
+        if wait:
+            self.wait_for_compaction()
+
+    def _rotate_log(self):
+        """Переносит журнал в сегмент новой версии (вызывается под блокировкой)"""
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+        self._version += 1
+        segment = self.segment_file(self._version)
+        if os.path.exists(self.rotated_log_file):
+            # Журнал старого формата идет в сегмент первым
+            os.replace(self.rotated_log_file, segment)
+        if os.path.exists(self.log_file):
+            if os.path.exists(segment):
+                with open(self.log_file, 'rb') as src, open(segment, 'ab') as dst:
+                    dst.write(src.read())
+                os.remove(self.log_file)
+            else:
+                os.replace(self.log_file, segment)
+        self._log_records = 0
+        return self._version
+
+    def _write_snapshot(self, version, snapshot):
+        """Атомарно записывает снапшот версии version и удаляет устаревшие файлы"""
+        try:
+            write_snapshot_file(self.snapshot_file(version), version, snapshot)
+            self._prune(version)
+        except Exception as e:
+            print(f"Ошибка компактизации реакций: {e}")
+
+    def _prune(self, version):
+        """Оставляет keep_snapshots снапшотов и сегменты журнала после старейшего"""
+        snapshots = [v for v in self.snapshot_versions() if v <= version]
+        oldest = snapshots[-max(self.keep_snapshots, 1):][0]
+        for old in snapshots:
+            if old < oldest:
+                os.remove(self.snapshot_file(old))
+        for old in self.segment_versions():
+            if old <= oldest:
+                os.remove(self.segment_file(old))
+
+    def sync(self):
+        """fsync журнала - вызывается раз на пачку при групповой записи"""
+        with self._lock:
+            if self._log is not None:
+                self._log.flush()
+                os.fsync(self._log.fileno())
+
+    def wait_for_compaction(self, timeout=None):
+        """Ожидает завершения фоновой компактизации"""
+        thread = self._compaction_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def close(self):
+        """Закрывает журнал и дожидается компактизации"""
+        self.wait_for_compaction()
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+
+def connect_sqlite(db_file):
+    """Открывает соединение SQLite в режиме WAL"""
+    conn = sqlite3.connect(db_file, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SqliteReactionStorage(ReactionStorage):
+    """Хранилище реакций в SQLite (WAL)
+
+    Каждая реакция - одна строка (user_id, post_id). Запросы используют
+    постоянный текст с параметрами, поэтому sqlite3 берет уже
+    подготовленные выражения из своего кэша.
+    """
+
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS reactions (
+            user_id TEXT NOT NULL,
+            post_id TEXT NOT NULL,
+            reaction TEXT NOT NULL,
+            PRIMARY KEY (user_id, post_id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_reactions_post ON reactions (post_id)",
+        "CREATE INDEX IF NOT EXISTS idx_reactions_user ON reactions (user_id)",
+    )
+    UPSERT = (
+        "INSERT INTO reactions (user_id, post_id, reaction) VALUES (?, ?, ?) "
+        "ON CONFLICT (user_id, post_id) DO UPDATE SET reaction = excluded.reaction"
+    )
+
+    def __init__(self, db_file=SQLITE_DB_FILE):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self.conn = connect_sqlite(db_file)
+        with self.conn:
+            for statement in self.SCHEMA:
+                self.conn.execute(statement)
+
+    def load(self, factory=dict):
+        """Загружает все реакции построчно"""
+        data = factory()
+        self.load_into(data)
+        return data
+
+    def load_into(self, data):
+        """Дописывает все реакции в уже созданный контейнер"""
+        with self._lock:
+            for user_key, post_key, reaction in self.conn.execute(
+                "SELECT user_id, post_id, reaction FROM reactions"
+            ):
+                _put_reaction(data, user_key, post_key, reaction)
+
+    def record_many(self, records, data=None):
+        """Сохраняет пачку реакций одной транзакцией"""
+        with self._lock, self.conn:
+            self.conn.executemany(self.UPSERT, records)
+
+    def save(self, data):
+        """Сохраняет все реакции одной транзакцией"""
+        self.record_many(
+            (user_key, post_key, reaction)
+            for user_key, posts in data.items()
+            if isinstance(posts, dict)
+            for post_key, reaction in posts.items()
+            if isinstance(reaction, str)
+        )
+
+    def post_counts(self, post_key):
+        """Считает реакции на пост по индексу post_id, без загрузки в память"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT reaction, COUNT(*) FROM reactions WHERE post_id = ? GROUP BY reaction",
+                (post_key,),
+            ).fetchall()
+        return dict(rows)
+
+    def top_posts(self, emoji=None, n=10):
+        """n постов с наибольшим числом реакций emoji (None - всех): [(post_key, count)]"""
+        with self._lock:
+            if emoji is None:
+                rows = self.conn.execute(
+                    "SELECT post_id, COUNT(*) AS count FROM reactions GROUP BY post_id "
+                    "ORDER BY count DESC, post_id LIMIT ?", (n,),
+                ).fetchall()
+            else:
+                rows = self.conn.execute(
+                    "SELECT post_id, COUNT(*) AS count FROM reactions WHERE reaction = ? GROUP BY post_id "
+                    "ORDER BY count DESC, post_id LIMIT ?", (emoji, n),
+                ).fetchall()
+        return rows
+
+    def get_reaction(self, user_key, post_key):
+        """Реакция пользователя на пост по первичному ключу"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT reaction FROM reactions WHERE user_id = ? AND post_id = ?",
+                (user_key, post_key),
+            ).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        """Закрывает соединение"""
+        with self._lock:
+            self.conn.close()
+
+
+def shard_for(post_key, shards):
+    """Номер шарда поста: crc32, а не hash() - он одинаков во всех процессах"""
+    return zlib.crc32(str(post_key).encode('utf-8')) % shards
+
+
+class ShardedSqliteReactionStorage(ReactionStorage):
+    """Реакции в N файлах SQLite, шард выбирается по post_id
+
+    Для нескольких процессов-воркеров: каждый шард - отдельный файл со
+    своей файловой блокировкой SQLite, поэтому воркеры пишут в любые
+    шарды и ждут друг друга только внутри одного шарда. Все реакции поста
+    лежат в одном шарде, так что счетчики поста и реакция пользователя
+    читаются запросом к одному файлу.
+    """
+
+    # Данные меняют и другие процессы: чтения нужно обслуживать из хранилища
+    shared = True
+
+    def __init__(self, db_file=SQLITE_DB_FILE, shards=REACTION_SHARDS):
+        if shards < 1:
+            raise ValueError("Количество шардов должно быть больше нуля")
+        self.db_file = db_file
+        self.shards = [SqliteReactionStorage(self.shard_file(db_file, i)) for i in range(shards)]
+
+    @staticmethod
+    def shard_file(db_file, index):
+        """Путь к файлу шарда: bot_data.sqlite3 -> bot_data.shard0.sqlite3"""
+        root, ext = os.path.splitext(db_file)
+        return f"{root}.shard{index}{ext}"
+
+    def shard(self, post_key):
+        """Хранилище шарда, в котором лежит пост"""
+        return self.shards[shard_for(post_key, len(self.shards))]
+
+    def load(self, factory=dict):
+        """Загружает реакции из всех шардов"""
+        data = factory()
+        for shard in self.shards:
+            shard.load_into(data)
+        return data
+
+    def record_many(self, records, data=None):
+        """Раскладывает пачку по шардам: одна транзакция на шард"""
+        batches = {}
+        for record in records:
+            batches.setdefault(shard_for(record[1], len(self.shards)), []).append(record)
+        for index, batch in batches.items():
+            self.shards[index].record_many(batch)
+
+    def save(self, data):
+        """Сохраняет все реакции"""
+        self.record_many([
+            (user_key, post_key, reaction)
+            for user_key, posts in data.items()
+            if isinstance(posts, dict)
+            for post_key, reaction in posts.items()
+            if isinstance(reaction, str)
+        ])
+
+    def post_counts(self, post_key):
+        """Счетчики поста - запрос к одному шарду"""
+        return self.shard(post_key).post_counts(post_key)
+
+    def top_posts(self, emoji=None, n=10):
+        """Топ по всем шардам: пост целиком в одном шарде, хватает n лучших каждого"""
+        rows = [row for shard in self.shards for row in shard.top_posts(emoji, n)]
+        return heapq.nlargest(n, rows, key=lambda row: row[1])
+
+    def get_reaction(self, user_key, post_key):
+        """Реакция пользователя - запрос к одному шарду"""
+        return self.shard(post_key).get_reaction(user_key, post_key)
+
+    def close(self):
+        """Закрывает все шарды"""
+        for shard in self.shards:
+            shard.close()
+
+
+def empty_stats():
+    """Пустая структура статистики"""
+    return {
+        "users": {},
+        "commands": defaultdict(int),
+        "daily_stats": {},
+        "total_messages": 0,
+        "start_date": datetime.now().isoformat(),
+        "rollups": StatsRollups(HLL_PRECISION),
+        "cohorts": CohortRetention(),
+        # Агрегаты месяцев, чьи дни перенесены в архив (utils/stats_archive.py)
+        "archived_months": {},
+    }
+
+
+def empty_day(exact_uniques=STATS_EXACT_UNIQUES):
+    """Пустая дневная статистика
+
+    Уникальные пользователи - скетчи HyperLogLog: за день, по командам и
+    по категориям. Точное множество "users" ведется только в отладочном
+    режиме STATS_EXACT_UNIQUES.
+    """
+    day = {
+        "commands": defaultdict(int),
+        "categories": defaultdict(int),
+        "unique_users": HyperLogLog(HLL_PRECISION),
+        "command_users": {},
+        "category_users": {},
+    }
+    if exact_uniques:
+        day["users"] = set()
+    return day
+
+
+def _restore_sketch(value):
+    """Скетч из строки to_json() (или новый пустой)"""
+    if isinstance(value, HyperLogLog):
+        return value
+    if HyperLogLog.is_serialized(value):
+        return HyperLogLog.from_json(value)
+    return HyperLogLog(HLL_PRECISION)
+
+
+def normalize_day(day_stats, exact_uniques=STATS_EXACT_UNIQUES):
+    """Приводит дневную статистику к рабочему виду
+
+    День старого формата хранил список всех user_id: он переводится в
+    скетч и (вне отладочного режима) больше не хранится.
+    """
+    legacy_users = day_stats.pop("users", None)
+    has_sketch = day_stats.get("unique_users") is not None
+    day_stats["commands"] = defaultdict(int, day_stats.get("commands", {}))
+    day_stats["categories"] = defaultdict(int, day_stats.get("categories", {}))
+    day_stats["unique_users"] = _restore_sketch(day_stats.get("unique_users"))
+    for key in ("command_users", "category_users"):
+        day_stats[key] = {name: _restore_sketch(value) for name, value in day_stats.get(key, {}).items()}
+    if legacy_users and not has_sketch:
+        for user_id in legacy_users:
+            day_stats["unique_users"].add(user_id)
+    if exact_uniques:
+        day_stats["users"] = set(legacy_users or ())
+    return day_stats
+
+
+def normalize_stats(stats, exact_uniques=STATS_EXACT_UNIQUES):
+    """Приводит загруженную статистику к рабочему виду
+
+    После json.load счетчики команд становятся обычными dict, и
+    ``stats["commands"][new_command] += 1`` падает с KeyError.
+    """
+    stats.setdefault("users", {})
+    stats.setdefault("daily_stats", {})
+    stats.setdefault("total_messages", 0)
+    stats["commands"] = defaultdict(int, stats.get("commands", {}))
+    # LazyUsers декодирует записи сразу в рабочем виде
+    for user_data in stats["users"].values() if isinstance(stats["users"], dict) else ():
+        user_data["commands_used"] = defaultdict(int, user_data.get("commands_used", {}))
+    for day_stats in stats["daily_stats"].values():
+        normalize_day(day_stats, exact_uniques)
+    for month_stats in stats.setdefault("archived_months", {}).values():
+        month_stats["unique_users"] = _restore_sketch(month_stats.get("unique_users"))
+    rollups = stats.get("rollups")
+    if isinstance(rollups, dict):
+        stats["rollups"] = StatsRollups.from_dict(rollups)
+    elif not isinstance(rollups, StatsRollups):
+        # Статистика до появления агрегатов: строим их из накопленных данных
+        stats["rollups"] = StatsRollups.backfill(stats, HLL_PRECISION)
+    cohorts = stats.get("cohorts")
+    if isinstance(cohorts, dict):
+        stats["cohorts"] = CohortRetention.from_dict(cohorts)
+    elif not isinstance(cohorts, CohortRetention):
+        stats["cohorts"] = CohortRetention.backfill(stats["users"])
+    return stats
+
+
+def _json_default(value):
+    """Сериализация скетчей и точных множеств для json.dumps"""
+    if isinstance(value, HyperLogLog):
+        return value.to_json()
+    if isinstance(value, (StatsRollups, CohortRetention)):
+        return value.to_dict()
+    if isinstance(value, set):
+        return list(value)
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+class StatsStorage:
+    """Интерфейс хранилища статистики бота"""
+
+    def load(self):
+        """Возвращает сохраненную статистику или None, если ее еще нет"""
+        raise NotImplementedError
+
+    def save(self, stats, dirty_users=None, dirty_days=None, dirty_meta=None):
+        """Сохраняет статистику
+
+        dirty_users/dirty_days - изменившиеся пользователи и дни (день из
+        dirty_days, которого нет в stats, перенесен в архив и удаляется),
+        dirty_meta - изменившиеся агрегаты ("rollups", "cohorts",
+        "archived_months"); None означает "все". Хранилища, умеющие
+        точечную запись, используют их.
+        """
+        self.write(self.prepare(stats, dirty_users, dirty_days, dirty_meta))
+
+    def prepare(self, stats, dirty_users=None, dirty_days=None, dirty_meta=None):
+        """Снимает с stats все, что нужно для записи (быстро, без I/O)
+
+        Вызывается под блокировкой статистики; результат не ссылается на
+        изменяемые структуры и передается в write() в другом потоке.
+        """
+        raise NotImplementedError
+
+    def write(self, payload):
+        """Записывает подготовленные данные (медленно, блокирующий I/O)"""
+        raise NotImplementedError
+
+    def size(self):
+        """Занятый горячим хранилищем объем в байтах"""
+        return 0
+
+    def close(self):
+        """Освобождает ресурсы хранилища"""
+
+
+class JsonStatsStorage(StatsStorage):
+    """Статистика в одном JSON-файле"""
+
+    def __init__(self, stats_file="bot_stats.json"):
+        self.stats_file = stats_file
+
+    def load(self):
+        """Потоково читает файл: пользователи и дни разбираются по одному"""
+        if not os.path.exists(self.stats_file):
+            return None
+        stats = {}
+        with open(self.stats_file, 'r', encoding='utf-8') as f:
+            stream = JsonObjectStream(f)
+            for key in stream.iter_keys():
+                if key in ("users", "daily_stats"):
+                    stats[key] = dict(stream.iter_items())
+                else:
+                    stats[key] = stream.decode_value()
+        return stats
+
+    def prepare(self, stats, dirty_users=None, dirty_days=None, dirty_meta=None):
+        return json.dumps(stats, ensure_ascii=False, indent=2, default=_json_default)
+
+    def write(self, payload):
+        atomic_write(self.stats_file, payload)
+
+    def size(self):
+        return os.path.getsize(self.stats_file) if os.path.exists(self.stats_file) else 0
+
+
+class BinaryStatsStorage(StatsStorage):
+    """Статистика в бинарном снапшоте (utils/stats_binary.py)
+
+    При загрузке разбираются заголовок и колонки пользователей, записи
+    пользователей декодируются по требованию (LazyUsers). Запись
+    перекодирует только изменившихся с прошлого сохранения, остальные
+    копируются байтами без декодирования. Но файл каждый раз пишется
+    целиком: копирование колонок, crc32 и разбор нового снапшота (словарь
+    rows) остаются O(пользователей): на 100 тыс. пользователей ~0.2 с
+    против ~1.7 с у JSON, но не пропорционально числу изменений.
+    Если снапшота еще нет, загружается JSON-файл json_file (переход с
+    bot_stats.json): первое сохранение запишет всех пользователей.
+    """
+
+    def __init__(self, stats_file="bot_stats.bin", json_file=None):
+        self.stats_file = stats_file
+        self.json_file = json_file
+        self._lock = threading.Lock()
+        self._source = None
+        self._base_users = None
+        self._pending = {}
+        # Нечисловые ключи пользователей хранятся в заголовке целиком
+        self._extra_keys = set()
+
+    def load(self):
+        if not os.path.exists(self.stats_file):
+            if self.json_file and os.path.exists(self.json_file):
+                return JsonStatsStorage(self.json_file).load()
+            return None
+        snapshot = StatsSnapshot.read(self.stats_file)
+        stats = dict(snapshot.header)
+        extra = stats.pop("extra_users", {})
+        users = LazyUsers(snapshot, extra)
+        stats["users"] = users
+        with self._lock:
+            self._source = snapshot
+            self._base_users = users
+            self._pending = {}
+            self._extra_keys = set(extra)
+        return stats
+
+    def prepare(self, stats, dirty_users=None, dirty_days=None, dirty_meta=None):
+        users = stats.get("users", {})
+        header = {key: value for key, value in stats.items() if key != "users"}
+        incremental = dirty_users is not None and users is self._base_users and self._source is not None
+        if not incremental:
+            self._extra_keys = set()
+        rows = {}
+        for key in dirty_users if incremental else users:
+            if _numeric_id(key) is None:
+                self._extra_keys.add(key)
+                continue
+            user = users.get(key)
+            rows[key] = None if user is None else user_row(user)
+        header["extra_users"] = {key: users[key] for key in self._extra_keys if key in users}
+        header_json = json.dumps(header, ensure_ascii=False, separators=(",", ":"), default=_json_default)
+
+        with self._lock:
+            if incremental:
+                self._pending.update(rows)
+                rows = dict(self._pending)
+                source = self._source
+            else:
+                self._pending = dict(rows)
+                source = None
+            self._base_users = users
+        return {"header": header_json, "source": source, "rows": rows}
+
+    def write(self, payload):
+        data = build_snapshot(payload["header"], payload["source"], payload["rows"])
+        atomic_write(self.stats_file, data)
+        snapshot = StatsSnapshot(data)
+        with self._lock:
+            # Записанные строки уже в новом снапшоте; более свежие остаются в очереди
+            for key, row in payload["rows"].items():
+                if self._pending.get(key) is row:
+                    del self._pending[key]
+            self._source = snapshot
+
+    def size(self):
+        return os.path.getsize(self.stats_file) if os.path.exists(self.stats_file) else 0
+
+
+class SqliteStatsStorage(StatsStorage):
+    """Статистика в SQLite (WAL) с точечной записью изменившихся строк"""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS stats_meta (key TEXT PRIMARY KEY, value TEXT)",
+        """CREATE TABLE IF NOT EXISTS stats_users (
+            user_id TEXT PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            first_seen TEXT,
+            last_seen TEXT,
+            message_count INTEGER NOT NULL DEFAULT 0
+        )""",
+        """CREATE TABLE IF NOT EXISTS stats_user_commands (
+            user_id TEXT NOT NULL,
+            command TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, command)
+        )""",
+        "CREATE TABLE IF NOT EXISTS stats_commands (command TEXT PRIMARY KEY, count INTEGER NOT NULL)",
+        """CREATE TABLE IF NOT EXISTS stats_daily_commands (
+            date TEXT NOT NULL,
+            command TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (date, command)
+        )""",
+        """CREATE TABLE IF NOT EXISTS stats_daily_users (
+            date TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            PRIMARY KEY (date, user_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS stats_daily_categories (
+            date TEXT NOT NULL,
+            category TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (date, category)
+        )""",
+        """CREATE TABLE IF NOT EXISTS stats_daily_uniques (
+            date TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            sketch TEXT NOT NULL,
+            PRIMARY KEY (date, kind, key)
+        )""",
+        """CREATE TABLE IF NOT EXISTS stats_rollup_buckets (
+            granularity TEXT NOT NULL,
+            key TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            PRIMARY KEY (granularity, key)
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_stats_users_last_seen ON stats_users (last_seen)",
+        "CREATE INDEX IF NOT EXISTS idx_stats_daily_users_date ON stats_daily_users (date)",
+        "CREATE INDEX IF NOT EXISTS idx_stats_daily_users_user ON stats_daily_users (user_id)",
+    )
+    UPSERT_META = (
+        "INSERT INTO stats_meta (key, value) VALUES (?, ?) "
+        "ON CONFLICT (key) DO UPDATE SET value = excluded.value"
+    )
+    UPSERT_USER = (
+        "INSERT INTO stats_users (user_id, username, first_name, first_seen, last_seen, message_count) "
+        "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (user_id) DO UPDATE SET "
+        "username = excluded.username, first_name = excluded.first_name, "
+        "first_seen = excluded.first_seen, last_seen = excluded.last_seen, "
+        "message_count = excluded.message_count"
+    )
+    UPSERT_USER_COMMAND = (
+        "INSERT INTO stats_user_commands (user_id, command, count) VALUES (?, ?, ?) "
+        "ON CONFLICT (user_id, command) DO UPDATE SET count = excluded.count"
+    )
+    UPSERT_COMMAND = (
+        "INSERT INTO stats_commands (command, count) VALUES (?, ?) "
+        "ON CONFLICT (command) DO UPDATE SET count = excluded.count"
+    )
+    UPSERT_DAILY_COMMAND = (
+        "INSERT INTO stats_daily_commands (date, command, count) VALUES (?, ?, ?) "
+        "ON CONFLICT (date, command) DO UPDATE SET count = excluded.count"
+    )
+    INSERT_DAILY_USER = "INSERT OR IGNORE INTO stats_daily_users (date, user_id) VALUES (?, ?)"
+    UPSERT_DAILY_CATEGORY = (
+        "INSERT INTO stats_daily_categories (date, category, count) VALUES (?, ?, ?) "
+        "ON CONFLICT (date, category) DO UPDATE SET count = excluded.count"
+    )
+    UPSERT_DAILY_UNIQUES = (
+        "INSERT INTO stats_daily_uniques (date, kind, key, sketch) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (date, kind, key) DO UPDATE SET sketch = excluded.sketch"
+    )
+    UPSERT_ROLLUP_BUCKET = (
+        "INSERT INTO stats_rollup_buckets (granularity, key, bucket) VALUES (?, ?, ?) "
+        "ON CONFLICT (granularity, key) DO UPDATE SET bucket = excluded.bucket"
+    )
+    # Агрегаты, которые хранятся JSON-строкой в stats_meta
+    META_JSON_KEYS = ("rollups", "cohorts", "archived_months")
+    # kind в stats_daily_uniques -> ключ словаря скетчей дня
+    UNIQUE_KINDS = {"command": "command_users", "category": "category_users"}
+
+    def __init__(self, db_file=SQLITE_DB_FILE):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self.conn = connect_sqlite(db_file)
+        with self.conn:
+            for statement in self.SCHEMA:
+                self.conn.execute(statement)
+
+    def load(self):
+        with self._lock:
+            meta = dict(self.conn.execute("SELECT key, value FROM stats_meta"))
+            if not meta:
+                return None
+
+            stats = {
+                "users": {},
+                "commands": dict(self.conn.execute("SELECT command, count FROM stats_commands")),
+                "daily_stats": {},
+                "total_messages": int(meta.get("total_messages", 0)),
+                "start_date": meta.get("start_date"),
+            }
+            for key in self.META_JSON_KEYS:
+                if meta.get(key):
+                    stats[key] = json.loads(meta[key])
+            # Корзины агрегатов - отдельными строками (в старых базах - внутри stats_meta)
+            rollups = stats.get("rollups")
+            if isinstance(rollups, dict):
+                buckets = rollups.setdefault("buckets", {})
+                for granularity, key, bucket in self.conn.execute(
+                    "SELECT granularity, key, bucket FROM stats_rollup_buckets"
+                ):
+                    buckets.setdefault(granularity, {})[key] = json.loads(bucket)
+            for user_key, username, first_name, first_seen, last_seen, message_count in self.conn.execute(
+                "SELECT user_id, username, first_name, first_seen, last_seen, message_count FROM stats_users"
+            ):
+                stats["users"][user_key] = {
+                    "username": username,
+                    "first_name": first_name,
+                    "first_seen": first_seen,
+                    "last_seen": last_seen,
+                    "message_count": message_count,
+                    "commands_used": {},
+                }
+            for user_key, command, count in self.conn.execute(
+                "SELECT user_id, command, count FROM stats_user_commands"
+            ):
+                if user_key in stats["users"]:
+                    stats["users"][user_key]["commands_used"][command] = count
+            daily_stats = stats["daily_stats"]
+            for date, command, count in self.conn.execute(
+                "SELECT date, command, count FROM stats_daily_commands"
+            ):
+                daily_stats.setdefault(date, {}).setdefault("commands", {})[command] = count
+            for date, category, count in self.conn.execute(
+                "SELECT date, category, count FROM stats_daily_categories"
+            ):
+                daily_stats.setdefault(date, {}).setdefault("categories", {})[category] = count
+            for date, kind, key, sketch in self.conn.execute(
+                "SELECT date, kind, key, sketch FROM stats_daily_uniques"
+            ):
+                day = daily_stats.setdefault(date, {})
+                if kind == "all":
+                    day["unique_users"] = sketch
+                elif kind in self.UNIQUE_KINDS:
+                    day.setdefault(self.UNIQUE_KINDS[kind], {})[key] = sketch
+            for date, user_key in self.conn.execute("SELECT date, user_id FROM stats_daily_users"):
+                daily_stats.setdefault(date, {}).setdefault("users", []).append(_restore_user_id(user_key))
+        return stats
+
+    def prepare(self, stats, dirty_users=None, dirty_days=None, dirty_meta=None):
+        users = stats.get("users", {})
+        daily_stats = stats.get("daily_stats", {})
+        user_keys = list(users) if dirty_users is None else [u for u in dirty_users if u in users]
+        days = list(daily_stats) if dirty_days is None else [d for d in dirty_days if d in daily_stats]
+        # Перенесенные в архив дни удаляются в одной транзакции с агрегатом месяца
+        deleted_days = [] if dirty_days is None else [(d,) for d in dirty_days if d not in daily_stats]
+
+        meta = [
+            ("total_messages", str(stats.get("total_messages", 0))),
+            ("start_date", stats.get("start_date")),
+        ]
+        # Агрегаты JSON-строкой - только изменившиеся; корзины агрегатов - отдельными строками
+        meta_keys = self.META_JSON_KEYS if dirty_meta is None else [k for k in self.META_JSON_KEYS if k in dirty_meta]
+        for key in meta_keys:
+            value = stats.get(key)
+            if isinstance(value, StatsRollups):
+                value = value.header()
+            if value is not None:
+                meta.append((key, json.dumps(value, separators=(",", ":"), default=_json_default)))
+
+        payload = self._rollup_rows(stats.get("rollups"), dirty_meta is None)
+        payload.update({
+            "meta": meta,
+            "deleted_days": deleted_days,
+            "commands": list(stats.get("commands", {}).items()),
+            "users": [
+                (user_key, u.get("username"), u.get("first_name"), u.get("first_seen"),
+                 u.get("last_seen"), u.get("message_count", 0))
+                for user_key, u in ((key, users[key]) for key in user_keys)
+            ],
+            "user_commands": [
+                (user_key, command, count)
+                for user_key in user_keys
+                for command, count in users[user_key].get("commands_used", {}).items()
+            ],
+            "daily_commands": [
+                (date, command, count)
+                for date in days
+                for command, count in daily_stats[date].get("commands", {}).items()
+            ],
+            "daily_categories": [
+                (date, category, count)
+                for date in days
+                for category, count in daily_stats[date].get("categories", {}).items()
+            ],
+            "daily_uniques": [
+                row
+                for date in days
+                for row in self._sketch_rows(date, daily_stats[date])
+            ],
+            # Точные множества пишутся только в отладочном режиме
+            "daily_users": [
+                (date, str(user_id))
+                for date in days
+                for user_id in daily_stats[date].get("users", ())
+            ],
+        })
+        return payload
+
+    def _sketch_rows(self, date, day):
+        """Строки stats_daily_uniques для дня"""
+        sketch = day.get("unique_users")
+        if sketch is not None:
+            yield (date, "all", "", _restore_sketch(sketch).to_json())
+        for kind, day_key in self.UNIQUE_KINDS.items():
+            for key, sketch in day.get(day_key, {}).items():
+                yield (date, kind, key, _restore_sketch(sketch).to_json())
+
+    def _rollup_rows(self, rollups, full):
+        """Корзины агрегатов: все (full - с очисткой таблицы) или измененные с прошлой записи"""
+        if not isinstance(rollups, StatsRollups):
+            return {"reset_rollups": False, "removed_buckets": [], "rollup_buckets": []}
+        if full:
+            keys = [(granularity, key) for granularity, buckets in rollups.buckets.items() for key in buckets]
+            removed = []
+        else:
+            keys = [(g, k) for g, k in rollups.dirty if k in rollups.buckets[g]]
+            removed = list(rollups.removed)
+        return {
+            "reset_rollups": full,
+            "removed_buckets": removed,
+            "rollup_buckets": [
+                (granularity, key, json.dumps(
+                    rollups.bucket_to_dict(rollups.buckets[granularity][key]), separators=(",", ":")
+                ))
+                for granularity, key in keys
+            ],
+        }
+
+    def write(self, payload):
+        with self._lock, self.conn:
+            self.conn.executemany(self.UPSERT_META, payload["meta"])
+            if payload["reset_rollups"]:
+                self.conn.execute("DELETE FROM stats_rollup_buckets")
+            self.conn.executemany(
+                "DELETE FROM stats_rollup_buckets WHERE granularity = ? AND key = ?", payload["removed_buckets"]
+            )
+            self.conn.executemany(self.UPSERT_ROLLUP_BUCKET, payload["rollup_buckets"])
+            self.conn.executemany(self.UPSERT_COMMAND, payload["commands"])
+            self.conn.executemany(self.UPSERT_USER, payload["users"])
+            self.conn.executemany(self.UPSERT_USER_COMMAND, payload["user_commands"])
+            self.conn.executemany(self.UPSERT_DAILY_COMMAND, payload["daily_commands"])
+            self.conn.executemany(self.UPSERT_DAILY_CATEGORY, payload["daily_categories"])
+            self.conn.executemany(self.UPSERT_DAILY_UNIQUES, payload["daily_uniques"])
+            self.conn.executemany(self.INSERT_DAILY_USER, payload["daily_users"])
+            for table in self.DAILY_TABLES:
+                self.conn.executemany(f"DELETE FROM {table} WHERE date = ?", payload["deleted_days"])
+
+    DAILY_TABLES = ("stats_daily_commands", "stats_daily_categories", "stats_daily_uniques", "stats_daily_users")
+
+    def size(self):
+        """Объем занятых страниц базы (файл SQLite не сжимается без VACUUM)"""
+        with self._lock:
+            page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+            free_pages = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - free_pages) * page_size
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def _restore_user_id(user_key):
+    """В daily_stats id пользователей хранятся числами, как в JSON-версии"""
+    try:
+        return int(user_key)
+    except ValueError:
+        return user_key
+
+
+def create_reaction_storage(db_file="reactions_data.json", backend=None, **kwargs):
+    """Создает хранилище реакций по настройке STORAGE_BACKEND"""
+    backend = backend or STORAGE_BACKEND
+    if backend == "sqlite":
+        return SqliteReactionStorage(SQLITE_DB_FILE)
+    if backend == "sharded":
+        return ShardedSqliteReactionStorage(SQLITE_DB_FILE, REACTION_SHARDS)
+    if backend == "json":
+        return JsonReactionStorage(db_file, **kwargs)
+    raise ValueError(f"Неизвестный STORAGE_BACKEND: {backend}")
+
+
+def stats_storage_file(stats_file="bot_stats.json", backend=None, db_file=None):
+    """Файл, в котором хранилище статистики держит данные (по STORAGE_BACKEND/STATS_FORMAT)"""
+    backend = backend or STORAGE_BACKEND
+    if backend in ("sqlite", "sharded"):
+        return db_file or SQLITE_DB_FILE
+    if backend == "json":
+        if STATS_FORMAT == "binary":
+            return os.path.splitext(stats_file)[0] + ".bin"
+        return stats_file
+    raise ValueError(f"Неизвестный STORAGE_BACKEND: {backend}")
+
+
+def worker_file(path, worker_id):
+    """Файл воркера worker_id: bot_stats.json -> bot_stats.worker-<id>.json"""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.worker-{worker_id}{ext}"
+
+
+def create_stats_storage(stats_file="bot_stats.json", backend=None, worker_id=None, db_file=None):
+    """Создает хранилище статистики по настройке STORAGE_BACKEND
+
+    С worker_id каждый процесс пишет в свой файл (worker_file), а общий
+    файл только читается при слиянии (utils/worker_stats.py).
+    """
+    backend = backend or STORAGE_BACKEND
+    path = stats_storage_file(stats_file, backend, db_file)
+    if worker_id:
+        path = worker_file(path, worker_id)
+    if backend in ("sqlite", "sharded"):
+        return SqliteStatsStorage(path)
+    if STATS_FORMAT == "binary":
+        # Воркер начинает с пустой статистики: история остается в общем файле
+        return BinaryStatsStorage(path, json_file=None if worker_id else stats_file)
+    return JsonStatsStorage(path)
+
+
+def migrate_json_to_sqlite(reactions_file="reactions_data.json", stats_file="bot_stats.json",
+                           sqlite_file=SQLITE_DB_FILE):
+    """Импортирует reactions_data.json (с журналом) и bot_stats.json в SQLite
+
+    Возвращает словарь с количеством перенесенных и пропущенных записей.
+    Наследованные агрегаты main_bot.py ("reactions"/"reaction_users")
+    не являются реакциями пользователей и пропускаются.
+    """
+    result = {"reactions": 0, "skipped": 0, "users": 0}
+
+    reactions = JsonReactionStorage(reactions_file).load()
+    records = []
+    for user_key, posts in reactions.items():
+        if not isinstance(posts, dict):
+            result["skipped"] += 1
+            continue
+        for post_key, reaction in posts.items():
+            if isinstance(reaction, str):
+                records.append((user_key, post_key, reaction))
+            else:
+                result["skipped"] += 1
+
+    reaction_storage = SqliteReactionStorage(sqlite_file)
+    reaction_storage.record_many(records)
+    reaction_storage.close()
+    result["reactions"] = len(records)
+
+    stats = JsonStatsStorage(stats_file).load()
+    if stats is not None:
+        stats_storage = SqliteStatsStorage(sqlite_file)
+        stats_storage.save(normalize_stats(stats))
+        stats_storage.close()
+        result["users"] = len(stats.get("users", {}))
+
+    return result
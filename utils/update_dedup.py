@@ -0,0 +1,122 @@
+# utils/update_dedup.py - Отбрасывание повторных апдейтов Telegram по update_id
+import logging
+import threading
+from collections import OrderedDict
+
+from utils.storage import connect_sqlite
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteUpdateIds:
+    """Общее для процессов-воркеров множество принятых update_id (SQLite, WAL)
+
+    Повтор Telegram может прийти в другой процесс: add() вставляет id
+    через INSERT OR IGNORE и по числу вставленных строк видит, был ли он
+    уже принят кем-то. Хранятся только последние max_size id: update_id
+    растут, и каждые prune_every вставок старые строки удаляются.
+    """
+
+    def __init__(self, db_file, max_size=100_000, prune_every=1000):
+        self.db_file = db_file
+        self.max_size = max_size
+        self.prune_every = prune_every
+        self._inserts = 0
+        self._lock = threading.Lock()
+        self.conn = connect_sqlite(db_file)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS update_ids (update_id INTEGER PRIMARY KEY)")
+        self.conn.commit()
+
+    def add(self, update_id):
+        """True - id новый, False - уже принят"""
+        with self._lock:
+            inserted = self.conn.execute(
+                "INSERT OR IGNORE INTO update_ids (update_id) VALUES (?)", (update_id,)
+            ).rowcount == 1
+            if inserted:
+                self._inserts += 1
+                if self._inserts % self.prune_every == 0:
+                    self.conn.execute("DELETE FROM update_ids WHERE update_id <= ?", (update_id - self.max_size,))
+            self.conn.commit()
+        return inserted
+
+    def discard(self, update_id):
+        with self._lock:
+            self.conn.execute("DELETE FROM update_ids WHERE update_id = ?", (update_id,))
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class UpdateDeduplicator:
+    """Недавно принятые update_id: повтор отбрасывается до Update.de_json
+
+    Telegram повторяет апдейт, если webhook ответил не сразу, - без
+    проверки повтор обрабатывается заново (двойные реакции, запросы к
+    OpenAI и статистика). Локально - LRU на max_size последних id
+    (OrderedDict под блокировкой): повторы приходят в пределах минут,
+    а update_id растут. shared (SqliteUpdateIds) проверяется после
+    локального LRU, когда воркеров несколько.
+    """
+
+    def __init__(self, max_size=10_000, shared=None):
+        self.max_size = max_size
+        self.shared = shared
+        self.duplicates = 0
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_duplicate(self, update_id):
+        """Запоминает update_id; True, если он уже был принят"""
+        if update_id is None:
+            return False
+        with self._lock:
+            if update_id in self._seen:
+                self._seen.move_to_end(update_id)
+                self.duplicates += 1
+                return True
+            self._seen[update_id] = None
+            if len(self._seen) > self.max_size:
+                self._seen.popitem(last=False)
+        if self.shared is not None:
+            try:
+                new = self.shared.add(update_id)
+            except Exception as e:
+                # Общее хранилище недоступно - хватит локальной проверки
+                logger.error(f"Ошибка проверки update_id в {self.shared.db_file}: {e}")
+                return False
+            if not new:
+                # Апдейт принял другой воркер: локально помним только свои
+                with self._lock:
+                    self._seen.pop(update_id, None)
+                    self.duplicates += 1
+                return True
+        return False
+
+    def forget(self, update_id):
+        """Снимает отметку: апдейт не принят (503), и повтор Telegram нужно обработать"""
+        if update_id is None:
+            return
+        with self._lock:
+            self._seen.pop(update_id, None)
+        if self.shared is not None:
+            try:
+                self.shared.discard(update_id)
+            except Exception as e:
+                logger.error(f"Ошибка удаления update_id из {self.shared.db_file}: {e}")
+
+    def get_metrics(self):
+        return {
+            "tracked": len(self._seen),
+            "max_size": self.max_size,
+            "duplicates": self.duplicates,
+            "shared": self.shared.db_file if self.shared is not None else None,
+        }
+
+
+def create_update_dedup(max_size=10_000, db_file=None):
+    """Дедупликатор апдейтов; db_file - общий файл SQLite для нескольких воркеров"""
+    shared = SqliteUpdateIds(db_file) if db_file else None
+    return UpdateDeduplicator(max_size, shared)
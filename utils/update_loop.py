@@ -0,0 +1,97 @@
+# utils/update_loop.py - Постоянный event loop для обработки апдейтов webhook
+import asyncio
+import logging
+import threading
+
+from utils.update_queue import UpdateQueue, chat_key
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateLoop:
+    """Поток с одним долгоживущим event loop, владеющим Application
+
+    Flask-обработчик webhook работает в своих потоках и передает апдейт
+    через submit() в ограниченную очередь (utils/update_queue.py), которую
+    разбирают queue_workers задач этого loop: ни потока, ни нового loop
+    на апдейт, а HTTP-пул бота всегда используется в том loop, где создан.
+    Апдейты одного чата обрабатываются по порядку, разных чатов - параллельно.
+    Application инициализируется в этом loop при старте и завершается
+    в нем же при stop().
+    """
+
+    def __init__(self, application, name="update-loop", queue_size=1000, queue_workers=32, key=chat_key):
+        self.application = application
+        self.name = name
+        self.loop = None
+        self.queue = UpdateQueue(application.process_update, queue_size, queue_workers, key)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = False
+
+    def start(self, timeout=30):
+        """Запускает поток loop и инициализирует Application (блокирует до готовности)"""
+        with self._lock:
+            if self.loop is not None:
+                return self
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(ready,), name=self.name, daemon=True)
+            self._thread.start()
+            ready.wait(timeout)
+        self.run(self._initialize(), timeout)
+        logger.info("✅ Event loop апдейтов запущен, Application инициализирован")
+        return self
+
+    async def _initialize(self):
+        await self.application.initialize()
+        self.queue.start()
+
+    def _run(self, ready):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.loop = loop
+        ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def run(self, coro, timeout=None):
+        """Выполняет корутину в loop апдейтов из другого потока и ждет результат"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def submit(self, update, on_done=None):
+        """Ставит апдейт в очередь и сразу возвращается
+
+        on_done(error) вызывается в loop после обработки (error - None или
+        исключение) - для метрик. Если очередь полна - UpdateQueueFull.
+        """
+        if self.loop is None or self._stopping:
+            raise RuntimeError("Event loop апдейтов не запущен")
+        self.queue.put(update, on_done)
+
+    @property
+    def in_flight(self):
+        """Апдейты в очереди и в обработке"""
+        return self.queue.in_flight
+
+    @property
+    def processed(self):
+        return self.queue.processed
+
+    def stop(self, timeout=10):
+        """Дожидается очереди апдейтов, завершает Application и останавливает loop"""
+        if self.loop is None or self._stopping:
+            return
+        self._stopping = True
+        try:
+            self.run(self.queue.stop(timeout), timeout + 1)
+            self.run(self.application.shutdown(), timeout)
+        except Exception as e:
+            logger.error(f"Ошибка завершения Application: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+
+    def get_metrics(self):
+        """Метрики очереди апдейтов loop"""
+        return self.queue.get_metrics()
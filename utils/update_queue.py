@@ -0,0 +1,183 @@
+# utils/update_queue.py - Ограниченная очередь приема апдейтов с пулом обработчиков
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+
+from utils.latency import LatencyRecorder
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateQueueFull(Exception):
+    """Очередь апдейтов заполнена - апдейт нужно отклонить (Telegram повторит позже)"""
+
+
+def chat_key(update):
+    """Ключ упорядочивания апдейта: id чата (или пользователя), None - без порядка
+
+    Принимает telegram.Update или его JSON (dict).
+    """
+    if isinstance(update, dict):
+        for name, body in update.items():
+            if name == "update_id" or not isinstance(body, dict):
+                continue
+            chat = body.get("chat") or (body.get("message") or {}).get("chat") or {}
+            if "id" in chat:
+                return chat["id"]
+            user = body.get("from") or body.get("user") or {}
+            return user.get("id")
+        return None
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(update, "effective_user", None)
+    return user.id if user is not None else None
+
+
+class UpdateQueue:
+    """Очередь апдейтов не длиннее maxsize и workers задач-обработчиков
+
+    put() можно вызывать из любого потока: место в очереди занимается
+    под блокировкой, а сам апдейт передается в loop очереди. Если очередь
+    полна, put() сразу поднимает UpdateQueueFull - апдейт не создает ни
+    задачи, ни потока, и память не растет при всплеске. Одновременно
+    обрабатывается не больше workers апдейтов; время ожидания в очереди
+    пишется в гистограмму wait_latency.
+
+    С key (например chat_key) апдейты с одним ключом обрабатываются строго
+    по очереди, а разные ключи - параллельно: пока апдейт чата в работе,
+    следующие апдейты этого чата откладываются в его цепочку и не занимают
+    обработчиков, а освободившийся обработчик разбирает цепочку до конца.
+    """
+
+    def __init__(self, process, maxsize=1000, workers=32, key=None):
+        self.process = process
+        self.key = key
+        self.maxsize = maxsize
+        self.workers = workers
+        self.loop = None
+        self.depth = 0
+        self.active = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.errors = 0
+        self.wait_latency = LatencyRecorder(max_keys=1)
+        self._queue = None
+        self._chains = {}
+        self._tasks = []
+        self._thread_id = None
+        self._stopping = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Создает задачи-обработчики в текущем (работающем) loop"""
+        if self.loop is not None:
+            return self
+        self.loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._queue = asyncio.Queue()
+        self._tasks = [self.loop.create_task(self._worker()) for _ in range(self.workers)]
+        return self
+
+    def put(self, item, on_done=None):
+        """Ставит апдейт в очередь; on_done(error) вызывается в loop после обработки"""
+        with self._lock:
+            if self.loop is None or self._stopping:
+                raise RuntimeError("Очередь апдейтов не запущена")
+            if self.depth >= self.maxsize:
+                self.rejected += 1
+                raise UpdateQueueFull(f"В очереди {self.depth} апдейтов")
+            self.depth += 1
+            self.accepted += 1
+        entry = (item, on_done, time.perf_counter())
+        if threading.get_ident() == self._thread_id:
+            self._queue.put_nowait(entry)
+        else:
+            self.loop.call_soon_threadsafe(self._queue.put_nowait, entry)
+
+    async def _worker(self):
+        while True:
+            entry = await self._queue.get()
+            try:
+                key = self.key(entry[0]) if self.key is not None else None
+            except Exception as e:
+                # Без ключа апдейт обрабатывается вне порядка, но не теряется
+                # и освобождает место в очереди
+                logger.error(f"❌ Ошибка ключа упорядочивания update: {e}")
+                key = None
+            if key is None:
+                await self._handle(entry)
+                continue
+            chain = self._chains.get(key)
+            if chain is not None:
+                # Чат уже обрабатывается - апдейт подождет своей очереди
+                chain.append(entry)
+                continue
+            chain = self._chains[key] = deque([entry])
+            try:
+                while chain:
+                    await self._handle(chain.popleft())
+            finally:
+                del self._chains[key]
+
+    async def _handle(self, entry):
+        item, on_done, enqueued = entry
+        with self._lock:
+            self.depth -= 1
+            self.active += 1
+        self.wait_latency.record("updates", time.perf_counter() - enqueued)
+        error = None
+        try:
+            await self.process(item)
+        except Exception as e:
+            error = e
+            self.errors += 1
+            logger.error(f"❌ Ошибка обработки update: {e}")
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.processed += 1
+            if on_done is not None:
+                # Ошибка колбэка не должна снимать обработчика с цепочки чата
+                try:
+                    on_done(error)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка on_done update: {e}")
+
+    @property
+    def in_flight(self):
+        """Апдейты в очереди и в обработке"""
+        return self.depth + self.active
+
+    async def stop(self, timeout=10):
+        """Перестает принимать апдейты, дожидается очереди и снимает обработчиков"""
+        if self.loop is None:
+            return
+        self._stopping = True
+        deadline = time.monotonic() + timeout
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        if self.in_flight:
+            logger.warning(f"⚠️ Остановка с {self.in_flight} необработанными апдейтами")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get_metrics(self):
+        """Метрики очереди апдейтов"""
+        histogram = self.wait_latency.get("updates")
+        return {
+            "depth": self.depth,
+            "chats_active": len(self._chains),
+            "maxsize": self.maxsize,
+            "workers": self.workers,
+            "active": self.active,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "errors": self.errors,
+            "wait_p99_ms": round(histogram.percentile(99), 2) if histogram else 0.0,
+        }
@@ -0,0 +1,186 @@
+# utils/webhook_server.py - Асинхронный webhook-сервер (tornado) в одном loop с Application
+import asyncio
+import json
+import logging
+import signal
+
+from telegram import Update
+
+from utils.metrics import update_type, updates_duplicate, updates_processed, updates_received
+from utils.update_queue import UpdateQueue, UpdateQueueFull, chat_key
+
+try:
+    import tornado.httpserver
+    import tornado.web
+except ImportError:  # устанавливается с python-telegram-bot[webhooks]
+    tornado = None
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookServer:
+    """HTTP-сервер webhook, /health и /metrics в event loop Application
+
+    Апдейт ставится в ограниченную очередь (utils/update_queue.py), которую
+    разбирают задачи того же loop: ни потоков, ни передачи между loop,
+    апдейты одного чата - по порядку, разных чатов - параллельно.
+    Ответ Telegram уходит сразу после постановки в очередь, при полной
+    очереди - 503, и Telegram повторит апдейт позже. Повторы уже принятых
+    update_id отбрасываются dedup (UpdateDeduplicator) до разбора апдейта.
+    health() и metrics() - функции, возвращающие dict и текст Prometheus.
+    """
+
+    def __init__(self, application, token, health, metrics, metrics_content_type="text/plain",
+                 queue_size=1000, queue_workers=32, dedup=None):
+        if tornado is None:
+            raise RuntimeError("Для WEBHOOK_SERVER=async нужен tornado (python-telegram-bot[webhooks])")
+        self.application = application
+        self.token = token
+        self.health = health
+        self.metrics = metrics
+        self.metrics_content_type = metrics_content_type
+        self.dedup = dedup
+        self.queue = UpdateQueue(self._process, queue_size, queue_workers, chat_key)
+        self._http = None
+
+    def make_app(self):
+        """tornado.web.Application с маршрутами бота"""
+        return tornado.web.Application([
+            (r"/webhook/([^/]+)", _WebhookHandler, {"server": self}),
+            (r"/health", _HealthHandler, {"server": self}),
+            (r"/metrics", _MetricsHandler, {"server": self}),
+            (r"/", _RootHandler),
+        ])
+
+    def submit(self, update_data):
+        """Ставит апдейт в очередь; UpdateQueueFull, если она заполнена
+
+        Возвращает False для повтора уже принятого update_id.
+        """
+        kind = update_type(update_data)
+        updates_received.inc(kind)
+        update_id = update_data.get("update_id")
+        if self.dedup is not None and self.dedup.is_duplicate(update_id):
+            updates_duplicate.inc(kind)
+            return False
+        try:
+            self.queue.put(update_data)
+        except Exception:
+            # Апдейт не принят (503/500) - повтор Telegram нужно обработать
+            if self.dedup is not None:
+                self.dedup.forget(update_id)
+            raise
+        return True
+
+    async def _process(self, update_data):
+        kind = update_type(update_data)
+        try:
+            await self.application.process_update(Update.de_json(update_data, self.application.bot))
+        except Exception:
+            updates_processed.inc(kind, "error")
+            raise
+        updates_processed.inc(kind, "ok")
+
+    @property
+    def in_flight(self):
+        return self.queue.in_flight
+
+    def listen(self, port, address="0.0.0.0", sockets=None):
+        """Запускает обработчиков очереди и начинает принимать соединения
+
+        Вызывается в работающем loop; sockets - уже открытые сокеты (для тестов).
+        """
+        self.queue.start()
+        self._http = tornado.httpserver.HTTPServer(self.make_app())
+        if sockets is not None:
+            self._http.add_sockets(sockets)
+        else:
+            self._http.listen(port, address)
+        return self._http
+
+    async def stop(self, timeout=10):
+        """Перестает принимать запросы и дожидается апдейтов в обработке"""
+        if self._http is not None:
+            self._http.stop()
+        await self.queue.stop(timeout)
+        if self._http is not None:
+            await self._http.close_all_connections()
+
+    def get_metrics(self):
+        return self.queue.get_metrics()
+
+
+async def serve_webhook(server, port, setup=None, stop_event=None):
+    """Один процесс, один loop: Application, webhook и HTTP-сервер
+
+    Инициализирует Application, выполняет setup() (set_webhook и команды),
+    слушает port до SIGTERM/SIGINT (или stop_event), затем дожидается
+    апдейтов в обработке и завершает Application.
+    """
+    application = server.application
+    stop_event = stop_event or asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError, ValueError):  # Windows или не главный поток
+            pass
+
+    await application.initialize()
+    try:
+        if setup is not None:
+            await setup()
+        server.listen(port)
+        logger.info(f"🚀 Асинхронный webhook-сервер слушает порт {port}")
+        await stop_event.wait()
+        logger.info("🛑 Получен сигнал остановки")
+        await server.stop()
+    finally:
+        await application.shutdown()
+
+
+if tornado is not None:
+    class _BaseHandler(tornado.web.RequestHandler):
+        def initialize(self, server=None):
+            self.server = server
+
+    class _WebhookHandler(_BaseHandler):
+        def post(self, token):
+            if token != self.server.token:
+                logger.warning(f"❌ Неверный токен в webhook: {token[:10]}...")
+                self.set_status(404)
+                return
+            try:
+                update_data = json.loads(self.request.body)
+            except ValueError:
+                update_data = None
+            if not isinstance(update_data, dict) or not update_data:
+                logger.warning("❌ Пустые данные в webhook")
+                self.set_status(400)
+                return
+            try:
+                self.server.submit(update_data)
+            except UpdateQueueFull:
+                logger.warning("⚠️ Очередь апдейтов заполнена, отвечаем 503")
+                self.set_status(503)
+                self.set_header("Retry-After", "1")
+            except Exception as e:
+                logger.error(f"❌ Критическая ошибка webhook: {e}")
+                self.set_status(500)
+
+    class _HealthHandler(_BaseHandler):
+        def get(self):
+            self.write(self.server.health())
+
+    class _MetricsHandler(_BaseHandler):
+        def get(self):
+            self.set_header("Content-Type", self.server.metrics_content_type)
+            self.write(self.server.metrics())
+
+    class _RootHandler(tornado.web.RequestHandler):
+        def get(self):
+            self.write({
+                'message': 'Telegram Bot is running',
+                'status': 'online',
+                'endpoints': ['/health', '/metrics', '/webhook'],
+            })
@@ -0,0 +1,180 @@
+# utils/worker_stats.py - Статистика нескольких процессов-воркеров: свои файлы, слияние при чтении
+import logging
+import os
+import re
+from collections import defaultdict
+
+from config import STATS_EXACT_UNIQUES
+from utils.hyperloglog import HyperLogLog
+from utils.storage import (
+    StatsStorage, create_stats_storage, empty_day, empty_stats, normalize_stats, stats_storage_file
+)
+
+logger = logging.getLogger(__name__)
+
+
+def worker_ids(stats_file="bot_stats.json", backend=None, db_file=None):
+    """id воркеров, у которых есть файл статистики, по возрастанию"""
+    stem, ext = os.path.splitext(stats_storage_file(stats_file, backend, db_file))
+    directory = os.path.dirname(stem) or "."
+    pattern = re.compile(re.escape(os.path.basename(stem)) + r"\.worker-([\w-]+)" + re.escape(ext) + "$")
+    if not os.path.isdir(directory):
+        return []
+    return sorted(match.group(1) for match in map(pattern.match, os.listdir(directory)) if match)
+
+
+def worker_storages(stats_file="bot_stats.json", backend=None, db_file=None, exclude=None):
+    """Хранилища для слияния: общий файл (история до воркеров) и файлы всех воркеров
+
+    exclude - id воркера, чьи данные берутся из памяти, а не с диска.
+    """
+    storages = []
+    if os.path.exists(stats_storage_file(stats_file, backend, db_file)):
+        storages.append(create_stats_storage(stats_file, backend, db_file=db_file))
+    for worker_id in worker_ids(stats_file, backend, db_file):
+        if worker_id != exclude:
+            storages.append(create_stats_storage(stats_file, backend, worker_id, db_file))
+    return storages
+
+
+def _copy_sketch(sketch):
+    return HyperLogLog(sketch.p).merge(sketch)
+
+
+def _merge_sketch(sketches, key, sketch):
+    current = sketches.get(key)
+    if current is None:
+        sketches[key] = _copy_sketch(sketch)
+    elif current.p == sketch.p:
+        current.merge(sketch)
+
+
+def merge_user(users, user_key, user):
+    """Добавляет запись пользователя из другого процесса
+
+    Сообщения и команды складываются, first_seen - самая ранняя дата,
+    last_seen и имя - из самой свежей записи.
+    """
+    current = users.get(user_key)
+    if current is None:
+        users[user_key] = dict(user, commands_used=defaultdict(int, user.get("commands_used", {})))
+        return
+    if user.get("first_seen") and (not current.get("first_seen") or user["first_seen"] < current["first_seen"]):
+        current["first_seen"] = user["first_seen"]
+    if user.get("last_seen") and (not current.get("last_seen") or user["last_seen"] > current["last_seen"]):
+        current["last_seen"] = user["last_seen"]
+        current["username"] = user.get("username") or current.get("username")
+        current["first_name"] = user.get("first_name") or current.get("first_name")
+    current["message_count"] = current.get("message_count", 0) + user.get("message_count", 0)
+    for command, count in user.get("commands_used", {}).items():
+        current["commands_used"][command] += count
+
+
+def merge_day(days, date, day_stats, exact_uniques=STATS_EXACT_UNIQUES):
+    """Добавляет дневную статистику другого процесса: счетчики складываются, скетчи объединяются"""
+    current = days.get(date)
+    if current is None:
+        current = days[date] = empty_day(exact_uniques)
+    for key in ("commands", "categories"):
+        for name, count in day_stats.get(key, {}).items():
+            current[key][name] += count
+    sketch = day_stats.get("unique_users")
+    if isinstance(sketch, HyperLogLog) and sketch.p == current["unique_users"].p:
+        current["unique_users"].merge(sketch)
+    for kind in ("command_users", "category_users"):
+        for name, sketch in day_stats.get(kind, {}).items():
+            _merge_sketch(current[kind], name, sketch)
+    if exact_uniques:
+        current["users"] |= day_stats.get("users", set())
+
+
+def merge_month(months, month, summary):
+    """Добавляет агрегат архивного месяца другого процесса
+
+    Дни месяца у процессов одни и те же, поэтому число дней - максимум.
+    """
+    current = months.get(month)
+    if current is None:
+        current = months[month] = {
+            "days": 0, "commands": defaultdict(int), "categories": defaultdict(int),
+            "unique_users": HyperLogLog(summary["unique_users"].p),
+        }
+    current["days"] = max(current["days"], summary.get("days", 0))
+    for key in ("commands", "categories"):
+        for name, count in summary.get(key, {}).items():
+            current[key][name] += count
+    if summary["unique_users"].p == current["unique_users"].p:
+        current["unique_users"].merge(summary["unique_users"])
+
+
+def merge_into(merged, stats, exact_uniques=STATS_EXACT_UNIQUES):
+    """Прибавляет статистику одного процесса к merged (stats не изменяется)"""
+    for user_key, user in stats["users"].items():
+        merge_user(merged["users"], user_key, user)
+    for command, count in stats["commands"].items():
+        merged["commands"][command] += count
+    merged["total_messages"] += stats.get("total_messages", 0)
+    for date, day_stats in stats["daily_stats"].items():
+        merge_day(merged["daily_stats"], date, day_stats, exact_uniques)
+    for month, summary in stats.get("archived_months", {}).items():
+        merge_month(merged["archived_months"], month, summary)
+    if stats["rollups"].p == merged["rollups"].p:
+        merged["rollups"].merge(stats["rollups"])
+    merged["cohorts"].merge(stats["cohorts"])
+    if stats.get("start_date") and stats["start_date"] < merged.get("_start", "9999"):
+        merged["_start"] = stats["start_date"]
+    return merged
+
+
+def finish_merge(merged):
+    """Завершает слияние: новые пользователи пересчитываются по объединенным first_seen"""
+    merged["rollups"].recount_new(merged["users"])
+    start = merged.pop("_start", None)
+    if start:
+        merged["start_date"] = start
+    return merged
+
+
+def merge_stats(parts, exact_uniques=STATS_EXACT_UNIQUES):
+    """Объединяет статистику процессов (нормализованные словари) в новую"""
+    merged = empty_stats()
+    for stats in parts:
+        merge_into(merged, stats, exact_uniques)
+    return finish_merge(merged)
+
+
+class MergedStatsStorage(StatsStorage):
+    """Хранилище только для чтения: объединение статистики всех воркеров
+
+    storages - файлы воркеров (и общий файл), local - BotStats текущего
+    процесса: его данные берутся из памяти под его блокировкой, чтобы в
+    отчет попали еще не сброшенные на диск события. Данные других
+    воркеров отстают не больше чем на их интервал групповой записи.
+    """
+
+    def __init__(self, storages, local=None, exact_uniques=STATS_EXACT_UNIQUES):
+        self.storages = storages
+        self.local = local
+        self.exact_uniques = exact_uniques
+
+    def load(self):
+        merged = empty_stats()
+        for storage in self.storages:
+            try:
+                stats = storage.load()
+            except Exception as e:
+                logger.error(f"Ошибка чтения статистики воркера: {e}")
+                continue
+            if stats is not None:
+                merge_into(merged, normalize_stats(stats, self.exact_uniques), self.exact_uniques)
+        if self.local is not None:
+            with self.local._lock:
+                merge_into(merged, self.local.stats, self.exact_uniques)
+        return finish_merge(merged)
+
+    def prepare(self, stats, dirty_users=None, dirty_days=None, dirty_meta=None):
+        raise NotImplementedError("Объединенная статистика воркеров только для чтения")
+
+    def close(self):
+        for storage in self.storages:
+            storage.close()
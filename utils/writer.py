@@ -0,0 +1,214 @@
+# utils/writer.py - Фоновая запись на диск вне event loop
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWriter:
+    """Выделенный поток для блокирующих операций записи
+
+    Обработчики кладут задачу в очередь и сразу возвращаются; поток
+    выполняет задачи по порядку. Ведутся метрики: глубина очереди,
+    время ожидания в очереди и длительность записи (flush latency).
+    """
+
+    def __init__(self, name="storage-writer"):
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.jobs_done = 0
+        self.errors = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+        self.last_queue_wait = 0.0
+
+    def _ensure_started(self):
+        """Запускает поток при первой задаче"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        """Ставит задачу в очередь, возвращает concurrent.futures.Future"""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((func, args, kwargs, future, time.perf_counter()))
+        return future
+
+    async def run(self, func, *args, **kwargs):
+        """Выполняет задачу в потоке записи и дожидается результата"""
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    def flush(self, timeout=None):
+        """Блокирующе ждет, пока выполнятся все поставленные задачи"""
+        self.submit(lambda: None).result(timeout)
+
+    async def flush_async(self):
+        """Асинхронно ждет опустошения очереди"""
+        await self.run(lambda: None)
+
+    @property
+    def queue_depth(self):
+        """Количество задач, ожидающих записи"""
+        return self._queue.qsize()
+
+    def get_metrics(self):
+        """Метрики очереди записи"""
+        avg = self.total_flush_latency / self.jobs_done if self.jobs_done else 0.0
+        return {
+            "queue_depth": self.queue_depth,
+            "jobs_done": self.jobs_done,
+            "errors": self.errors,
+            "last_flush_ms": round(self.last_flush_latency * 1000, 3),
+            "avg_flush_ms": round(avg * 1000, 3),
+            "max_flush_ms": round(self.max_flush_latency * 1000, 3),
+            "last_queue_wait_ms": round(self.last_queue_wait * 1000, 3),
+        }
+
+    def _run(self):
+        """Цикл потока записи"""
+        while True:
+            func, args, kwargs, future, enqueued_at = self._queue.get()
+            started = time.perf_counter()
+            self.last_queue_wait = started - enqueued_at
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Ошибка фоновой записи: {e}")
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            finally:
+                latency = time.perf_counter() - started
+                self.jobs_done += 1
+                self.last_flush_latency = latency
+                self.total_flush_latency += latency
+                self.max_flush_latency = max(self.max_flush_latency, latency)
+                self._queue.task_done()
+
+
+class GroupCommitter:
+    """Групповая запись изменений с настраиваемым окном долговечности
+
+    Изменения только помечают хранилище "грязным" (mark_dirty). Сброс
+    ставится в очередь BackgroundWriter не позже чем через interval_ms
+    после первого несохраненного изменения или сразу по накоплении
+    max_mutations изменений - что наступит раньше. close() выполняет
+    финальный сброс.
+    """
+
+    def __init__(self, flush_func, writer, interval_ms=1000, max_mutations=200, name="group-commit"):
+        self.flush_func = flush_func
+        self.writer = writer
+        self.interval = interval_ms / 1000
+        self.max_mutations = max_mutations
+        self.name = name
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._first_dirty_at = None
+        self._flush_queued = False
+        self._closed = False
+        self._thread = None
+        self.mutations = 0
+        self.flushes = 0
+        # Суммарная длительность сбросов в потоке записи, секунды
+        self.flush_seconds = 0.0
+
+    def mark_dirty(self, count=1):
+        """Отмечает count изменений, не делая ввода-вывода"""
+        with self._cond:
+            if self._closed:
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            if self._pending == 0:
+                self._first_dirty_at = time.monotonic()
+            self._pending += count
+            self.mutations += count
+            if self._pending >= self.max_mutations:
+                self._cond.notify()
+
+    @property
+    def pending(self):
+        """Изменения, еще не отправленные на запись"""
+        return self._pending
+
+    def _run(self):
+        """Поток-таймер: решает, когда отправить сброс в очередь записи"""
+        while True:
+            with self._cond:
+                while self._pending == 0 and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                deadline = self._first_dirty_at + self.interval
+                while self._pending < self.max_mutations and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return
+                self._queue_flush()
+
+    def _queue_flush(self):
+        """Ставит один сброс в очередь (вызывается под self._cond)"""
+        self._pending = 0
+        self._first_dirty_at = None
+        if not self._flush_queued:
+            self._flush_queued = True
+            self.writer.submit(self._flush)
+
+    def _flush(self):
+        """Выполняется в потоке записи"""
+        with self._cond:
+            self._flush_queued = False
+        started = time.perf_counter()
+        try:
+            self.flush_func()
+        finally:
+            self.flush_seconds += time.perf_counter() - started
+            self.flushes += 1
+
+    def request_flush(self):
+        """Ставит сброс накопленных изменений в очередь, не дожидаясь его"""
+        with self._cond:
+            if self._pending:
+                self._queue_flush()
+
+    def flush(self, timeout=None):
+        """Немедленно сбрасывает накопленные изменения и ждет записи"""
+        self.request_flush()
+        self.writer.flush(timeout)
+
+    def close(self, timeout=None):
+        """Останавливает таймер и выполняет финальный сброс"""
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def get_metrics(self):
+        """Метрики групповой записи"""
+        return {
+            "pending": self._pending,
+            "mutations": self.mutations,
+            "flushes": self.flushes,
+            "flush_seconds": self.flush_seconds,
+        }
+
+
+# Общий поток записи для реакций и статистики
+storage_writer = BackgroundWriter()